@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+
+        from .authentication import invalidate_user_on_change
+        from .feed import publish_recorded
+        from .models import conversions_recorded
+
+        conversions_recorded.connect(publish_recorded, dispatch_uid='api_publish_recorded_conversions')
+        user_model = get_user_model()
+        post_save.connect(invalidate_user_on_change, sender=user_model, dispatch_uid='api_invalidate_user_on_save')
+        post_delete.connect(invalidate_user_on_change, sender=user_model, dispatch_uid='api_invalidate_user_on_delete')
@@ -0,0 +1,175 @@
+"""
+Vectorized meters→feet conversion of binary float64 arrays.
+
+Request bodies are read straight into a NumPy array and converted with one
+array operation, and the result is sent back as a raw buffer, so no Python
+object is created per element. Needs the optional numpy package.
+"""
+import io
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from . import units
+from .models import Conversion
+
+RAW_FLOAT64 = 'application/octet-stream'
+NPY = 'application/x-npy'
+
+MICROS = 10 ** 6
+
+# The meters→feet factor as an integer over a power of ten (3.28084 = 328084 / 10**5),
+# so rounding can be done exactly in int64 arithmetic
+_factor = units.factor(Conversion.DEFAULT_FROM_UNIT, Conversion.DEFAULT_TO_UNIT)
+FACTOR_SCALE = 10 ** -_factor.as_tuple().exponent
+FACTOR_NUMERATOR = int(_factor * FACTOR_SCALE)
+del _factor
+
+FLOAT_FACTOR = units.float_factor(Conversion.DEFAULT_FROM_UNIT, Conversion.DEFAULT_TO_UNIT)
+
+# Largest meters value whose exact product still fits in int64
+EXACT_ROUNDING_LIMIT = (2 ** 63 - 1) // (FACTOR_NUMERATOR * MICROS)
+
+
+def numpy():
+    """Import numpy, raising ImportError with an install hint if it is missing."""
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("Binary array conversion needs numpy: pip install numpy") from e
+    return numpy
+
+
+def read_body(stream, parser_context):
+    """Read the request body, enforcing CONVERSION_ARRAY_MAX_ELEMENTS."""
+    request = parser_context['request']
+    max_bytes = settings.CONVERSION_ARRAY_MAX_ELEMENTS * 8
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > max_bytes:
+        raise ParseError(
+            f"Array is larger than {settings.CONVERSION_ARRAY_MAX_ELEMENTS} float64 elements."
+        )
+    # Bypasses DATA_UPLOAD_MAX_MEMORY_SIZE, which is sized for form posts
+    body = stream.read(max_bytes + 1) if stream is not None else b''
+    if len(body) > max_bytes:
+        raise ParseError(
+            f"Array is larger than {settings.CONVERSION_ARRAY_MAX_ELEMENTS} float64 elements."
+        )
+    return body
+
+
+class Float64ArrayParser(BaseParser):
+    """Parses a raw little-endian float64 array into a 1-D NumPy array."""
+    media_type = RAW_FLOAT64
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        np = numpy()
+        body = read_body(stream, parser_context)
+        if len(body) % 8:
+            raise ParseError("Body length must be a multiple of 8 bytes (little-endian float64).")
+        return np.frombuffer(body, dtype='<f8')
+
+
+class NpyArrayParser(BaseParser):
+    """
+    Parses a .npy file holding a 1-D float64 array.
+
+    The header is checked before any data is loaded: the declared shape, not
+    the body size, decides how much memory np.load would allocate.
+    """
+    media_type = NPY
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        np = numpy()
+        body = read_body(stream, parser_context)
+        buffer = io.BytesIO(body)
+        try:
+            version = np.lib.format.read_magic(buffer)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buffer)
+            elif version == (2, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buffer)
+            else:
+                raise ValueError(f"unsupported format version {version[0]}.{version[1]}")
+        except ValueError as e:
+            raise ParseError(f"Invalid .npy data: {e}")
+        if dtype.kind != 'f' or dtype.itemsize != 8 or len(shape) != 1:
+            raise ParseError("Expected a 1-D float64 array.")
+        if shape[0] > settings.CONVERSION_ARRAY_MAX_ELEMENTS:
+            raise ParseError(
+                f"Array is larger than {settings.CONVERSION_ARRAY_MAX_ELEMENTS} float64 elements."
+            )
+        data = body[buffer.tell():]
+        if len(data) != shape[0] * dtype.itemsize:
+            raise ParseError("Invalid .npy data: body length does not match the header shape.")
+        return np.frombuffer(data, dtype=dtype).astype('<f8', copy=False)
+
+
+def validate(meters):
+    """
+    Return an error message if the array can't be converted, else None.
+    Like the JSON endpoint, values must be finite and not negative.
+    """
+    np = numpy()
+    # DRF skips the parser for an empty body and hands back an empty dict
+    if not isinstance(meters, np.ndarray) or not meters.size:
+        return "Array must not be empty."
+    if not np.isfinite(meters).all():
+        return "Array values must be finite."
+    if (meters < 0).any():
+        return "Array values must be greater than or equal to 0."
+    return None
+
+
+def convert(meters, round_result=True):
+    """
+    Convert a float64 array of meters to feet in one vectorized operation.
+
+    With round_result, inputs are taken at 6 decimal places and results are
+    rounded half-to-even to 6 decimal places, exactly as
+    meters_to_feet(Decimal) does. Values of EXACT_ROUNDING_LIMIT meters or
+    more are rounded in floating point instead.
+    """
+    np = numpy()
+    if not round_result:
+        return meters * FLOAT_FACTOR
+
+    feet = convert_to_micros(meters) / MICROS
+    large = meters >= EXACT_ROUNDING_LIMIT
+    if large.any():
+        feet[large] = np.round(meters[large] * FLOAT_FACTOR, 6)
+    return feet
+
+
+def to_micros(meters):
+    """Meters as integer micrometers (the value at 6 decimal places)."""
+    np = numpy()
+    return np.rint(np.minimum(meters, EXACT_ROUNDING_LIMIT) * MICROS).astype(np.int64)
+
+
+def convert_to_micros(meters):
+    """
+    Exact meters→feet in integer millionths of a foot, rounded half-to-even.
+    Inputs at or above EXACT_ROUNDING_LIMIT are clamped to it.
+    """
+    np = numpy()
+    product = to_micros(meters) * FACTOR_NUMERATOR
+    quotient, remainder = np.divmod(product, FACTOR_SCALE)
+    half = FACTOR_SCALE // 2
+    round_up = (remainder > half) | ((remainder == half) & (quotient % 2 == 1))
+    return quotient + round_up
+
+
+def serialize(array, media_type):
+    """Encode a result array in the request's format."""
+    np = numpy()
+    array = array.astype('<f8', copy=False)
+    if media_type == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        return buffer.getvalue()
+    return array.tobytes()
@@ -0,0 +1,287 @@
+"""
+Async implementations of the login and conversion endpoints.
+
+These mirror google_oauth_login, google_oauth_callback and
+convert_meters_to_feet in views.py, but never block the worker while waiting
+on Google: outbound calls use the pooled httpx client and database access
+goes through Django's async ORM. Served in place of the sync views when
+API_ASYNC_VIEWS is enabled (see oauthtestapp/gunicorn_asgi.py).
+
+conversion_feed has no sync counterpart and is always routed; it needs the
+ASGI application.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.tokens import RefreshToken
+from allauth.socialaccount.models import SocialAccount
+
+from .authentication import AsyncJWTAuthentication
+from .google import (
+    exchange_google_code_async,
+    get_google_user_info_async,
+    verify_google_id_token,
+)
+from .feed import hub
+from .models import Conversion
+from .pagination import InvalidSyncToken, decode_sync_token
+from .serializers import ConversionInputSerializer, ConversionResponseSerializer, UserProfileSerializer
+from .write_behind import asave_conversions
+from .views import CONVERSION_FORMULA, get_client_ip, get_or_create_user_from_google, meters_to_feet
+
+jwt_authentication = AsyncJWTAuthentication()
+
+
+async def aget_or_create_user_from_google(google_user_info):
+    """
+    Async front for get_or_create_user_from_google.
+    Returning users whose profile needs no update are resolved with one async
+    query; everything else (creation, linking, updates) runs the transactional
+    sync resolver in a worker thread.
+    """
+    google_id = google_user_info.get('id')
+    if google_id and google_user_info.get('email'):
+        social_account = await (
+            SocialAccount.objects
+            .select_related('user')
+            .filter(provider='google', uid=google_id)
+            .afirst()
+        )
+        if social_account:
+            user = social_account.user
+            needs_update = (
+                (not user.first_name and google_user_info.get('given_name'))
+                or (not user.last_name and google_user_info.get('family_name'))
+            )
+            if not needs_update:
+                return user
+    return await sync_to_async(get_or_create_user_from_google)(google_user_info)
+
+
+async def aauthenticate(request, feed_token=None):
+    """
+    Authenticate an async request with the JWT access token, or with
+    feed_token (a FeedToken) when there is no Authorization header.
+    Returns (user, None) or (None, JsonResponse with the DRF-style 401).
+    """
+    try:
+        if feed_token and jwt_authentication.get_header(request) is None:
+            result = await jwt_authentication.aauthenticate_feed_token(feed_token)
+        else:
+            result = await jwt_authentication.aauthenticate(request)
+    except APIException as e:
+        detail = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+        response = JsonResponse(detail, status=status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = jwt_authentication.authenticate_header(request)
+        return None, response
+
+    if result is None:
+        response = JsonResponse({
+            "detail": "Authentication credentials were not provided."
+        }, status=status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = jwt_authentication.authenticate_header(request)
+        return None, response
+    return result[0], None
+
+
+@csrf_exempt
+@require_POST
+async def google_oauth_login(request):
+    """
+    Async version of views.google_oauth_login.
+    Expects: { "access_token": "..." } or { "id_token": "..." }
+    """
+    try:
+        data = json.loads(request.body)
+        google_access_token = data.get('access_token')
+        google_id_token = data.get('id_token')
+
+        if not google_access_token and not google_id_token:
+            return JsonResponse({
+                "error": "Google access token or ID token is required",
+                "help": "Your frontend should get this token from Google OAuth and send it here"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Verify Google token and get user info
+        if google_id_token:
+            # Local verification; only touches the network on a JWKS refresh
+            google_user_info = await sync_to_async(verify_google_id_token, thread_sensitive=False)(google_id_token)
+            if not google_user_info:
+                return JsonResponse({
+                    "error": "Invalid Google ID token"
+                }, status=status.HTTP_401_UNAUTHORIZED)
+        else:
+            google_user_info = await get_google_user_info_async(google_access_token)
+            if not google_user_info:
+                return JsonResponse({
+                    "error": "Invalid Google access token"
+                }, status=status.HTTP_401_UNAUTHORIZED)
+
+        # Get or create user
+        user = await aget_or_create_user_from_google(google_user_info)
+        if not user:
+            return JsonResponse({
+                "error": "Failed to create or retrieve user"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Generate JWT tokens (records an OutstandingToken row)
+        refresh = await sync_to_async(RefreshToken.for_user)(user)
+
+        return JsonResponse({
+            "access_token": str(refresh.access_token),
+            "refresh_token": str(refresh),
+            "user": UserProfileSerializer(user).data,
+            "message": "Login successful"
+        }, status=status.HTTP_200_OK)
+
+    except json.JSONDecodeError:
+        return JsonResponse({
+            "error": "Invalid JSON format"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception:
+        return JsonResponse({
+            "error": "An error occurred during authentication"
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_GET
+async def google_oauth_callback(request):
+    """
+    Async version of views.google_oauth_callback.
+    """
+    frontend_url = settings.FRONTEND_URL
+    code = request.GET.get('code')
+
+    if not code:
+        error = request.GET.get('error', 'Unknown error')
+        return redirect(f'{frontend_url}/auth/callback?error={error}')
+
+    try:
+        # Exchange code for access token
+        token_json = await exchange_google_code_async(code)
+        if not token_json or 'access_token' not in token_json:
+            return redirect(f'{frontend_url}/auth/callback?error=token_exchange_failed')
+
+        # Get user info
+        google_user_info = await get_google_user_info_async(token_json['access_token'])
+        if not google_user_info:
+            return redirect(f'{frontend_url}/auth/callback?error=user_info_failed')
+
+        # Create/get user
+        user = await aget_or_create_user_from_google(google_user_info)
+        if not user:
+            return redirect(f'{frontend_url}/auth/callback?error=user_creation_failed')
+
+        # Generate JWT tokens
+        refresh = await sync_to_async(RefreshToken.for_user)(user)
+
+        # Redirect to frontend with token
+        return redirect(f'{frontend_url}/auth/callback?access_token={refresh.access_token}')
+
+    except Exception:
+        return redirect(f'{frontend_url}/auth/callback?error=authentication_failed')
+
+
+@csrf_exempt
+@require_POST
+async def convert_meters_to_feet(request):
+    """
+    Async version of views.convert_meters_to_feet.
+    POST /api/conversions/convert/
+    Body: {"meters": 10.5}
+    """
+    user, error_response = await aauthenticate(request)
+    if error_response:
+        return error_response
+
+    try:
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                "error": "Invalid JSON format"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Validate input
+        input_serializer = ConversionInputSerializer(data=data)
+        if not input_serializer.is_valid():
+            return JsonResponse({
+                "error": "Invalid input",
+                "details": input_serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        meters_value = input_serializer.validated_data['meters']
+        feet_value = meters_to_feet(meters_value)
+
+        # Save conversion (committed now, or queued in buffered mode)
+        conversion, = await asave_conversions([
+            Conversion(
+                user=user,
+                meters_value=meters_value,
+                feet_value=feet_value,
+                ip_address=get_client_ip(request)
+            )
+        ])
+
+        # Prepare response
+        response_data = {
+            "meters": meters_value,
+            "feet": feet_value,
+            "conversion_id": conversion.id,
+            "timestamp": conversion.timestamp,
+            "formula_used": CONVERSION_FORMULA,
+            "message": f"Successfully converted {meters_value} meters to {feet_value} feet"
+        }
+
+        response_serializer = ConversionResponseSerializer(response_data)
+        return JsonResponse(response_serializer.data, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return JsonResponse({
+            "error": "Conversion failed",
+            "details": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_GET
+async def conversion_feed(request):
+    """
+    Server-sent events for the authenticated user's new conversions.
+    GET /api/conversions/feed/ (Accept: text/event-stream)
+    Each conversion is pushed as a `conversion` event as soon as it is
+    committed. Event ids are delta-sync tokens, so a reconnect with
+    Last-Event-ID (or ?since=<next_token>) replays what was missed.
+    Browsers, whose EventSource cannot send an Authorization header, pass
+    ?token=<feed token> from POST /api/conversions/feed/token/ instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A sync worker would have to buffer the endless stream
+        return JsonResponse({
+            "error": "The conversion feed requires the ASGI application"
+        }, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    user, error_response = await aauthenticate(request, feed_token=request.GET.get('token'))
+    if error_response:
+        return error_response
+
+    token = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    try:
+        since = decode_sync_token(token) if token else None
+    except InvalidSyncToken:
+        return JsonResponse({
+            "error": "Invalid sync token"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(hub.stream(user, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
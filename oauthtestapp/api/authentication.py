@@ -0,0 +1,165 @@
+import copy
+import itertools
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .google import TTLCache
+from .tokens import FeedToken
+
+# Users resolved from access tokens, keyed by (user id, version). A user's
+# version changes whenever it is saved or deleted in this process, so entries
+# fetched before the change are never read again.
+user_cache = TTLCache(
+    maxsize=settings.JWT_USER_CACHE_MAX_SIZE,
+    ttl=settings.JWT_USER_CACHE_TTL,
+)
+
+# str(user id) -> version, for users changed since the last reset. Holds at
+# most JWT_USER_CACHE_MAX_SIZE users; past that every version is forgotten at
+# once and _base_version, which users without an entry get, moves past all of
+# them, so no key handed out before the reset is ever produced again.
+_versions = {}
+_base_version = 0
+_version_counter = itertools.count(1)
+_versions_lock = threading.Lock()
+
+
+def user_cache_key(user_id):
+    user_id = str(user_id)
+    return user_id, _versions.get(user_id, _base_version)
+
+
+def invalidate_cached_user(user_id):
+    """Stop serving the cached user for user_id in this process."""
+    global _base_version
+    user_id = str(user_id)
+    with _versions_lock:
+        stale_key = user_cache_key(user_id)
+        version = next(_version_counter)
+        if user_id not in _versions and len(_versions) >= settings.JWT_USER_CACHE_MAX_SIZE:
+            _versions.clear()
+            _base_version = version
+            # Every cached key is now unreachable; free the entries too
+            user_cache.clear()
+        else:
+            _versions[user_id] = version
+    user_cache.delete(stale_key)
+
+
+def invalidate_user_on_change(sender, instance, **kwargs):
+    """post_save/post_delete receiver for the user model (see ApiConfig.ready)."""
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    invalidate_cached_user(user_id)
+    # Again once the change is visible to other connections, so a lookup that
+    # ran before the commit can't keep the old row cached
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
+
+
+def check_user(user, validated_token):
+    """The account checks JWTAuthentication.get_user makes after loading the user."""
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+    if api_settings.CHECK_REVOKE_TOKEN:
+        if validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code="password_changed"
+            )
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves users through user_cache instead of
+    querying the users table on every request.
+    Entries live for JWT_USER_CACHE_TTL seconds. The active and password
+    (revocation) checks still run on every request against the cached user,
+    and each request gets its own copy of it.
+    """
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+    def user_not_found(self):
+        return AuthenticationFailed(_("User not found"), code="user_not_found")
+
+    def get_user(self, validated_token):
+        if not settings.JWT_USER_CACHE_TTL:
+            return super().get_user(validated_token)
+
+        user_id = self.get_user_id(validated_token)
+
+        def fetch():
+            return self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+
+        user = user_cache.get_or_fetch(user_cache_key(user_id), fetch)
+        if user is None:
+            # Not found, or the shared fetch failed; look it up directly
+            user = fetch()
+            if user is None:
+                raise self.user_not_found()
+        return check_user(copy.copy(user), validated_token)
+
+
+class AsyncJWTAuthentication(CachedJWTAuthentication):
+    """
+    JWTAuthentication with an awaitable entry point for async views.
+    Token parsing and validation are CPU-only and reused as-is; the user is
+    loaded through Django's async ORM instead of a thread-pool hop.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aauthenticate_feed_token(self, raw_token):
+        """
+        Authenticate a FeedToken passed outside the Authorization header.
+        """
+        try:
+            validated_token = FeedToken(raw_token)
+        except TokenError as e:
+            raise InvalidToken(e.args[0]) from e
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """
+        Async version of get_user with the same cache and checks.
+        """
+        user_id = self.get_user_id(validated_token)
+        key = user_cache_key(user_id)
+
+        user = user_cache.get(key) if settings.JWT_USER_CACHE_TTL else None
+        if user is None:
+            try:
+                user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise self.user_not_found() from e
+            if settings.JWT_USER_CACHE_TTL:
+                user_cache.set(key, user)
+
+        return check_user(copy.copy(user), validated_token)
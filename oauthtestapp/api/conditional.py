@@ -0,0 +1,72 @@
+"""
+Conditional GET for per-user API views.
+
+The ETag of a response is a hash of a cheap per-user version, the query string
+and the negotiated media type. The version is the user's profile fields
+(already loaded by authentication) and, for views that read conversions, the
+user's latest conversion sequence number, read with one index seek. A
+request whose If-None-Match matches gets a 304 before the view runs its
+queries or serializes anything.
+"""
+import functools
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+
+from .models import Conversion
+
+
+def profile_version(user):
+    """
+    The profile fields responses show. auth.User has no modification time,
+    so the fields themselves are the version.
+    """
+    return (user.pk, user.username, user.email, user.first_name, user.last_name)
+
+
+def conversions_version(user):
+    """
+    The user's latest conversion sequence number. Every insert changes it,
+    including write-behind flushes of rows with older timestamps.
+    Conversions are never deleted through the API (only with their user).
+    """
+    return (
+        Conversion.objects.filter(user=user).order_by('-sequence').values_list('sequence', flat=True).first()
+    )
+
+
+def compute_etag(request, view_name, conversions):
+    parts = [view_name, *profile_version(request.user)]
+    if conversions:
+        parts.append(conversions_version(request.user))
+    parts.append(sorted(request.GET.lists()))
+    parts.append(request.accepted_media_type)
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return quote_etag(digest)
+
+
+def conditional_etag(conversions=False):
+    """
+    Decorator for function-based DRF views (below @permission_classes, so it
+    runs after authentication): adds a strong ETag to 200 responses and
+    answers a matching If-None-Match with 304 Not Modified.
+    Pass conversions=True for views whose output depends on the user's
+    conversions.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return func(request, *args, **kwargs)
+            etag = compute_etag(request, func.__name__, conversions)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = func(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+                # Responses are per user: browsers may keep them but must revalidate
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ('Authorization',))
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,276 @@
+"""
+In-process pub/sub hub behind the server-sent event feed of new conversions.
+
+Conversion.objects.record() sends conversions_recorded once its transaction
+commits, and the hub hands the new rows to every feed connection of that
+user in this worker. Each connection is an async generator with a bounded
+queue, so idle connections cost no thread. A connection that falls behind
+(full queue, slow client) or misses a sequence number (a conversion saved by
+another worker) catches up from the database by sequence number, as the
+delta-sync endpoint does. A poller thread checks the users' ConversionSequence
+counters every CONVERSION_FEED_POLL_INTERVAL seconds to notice conversions
+saved by other workers.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+
+from .models import Conversion, ConversionSequence
+from .pagination import encode_sync_token
+from .serializers import CONVERSION_HISTORY_VALUES, serialize_conversion_history
+
+logger = logging.getLogger(__name__)
+
+CATCH_UP_LIMIT = 500
+HEARTBEAT = b": keep-alive\n\n"
+
+
+def format_event(sequence, row):
+    """One SSE message; the event id is the delta-sync token after this conversion."""
+    data = json.dumps(row, separators=(',', ':'))
+    return f"id: {encode_sync_token(sequence)}\nevent: conversion\ndata: {data}\n\n".encode()
+
+
+def format_rows(rows, user):
+    """(sequence, message) pairs for history rows that include 'sequence'."""
+    return [
+        (row['sequence'], format_event(row['sequence'], data))
+        for row, data in zip(rows, serialize_conversion_history(rows, user))
+    ]
+
+
+def run_calls(calls):
+    for method, argument in calls:
+        method(argument)
+
+
+class Subscriber:
+    """
+    One feed connection. Apart from the hub's bookkeeping, its state is only
+    touched on the event loop that serves the connection.
+    """
+
+    def __init__(self, hub, user, loop):
+        self.hub = hub
+        self.user = user
+        self.loop = loop
+        self.queue = deque()
+        # Highest sequence number queued or sent; None until start() sets it
+        self.position = None
+        self.needs_catch_up = False
+        self.catching_up = False
+        self.wakeup = asyncio.Event()
+
+    def offer(self, events):
+        """Queue published (sequence, message) pairs, or fall back to a catch-up."""
+        if self.position is None or self.needs_catch_up or self.catching_up:
+            self.request_catch_up()
+            return
+        for sequence, message in events:
+            if sequence <= self.position:
+                continue
+            if sequence != self.position + 1 or len(self.queue) >= self.hub.queue_size:
+                if len(self.queue) >= self.hub.queue_size:
+                    self.hub.overflows += 1
+                self.request_catch_up()
+                return
+            self.queue.append(message)
+            self.position = sequence
+        self.wakeup.set()
+
+    def notify(self, latest):
+        """Called with the user's latest committed sequence number from the database."""
+        if self.position is not None and latest > self.position:
+            self.request_catch_up()
+
+    def request_catch_up(self):
+        self.needs_catch_up = True
+        self.wakeup.set()
+
+    async def catch_up(self):
+        """Read the conversions after self.position from the database."""
+        self.hub.catch_ups += 1
+        queryset = (
+            Conversion.objects
+            .filter(user=self.user, sequence__gt=self.position)
+            .order_by('sequence')
+            .values(*CONVERSION_HISTORY_VALUES, 'sequence')
+        )
+        rows = [row async for row in queryset[:CATCH_UP_LIMIT + 1]]
+        if len(rows) > CATCH_UP_LIMIT:
+            rows = rows[:CATCH_UP_LIMIT]
+            self.needs_catch_up = True
+        return format_rows(rows, self.user)
+
+    async def start(self, since):
+        """Start after sequence number since, or after the latest conversion if None."""
+        if since is None:
+            since = await (
+                ConversionSequence.objects
+                .filter(user=self.user)
+                .values_list('last_sequence', flat=True)
+                .afirst()
+            ) or 0
+        else:
+            self.needs_catch_up = True
+        self.position = since
+
+    async def stream(self, since, heartbeat):
+        """SSE byte chunks, until the client disconnects."""
+        # Sent first so the response starts straight away
+        yield f"retry: {int(heartbeat * 1000)}\n\n".encode()
+        await self.start(since)
+        while True:
+            self.wakeup.clear()
+            while self.queue:
+                yield self.queue.popleft()
+            if self.needs_catch_up:
+                self.needs_catch_up = False
+                self.catching_up = True
+                try:
+                    events = await self.catch_up()
+                finally:
+                    self.catching_up = False
+                for sequence, message in events:
+                    if sequence > self.position:
+                        yield message
+                        self.position = sequence
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+
+
+class ConversionHub:
+    """
+    Routes committed conversions to the feed connections of their user.
+    Publishing never blocks: a subscriber whose queue is full drops to a
+    database catch-up instead of slowing the writer down.
+    """
+
+    def __init__(self, queue_size, heartbeat, poll_interval):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self._subscribers = {}  # user id -> set of Subscriber
+        self._lock = threading.Lock()
+        self._poller_started = False
+        self.published = 0
+        self.overflows = 0
+        self.catch_ups = 0
+        self.poll_errors = 0
+
+    async def stream(self, user, since=None):
+        """Subscribe a connection for user and yield its SSE chunks."""
+        subscriber = Subscriber(self, user, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(user.pk, set()).add(subscriber)
+        self._start_poller()
+        try:
+            async for chunk in subscriber.stream(since, self.heartbeat):
+                yield chunk
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(user.pk)
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user.pk]
+
+    def publish(self, conversions):
+        """Hand committed conversions to their users' subscribers. Safe from any thread."""
+        by_user = {}
+        for conversion in conversions:
+            by_user.setdefault(conversion.user_id, []).append(conversion)
+        for user_id, user_conversions in by_user.items():
+            with self._lock:
+                subscribers = list(self._subscribers.get(user_id, ()))
+            if not subscribers:
+                continue
+            rows = sorted(
+                ({field: getattr(c, field) for field in (*CONVERSION_HISTORY_VALUES, 'sequence')} for c in user_conversions),
+                key=lambda row: row['sequence'],
+            )
+            events = format_rows(rows, user_conversions[0].user)
+            self.published += len(events)
+            self._dispatch([(subscriber.offer, events) for subscriber in subscribers])
+
+    def _dispatch(self, calls):
+        """Run (bound subscriber method, argument) calls on their event loops, one wakeup per loop."""
+        by_loop = {}
+        for method, argument in calls:
+            by_loop.setdefault(method.__self__.loop, []).append((method, argument))
+        for loop, loop_calls in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(run_calls, loop_calls)
+            except RuntimeError:
+                pass  # Event loop closed; its connections are gone
+
+    def _start_poller(self):
+        if self._poller_started or not self.poll_interval:
+            return
+        with self._lock:
+            if self._poller_started:
+                return
+            threading.Thread(target=self._poll_forever, name='conversion-feed-poller', daemon=True).start()
+            self._poller_started = True
+
+    def _poll_forever(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except DatabaseError:
+                self.poll_errors += 1
+                logger.exception("Conversion feed poll failed")
+
+    def poll(self):
+        """Catch up subscribers whose user has newer conversions in the database."""
+        with self._lock:
+            subscribers = {user_id: list(subs) for user_id, subs in self._subscribers.items()}
+        if not subscribers:
+            return
+        close_old_connections()
+        user_ids = list(subscribers)
+        calls = []
+        for start in range(0, len(user_ids), 1000):
+            latest = ConversionSequence.objects.filter(
+                user_id__in=user_ids[start:start + 1000]
+            ).values_list('user_id', 'last_sequence')
+            for user_id, last_sequence in latest:
+                for subscriber in subscribers[user_id]:
+                    position = subscriber.position
+                    if position is not None and last_sequence > position:
+                        calls.append((subscriber.notify, last_sequence))
+        self._dispatch(calls)
+
+    def metrics(self):
+        with self._lock:
+            connections = sum(len(subs) for subs in self._subscribers.values())
+            users = len(self._subscribers)
+        return {
+            "connections": connections,
+            "users": users,
+            "published": self.published,
+            "overflows": self.overflows,
+            "catch_ups": self.catch_ups,
+            "poll_errors": self.poll_errors,
+        }
+
+
+hub = ConversionHub(
+    queue_size=settings.CONVERSION_FEED_QUEUE_SIZE,
+    heartbeat=settings.CONVERSION_FEED_HEARTBEAT_INTERVAL,
+    poll_interval=settings.CONVERSION_FEED_POLL_INTERVAL,
+)
+
+
+def publish_recorded(sender, conversions, **kwargs):
+    """conversions_recorded receiver."""
+    hub.publish(conversions)
@@ -0,0 +1,401 @@
+"""
+Helpers for talking to Google's OAuth endpoints.
+"""
+import asyncio
+import hashlib
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import jwt
+import requests
+from django.conf import settings
+
+from .oauth_client import CircuitOpenError, get_async_oauth_client, get_oauth_client
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe TTL cache with in-flight request coalescing.
+
+    Entries expire `ttl` seconds after they are stored and the least recently
+    used entry is evicted once `maxsize` is reached. Concurrent get_or_fetch()
+    calls for the same key share a single fetch: the first caller runs it,
+    the others wait for its result.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> [threading.Event, value]
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_fetch(self, key, fetch, wait_timeout=None):
+        """
+        Return the cached value for key, or call fetch() once to produce it.
+        None results are handed to waiting callers but never cached.
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                return value
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                inflight = self._inflight[key] = [threading.Event(), None]
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            inflight[0].wait(wait_timeout)
+            return inflight[1]
+
+        try:
+            value = fetch()
+            inflight[1] = value
+            if value is not None:
+                self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            inflight[0].set()
+
+
+# Cache of Google userinfo responses, keyed by a hash of the access token so
+# raw tokens are never kept in memory longer than the request that sent them.
+userinfo_cache = TTLCache(
+    maxsize=settings.GOOGLE_USERINFO_CACHE_MAX_SIZE,
+    ttl=settings.GOOGLE_USERINFO_CACHE_TTL,
+)
+
+
+def token_cache_key(access_token):
+    """Return a stable, non-reversible cache key for an access token."""
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def fetch_google_user_info(access_token):
+    """
+    Get user information from Google using the access token (uncached).
+    """
+    try:
+        response = get_oauth_client().get(
+            settings.GOOGLE_USERINFO_URL,
+            headers={'Authorization': f'Bearer {access_token}'}
+        )
+
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    except requests.RequestException:
+        return None
+
+
+def get_google_user_info(access_token):
+    """
+    Get user information from Google using the access token.
+    Successful lookups are cached for GOOGLE_USERINFO_CACHE_TTL seconds and
+    concurrent lookups of the same token share one upstream call.
+    """
+    if not settings.GOOGLE_USERINFO_CACHE_TTL:
+        return fetch_google_user_info(access_token)
+
+    # No wait timeout: the leader's call is bounded by the OAuth client's timeouts
+    user_info = userinfo_cache.get_or_fetch(
+        token_cache_key(access_token),
+        lambda: fetch_google_user_info(access_token),
+    )
+    return dict(user_info) if user_info is not None else None
+
+
+def exchange_google_code(code):
+    """
+    Exchange an authorization code for Google tokens.
+    Returns the token response JSON, or None if the exchange failed.
+    """
+    token_data = {
+        'client_id': settings.GOOGLE_OAUTH_CLIENT_ID,
+        'client_secret': settings.GOOGLE_OAUTH_CLIENT_SECRET,
+        'code': code,
+        'grant_type': 'authorization_code',
+        'redirect_uri': settings.GOOGLE_OAUTH_REDIRECT_URI,
+    }
+    try:
+        response = get_oauth_client().post(settings.GOOGLE_TOKEN_URL, data=token_data)
+        return response.json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+# Per event loop: cache key -> asyncio.Future of the in-flight userinfo lookup
+_inflight_async = weakref.WeakKeyDictionary()
+
+
+async def fetch_google_user_info_async(access_token):
+    """
+    Async version of fetch_google_user_info (uncached).
+    """
+    import httpx
+
+    try:
+        response = await get_async_oauth_client().get(
+            settings.GOOGLE_USERINFO_URL,
+            headers={'Authorization': f'Bearer {access_token}'}
+        )
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    except (httpx.HTTPError, CircuitOpenError, ValueError):
+        return None
+
+
+async def get_google_user_info_async(access_token):
+    """
+    Async version of get_google_user_info.
+    Shares the userinfo cache with the sync path; concurrent lookups of the
+    same token on one event loop await a single upstream call.
+    """
+    if not settings.GOOGLE_USERINFO_CACHE_TTL:
+        return await fetch_google_user_info_async(access_token)
+
+    key = token_cache_key(access_token)
+    user_info = userinfo_cache.get(key)
+    if user_info is None:
+        inflight = _inflight_async.setdefault(asyncio.get_running_loop(), {})
+        future = inflight.get(key)
+        if future is not None:
+            user_info = await asyncio.shield(future)
+        else:
+            future = inflight[key] = asyncio.get_running_loop().create_future()
+            try:
+                user_info = await fetch_google_user_info_async(access_token)
+                if user_info is not None:
+                    userinfo_cache.set(key, user_info)
+            finally:
+                del inflight[key]
+                future.set_result(user_info)
+    return dict(user_info) if user_info is not None else None
+
+
+async def exchange_google_code_async(code):
+    """
+    Async version of exchange_google_code.
+    """
+    import httpx
+
+    token_data = {
+        'client_id': settings.GOOGLE_OAUTH_CLIENT_ID,
+        'client_secret': settings.GOOGLE_OAUTH_CLIENT_SECRET,
+        'code': code,
+        'grant_type': 'authorization_code',
+        'redirect_uri': settings.GOOGLE_OAUTH_REDIRECT_URI,
+    }
+    try:
+        response = await get_async_oauth_client().post(settings.GOOGLE_TOKEN_URL, data=token_data)
+        return response.json()
+    except (httpx.HTTPError, CircuitOpenError, ValueError):
+        return None
+
+
+GOOGLE_ID_TOKEN_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+# Allowed clock skew when checking exp/iat/nbf on ID tokens, in seconds
+GOOGLE_ID_TOKEN_LEEWAY = 30
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+class JWKSCache:
+    """
+    Cache of Google's JSON Web Key Set used to verify ID-token signatures.
+
+    The key set is kept for as long as Google's Cache-Control max-age (or
+    Expires) header allows. Once `refresh_ratio` of that lifetime has passed
+    a background thread re-fetches it while callers keep using the current
+    keys, so verification never waits on Google unless the cache is empty or
+    a token is signed with a key id we have not seen yet (key rotation).
+    Those synchronous refreshes are single-flight, so a burst of logins on a
+    cold cache or right after a rotation sends one request to Google.
+    """
+
+    def __init__(self, default_max_age=3600, refresh_ratio=0.8, min_refetch_interval=60):
+        self.default_max_age = default_max_age
+        self.refresh_ratio = refresh_ratio
+        self.min_refetch_interval = min_refetch_interval
+        self.keys = {}  # kid -> PyJWK
+        self.fetched_at = None
+        self.max_age = default_max_age
+        self.last_attempt = None
+        self.attempts = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+    def get_signing_key(self, kid):
+        """
+        Return the PyJWK for kid, or None if Google does not publish it.
+        """
+        attempts = self.attempts
+        now = time.monotonic()
+        if self.fetched_at is None or now >= self.fetched_at + self.max_age:
+            # Empty or expired: refresh before answering
+            self.refresh_once(attempts)
+        elif now >= self.fetched_at + self.max_age * self.refresh_ratio:
+            self.refresh_in_background()
+
+        key = self.keys.get(kid)
+        if key is None:
+            # Unknown key id, Google may have rotated keys
+            self.refresh_once(attempts, throttle=True)
+            key = self.keys.get(kid)
+        return key
+
+    def refresh_once(self, attempts, throttle=False):
+        """
+        Refresh unless a fetch has finished since the caller read `attempts`.
+        Concurrent callers share one fetch: the first one makes it and the
+        others wait for it, then use its keys (or its failure). With
+        `throttle`, also skip it if the last fetch was under
+        `min_refetch_interval` ago.
+        """
+        with self._fetch_lock:
+            if self.attempts != attempts or (throttle and not self._may_refetch()):
+                return
+            self.refresh()
+
+    def _may_refetch(self):
+        return self.last_attempt is None or time.monotonic() - self.last_attempt >= self.min_refetch_interval
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(
+            target=self.refresh_once, args=(self.attempts,), name='google-jwks-refresh', daemon=True
+        ).start()
+
+    def refresh(self):
+        """Fetch the key set from Google and replace the cached keys."""
+        self.last_attempt = time.monotonic()
+        try:
+            response = get_oauth_client().get(settings.GOOGLE_JWKS_URL)
+            response.raise_for_status()
+            key_set = jwt.PyJWKSet.from_dict(response.json())
+        except (requests.RequestException, ValueError, jwt.PyJWKSetError):
+            return False
+        else:
+            with self._lock:
+                self.keys = {key.key_id: key for key in key_set.keys if key.key_id}
+                self.max_age = self._parse_max_age(response.headers)
+                self.fetched_at = time.monotonic()
+            return True
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self.attempts += 1
+
+    def _parse_max_age(self, headers):
+        match = MAX_AGE_RE.search(headers.get('Cache-Control', ''))
+        if match:
+            return int(match.group(1))
+        expires = headers.get('Expires')
+        if expires:
+            try:
+                expires_at = parsedate_to_datetime(expires).timestamp()
+                return max(0, int(expires_at - time.time()))
+            except (TypeError, ValueError):
+                pass
+        return self.default_max_age
+
+    def clear(self):
+        with self._lock:
+            self.keys = {}
+            self.fetched_at = None
+            self.last_attempt = None
+
+
+jwks_cache = JWKSCache()
+
+
+def verify_google_id_token(id_token):
+    """
+    Verify a Google ID token locally and return userinfo-shaped claims.
+
+    Checks the RS256 signature against Google's cached JWKS, the audience
+    (GOOGLE_OAUTH_CLIENT_ID), the issuer and expiry, and that the email is
+    verified. Returns None if the token is not valid.
+    """
+    if not settings.GOOGLE_OAUTH_CLIENT_ID:
+        return None
+
+    try:
+        header = jwt.get_unverified_header(id_token)
+        signing_key = jwks_cache.get_signing_key(header.get('kid'))
+        if signing_key is None:
+            return None
+        claims = jwt.decode(
+            id_token,
+            signing_key,
+            algorithms=['RS256'],
+            audience=settings.GOOGLE_OAUTH_CLIENT_ID,
+            issuer=GOOGLE_ID_TOKEN_ISSUERS,
+            leeway=GOOGLE_ID_TOKEN_LEEWAY,
+            options={'require': ['exp', 'iat', 'iss', 'aud', 'sub']},
+        )
+    except jwt.PyJWTError:
+        return None
+
+    if not claims.get('email') or claims.get('email_verified') not in (True, 'true'):
+        return None
+
+    # Same shape as the userinfo endpoint response
+    return {
+        'id': claims['sub'],
+        'email': claims['email'],
+        'verified_email': True,
+        'name': claims.get('name', ''),
+        'given_name': claims.get('given_name', ''),
+        'family_name': claims.get('family_name', ''),
+        'picture': claims.get('picture', ''),
+    }
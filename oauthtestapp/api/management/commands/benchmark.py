@@ -0,0 +1,778 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+import tracemalloc
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, transaction
+from django.test import AsyncRequestFactory, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+# Django's own classes for the middleware api.middleware bypasses on stateless routes
+STOCK_MIDDLEWARE = {
+    'api.middleware.SessionMiddleware': 'django.contrib.sessions.middleware.SessionMiddleware',
+    'api.middleware.CsrfViewMiddleware': 'django.middleware.csrf.CsrfViewMiddleware',
+    'api.middleware.AuthenticationMiddleware': 'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.MessageMiddleware': 'django.contrib.messages.middleware.MessageMiddleware',
+}
+
+
+def numeric_conversion_model():
+    """
+    Unmanaged copy of the conversion table as it was before values moved to
+    integer columns (NUMERIC(10, 6)), for the storage benchmark.
+    """
+    from django.db import models
+
+    class NumericConversion(models.Model):
+        user_id = models.IntegerField()
+        meters_value = models.DecimalField(max_digits=10, decimal_places=6)
+        feet_value = models.DecimalField(max_digits=10, decimal_places=6)
+        timestamp = models.DateTimeField()
+        ip_address = models.GenericIPAddressField(null=True)
+        from_unit = models.CharField(max_length=32, default='meter')
+        to_unit = models.CharField(max_length=32, default='foot')
+        sequence = models.PositiveBigIntegerField()
+
+        class Meta:
+            app_label = 'api'
+            db_table = 'benchmark_numeric_conversion'
+            managed = False
+            indexes = [
+                models.Index(
+                    fields=['user_id', '-timestamp', '-id'],
+                    name='benchmark_numeric_ts_idx',
+                    include=['meters_value', 'feet_value', 'ip_address', 'from_unit', 'to_unit'],
+                ),
+            ]
+            constraints = [
+                models.UniqueConstraint(fields=['user_id', 'sequence'], name='benchmark_numeric_sequence_uniq'),
+            ]
+
+    return NumericConversion
+
+
+class GoogleStub:
+    """
+    Local stand-in for Google's userinfo endpoint that answers after `latency` seconds.
+    """
+
+    def __init__(self, latency, user_info):
+        body = json.dumps(user_info).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; don't let Nagle delay the body
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/oauth2/v2/userinfo"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Command(BaseCommand):
+    """
+    Run micro-benchmarks against the conversion API.
+    Every scenario runs inside a transaction that is rolled back afterwards,
+    so no benchmark data is left behind in the database. Scenarios that
+    measure commit cost or create tables (`commits = True`) run without it
+    and delete their benchmark user instead.
+    Usage:
+        python manage.py benchmark batch --size 500
+        python manage.py benchmark login --size 50 --latency 200
+        python manage.py benchmark durability --size 500
+        python manage.py benchmark array --max-exponent 7
+        python manage.py benchmark export --size 1000000
+        python manage.py benchmark history --size 50
+        python manage.py benchmark fields --size 1000
+        python manage.py benchmark storage --size 1000000
+        python manage.py benchmark json --size 10000
+        python manage.py benchmark middleware --size 2000
+        python manage.py benchmark metrics --size 2000
+        python manage.py benchmark feed --size 5000
+    """
+    help = "Run micro-benchmarks against the conversion API"
+
+    scenarios = ['batch', 'login', 'durability', 'array', 'export', 'history', 'fields', 'json', 'middleware', 'metrics', 'feed', 'storage']
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=self.scenarios)
+        parser.add_argument('--size', type=int, default=500, help="Number of values per run")
+        parser.add_argument('--repeat', type=int, default=3, help="Number of runs (best is reported)")
+        parser.add_argument('--latency', type=float, default=200, help="Injected Google latency in ms (login)")
+        parser.add_argument('--max-exponent', type=int, default=7, help="Largest array is 10^N values (array)")
+        parser.add_argument('--json-max-exponent', type=int, default=6, help="Largest JSON run is 10^N values (array)")
+        parser.add_argument('--max-peak-mb', type=float, default=32, help="Fail if export peak memory exceeds this (export)")
+
+    def handle(self, *args, **options):
+        if options['size'] < 1 or options['repeat'] < 1:
+            raise CommandError("--size and --repeat must be positive")
+
+        test_settings = override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            SECURE_SSL_REDIRECT=False,
+        )
+        bench = getattr(self, f"bench_{options['scenario']}")
+        with test_settings:
+            if getattr(bench, 'commits', False):
+                user = User.objects.create_user(username='__benchmark__', email='benchmark@example.com')
+                try:
+                    bench(self.client_for(user), user, options)
+                finally:
+                    user.delete()  # Cascades to the benchmark's conversions
+                return
+
+            with transaction.atomic():
+                user = User.objects.create_user(username='__benchmark__', email='benchmark@example.com')
+                bench(self.client_for(user), user, options)
+                transaction.set_rollback(True)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def timeit(self, func, repeat):
+        """Return the best wall-clock time of `repeat` calls to func."""
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def report(self, label, seconds, size, unit='values'):
+        self.stdout.write(
+            f"{label:<32} {seconds * 1000:>10.2f} ms  {size / seconds:>12.0f} {unit}/s"
+        )
+
+    def bench_batch(self, client, user, options):
+        """N single-value POSTs vs one batch POST of N values."""
+        size, repeat = options['size'], options['repeat']
+        values = [str(Decimal(i) / 100) for i in range(size)]
+
+        def single():
+            for value in values:
+                response = client.post('/api/conversions/convert/', {'meters': value}, format='json')
+                assert response.status_code == 200, response.content
+
+        def batch():
+            response = client.post('/api/conversions/convert/batch/', {'meters': values}, format='json')
+            assert response.status_code == 200, response.content
+
+        self.report(f"single x{size}", self.timeit(single, repeat), size)
+        self.report(f"batch x{size}", self.timeit(batch, repeat), size)
+
+    def bench_login(self, client, user, options):
+        """
+        Logins per worker against a Google stub with injected latency:
+        a sync worker serves N logins one after another, an async worker
+        serves the same N logins concurrently on one event loop.
+        """
+        from api import async_views, views
+
+        size, repeat = options['size'], options['repeat']
+        user_info = {
+            'id': 'benchmark-google-id',
+            'email': user.email,
+            'given_name': 'Bench',
+            'family_name': 'Mark',
+        }
+        # Link the Google account up front so both paths measure a returning user
+        views.get_or_create_user_from_google(user_info)
+
+        def body(i):
+            # Distinct tokens so every login really goes to the stub
+            return json.dumps({'access_token': f'benchmark-token-{i}'})
+
+        def sync_logins():
+            factory = RequestFactory()
+            for i in range(size):
+                request = factory.post('/api/auth/google/', body(i), content_type='application/json')
+                response = views.google_oauth_login(request)
+                assert response.status_code == 200, response.content
+
+        async def concurrent_logins():
+            factory = AsyncRequestFactory()
+            responses = await asyncio.gather(*[
+                async_views.google_oauth_login(
+                    factory.post('/api/auth/google/', body(i), content_type='application/json')
+                )
+                for i in range(size)
+            ])
+            for response in responses:
+                assert response.status_code == 200, response.content
+
+        with GoogleStub(options['latency'] / 1000, user_info) as stub, override_settings(
+            GOOGLE_USERINFO_URL=stub.url,
+            GOOGLE_USERINFO_CACHE_TTL=0,
+            GOOGLE_HTTP_POOL_SIZE=max(size, settings.GOOGLE_HTTP_POOL_SIZE),
+        ):
+            self.stdout.write(f"Google stub latency: {options['latency']:.0f} ms")
+            self.report(f"sync worker x{size}", self.timeit(sync_logins, repeat), size, 'logins')
+            # async_to_sync keeps ORM calls on this thread, inside the benchmark transaction
+            self.report(f"async worker x{size}", self.timeit(async_to_sync(concurrent_logins), repeat), size, 'logins')
+
+    def bench_durability(self, client, user, options):
+        """
+        N single-value POSTs with each durability policy, committing for real:
+        'sync' commits inside every request, 'buffered' only queues the row.
+        The buffered run then reports how long draining the queue took.
+        """
+        from api import write_behind
+
+        size, repeat = options['size'], options['repeat']
+        values = [str(Decimal(i) / 100) for i in range(size)]
+
+        def single():
+            for value in values:
+                response = client.post('/api/conversions/convert/', {'meters': value}, format='json')
+                assert response.status_code == 200, response.content
+
+        with override_settings(CONVERSION_DURABILITY=write_behind.SYNC):
+            self.report(f"sync x{size}", self.timeit(single, repeat), size)
+
+        buffer = write_behind.ConversionWriteBuffer(
+            flush_size=settings.CONVERSION_BUFFER_FLUSH_SIZE,
+            flush_interval=settings.CONVERSION_BUFFER_FLUSH_INTERVAL,
+            max_pending=max(size * repeat, settings.CONVERSION_BUFFER_MAX_PENDING),
+        )
+        with override_settings(CONVERSION_DURABILITY=write_behind.BUFFERED), \
+                mock.patch.object(write_behind, 'get_conversion_buffer', return_value=buffer):
+            self.report(f"buffered x{size}", self.timeit(single, repeat), size)
+            queued = len(buffer.pending)
+            start = time.perf_counter()
+            buffer.drain()
+            self.stdout.write(f"{'drain on shutdown':<32} {(time.perf_counter() - start) * 1000:>10.2f} ms  ({queued} rows queued)")
+
+        metrics = buffer.metrics()
+        assert metrics['flushed'] == size * repeat, metrics
+        self.stdout.write(
+            f"flushed {metrics['flushed']} rows, max queue depth {metrics['max_queue_depth']}, "
+            f"flush p50 {metrics['flush_latency']['p50_ms']} ms, p99 {metrics['flush_latency']['p99_ms']} ms"
+        )
+
+    bench_durability.commits = True
+
+    def bench_array(self, client, user, options):
+        """
+        Binary float64 array endpoint vs the JSON/Decimal path for 10^3..10^N values.
+        The JSON path is measured without the database insert the batch
+        endpoint also does, so it is a lower bound for that endpoint.
+        """
+        import numpy as np
+        from rest_framework.renderers import JSONRenderer
+        from api.serializers import ConversionBatchInputSerializer
+        from api.views import meters_to_feet
+
+        repeat = options['repeat']
+        renderer = JSONRenderer()
+
+        for exponent in range(3, options['max_exponent'] + 1):
+            size = 10 ** exponent
+            meters = np.round(np.random.default_rng(exponent).uniform(0, 9999, size), 6)
+            body = meters.astype('<f8').tobytes()
+
+            def binary():
+                response = client.generic(
+                    'POST', '/api/conversions/convert/array/', body,
+                    content_type='application/octet-stream',
+                )
+                assert response.status_code == 200, response.content
+                np.frombuffer(response.content, dtype='<f8')
+
+            with override_settings(CONVERSION_ARRAY_MAX_ELEMENTS=size):
+                self.report(f"binary x10^{exponent}", self.timeit(binary, repeat), size)
+
+            if exponent > options['json_max_exponent']:
+                self.stdout.write(f"{f'json x10^{exponent}':<32} {'skipped':>10}")
+                continue
+
+            json_body = json.dumps({'meters': [f"{value:.6f}" for value in meters.tolist()]})
+
+            def json_path():
+                serializer = ConversionBatchInputSerializer(data=json.loads(json_body))
+                assert serializer.is_valid(), serializer.errors
+                renderer.render({"results": [
+                    {"meters": value, "feet": meters_to_feet(value)}
+                    for value in serializer.validated_data['meters']
+                ]})
+
+            with override_settings(CONVERSION_BATCH_MAX_SIZE=size):
+                self.report(f"json x10^{exponent}", self.timeit(json_path, repeat), size)
+
+    def bench_export(self, client, user, options):
+        """
+        Stream a history of N rows through /api/conversions/export/ in each
+        format and fail if peak Python memory exceeds --max-peak-mb.
+        """
+        from api.models import Conversion
+
+        size = options['size']
+        now = timezone.now()
+        Conversion.objects.bulk_create(
+            (
+                Conversion(
+                    user=user,
+                    meters_value=Decimal(i % 1000),
+                    feet_value=Decimal(i % 1000) * 3,
+                    timestamp=now - timedelta(seconds=i),
+                    ip_address='127.0.0.1',
+                    sequence=size - i,
+                )
+                for i in range(size)
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f"Exporting {size} rows (peak limit {options['max_peak_mb']} MB)")
+
+        def export(query):
+            response = client.get(f'/api/conversions/export/?{query}')
+            assert response.status_code == 200, response.content
+            # Exhausting streaming_content also closes the response
+            return sum(len(chunk) for chunk in response.streaming_content)
+
+        for query in ('output=csv', 'output=ndjson', 'output=csv&gzip=true'):
+            start = time.perf_counter()
+            total = export(query)
+            self.report(f"export {query}", time.perf_counter() - start, size, 'rows')
+            self.stdout.write(f"{'':<32} {total / 2 ** 20:>10.1f} MB sent")
+
+        # Memory is traced in a separate pass; tracemalloc slows allocation-heavy code down
+        tracemalloc.start()
+        try:
+            export('output=ndjson&gzip=true')
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+        self.stdout.write(f"Peak memory during export: {peak:.1f} MB")
+        if peak > options['max_peak_mb']:
+            raise CommandError(
+                f"Export peak memory {peak:.1f} MB exceeds {options['max_peak_mb']} MB"
+            )
+
+    def bench_history(self, client, user, options):
+        """
+        Serializing a history page of N rows: ConversionSerializer over model
+        instances vs the .values() fast path used by conversion_history.
+        Fails if the fast path needs more than one query.
+        """
+        from api.models import Conversion
+        from api.serializers import (
+            CONVERSION_HISTORY_VALUES,
+            ConversionSerializer,
+            serialize_conversion_history,
+        )
+
+        size, repeat = options['size'], options['repeat']
+        Conversion.objects.record([
+            Conversion(user=user, meters_value=Decimal(i), feet_value=Decimal(i) * 3, ip_address='127.0.0.1')
+            for i in range(size)
+        ])
+        conversions = Conversion.objects.filter(user=user)[:size]
+        rows = conversions.values(*CONVERSION_HISTORY_VALUES)
+
+        def model_serializer():
+            return ConversionSerializer(conversions.all(), many=True).data
+
+        def fast_path():
+            return serialize_conversion_history(rows.all(), user)
+
+        assert [dict(row) for row in model_serializer()] == fast_path()
+        for label, func in (('model serializer', model_serializer), ('values() fast path', fast_path)):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            self.report(f"{label} x{size}", self.timeit(func, repeat), size, 'rows')
+            self.stdout.write(f"{'':<32} {len(queries):>10} queries")
+            if func is fast_path and len(queries) != 1:
+                raise CommandError(f"History fast path ran {len(queries)} queries, expected 1")
+
+    def bench_fields(self, client, user, options):
+        """
+        A history page of N rows with every field vs ?fields=timestamp,meters_value,
+        as entries and as ?layout=columnar: response time, bytes sent (plain
+        and gzipped) and the columns the page query reads.
+        """
+        from api.models import Conversion
+
+        size, repeat = options['size'], options['repeat']
+        Conversion.objects.record([
+            Conversion(user=user, meters_value=Decimal(i) / 7, feet_value=Decimal(i) / 7 * 3, ip_address='127.0.0.1')
+            for i in range(size)
+        ])
+        queries = [
+            ('all fields', ''),
+            ('2 fields', '&fields=timestamp,meters_value'),
+            ('2 fields, columnar', '&fields=timestamp,meters_value&layout=columnar'),
+            ('all fields, columnar', '&layout=columnar'),
+        ]
+        for label, query in queries:
+            url = f'/api/conversions/history/?pagination=cursor&limit={size}{query}'
+
+            def fetch():
+                response = client.get(url)
+                assert response.status_code == 200, response.content
+                return response.content
+
+            with CaptureQueriesContext(connection) as captured:
+                content = fetch()
+            page_sql = captured.captured_queries[-1]['sql']
+            columns = page_sql[:page_sql.index(' FROM ')].count('"api_conversion".')
+            self.report(label, self.timeit(fetch, repeat), size, 'rows')
+            self.stdout.write(
+                f"{'':<32} {len(content) / 1024:>10.1f} KB  {len(zlib.compress(content, 6)) / 1024:>7.1f} KB gzipped"
+                f"  {columns} columns read"
+            )
+
+    def bench_storage(self, client, user, options):
+        """
+        The same N conversions stored as scaled integers (Conversion) and as
+        NUMERIC(10, 6) in a scratch table: the whole-history stats aggregate,
+        and a scan that reads every value into Python.
+        """
+        from django.db.models import Count, Max, Min, Sum
+
+        from api.models import Conversion
+
+        size, repeat = options['size'], options['repeat']
+        NumericConversion = numeric_conversion_model()
+        now = timezone.now()
+        values = [
+            (Decimal(i % 100_000) / 1000, (Decimal(i % 100_000) / 1000 * Decimal('3.28084')).quantize(Decimal('0.000001')))
+            for i in range(size)
+        ]
+        self.stdout.write(f"Loading {size} rows into each table")
+        Conversion.objects.bulk_create(
+            (
+                Conversion(
+                    user=user, meters_value=meters, feet_value=feet,
+                    timestamp=now - timedelta(seconds=i), sequence=i + 1,
+                )
+                for i, (meters, feet) in enumerate(values)
+            ),
+            batch_size=5000,
+        )
+        with connection.schema_editor() as editor:
+            editor.create_model(NumericConversion)
+        try:
+            NumericConversion.objects.bulk_create(
+                (
+                    NumericConversion(
+                        user_id=user.pk, meters_value=meters, feet_value=feet,
+                        timestamp=now - timedelta(seconds=i), sequence=i + 1,
+                    )
+                    for i, (meters, feet) in enumerate(values)
+                ),
+                batch_size=5000,
+            )
+            meters_values = [meters for meters, feet in values]
+            feet_values = [feet for meters, feet in values]
+            expected = {
+                'count': size,
+                'total_meters': sum(meters_values), 'total_feet': sum(feet_values),
+                'min_meters': min(meters_values), 'max_meters': max(meters_values),
+                'min_feet': min(feet_values), 'max_feet': max(feet_values),
+            }
+            tables = (('integer', Conversion), ('numeric', NumericConversion))
+            exact = {}
+            for label, model in tables:
+                rows = model.objects.filter(user_id=user.pk)
+
+                def aggregate():
+                    return rows.aggregate(
+                        count=Count('id'),
+                        total_meters=Sum('meters_value'), total_feet=Sum('feet_value'),
+                        min_meters=Min('meters_value'), max_meters=Max('meters_value'),
+                        min_feet=Min('feet_value'), max_feet=Max('feet_value'),
+                    )
+
+                def scan():
+                    values = rows.order_by().values_list('meters_value', 'feet_value')
+                    return sum(meters for meters, feet in values.iterator(chunk_size=2000))
+
+                # SQLite keeps NUMERIC values as floating point, so its sums can be off
+                exact[label] = aggregate() == expected and scan() == expected['total_meters']
+                self.report(f"{label} aggregate x{size}", self.timeit(aggregate, repeat), size, 'rows')
+                self.report(f"{label} scan x{size}", self.timeit(scan, repeat), size, 'rows')
+                self.stdout.write(f"{'':<32} {'exact' if exact[label] else 'NOT exact':>10}")
+        finally:
+            with connection.schema_editor() as editor:
+                editor.delete_model(NumericConversion)
+        if not exact['integer']:
+            raise CommandError("Integer storage did not reproduce the exact sums, minimums and maximums")
+
+    # Creates a table, which SQLite does not allow inside the rollback transaction
+    bench_storage.commits = True
+
+    def bench_json(self, client, user, options):
+        """
+        Rendering a history page of N rows plus stats-like floats with
+        JSONRenderer vs ORJSONRenderer. Fails if the output bytes differ.
+        """
+        from rest_framework.renderers import JSONRenderer
+
+        from api.models import Conversion
+        from api.renderers import ORJSONRenderer, orjson
+        from api.serializers import CONVERSION_HISTORY_VALUES, serialize_conversion_history
+
+        if orjson is None:
+            raise CommandError("orjson is not installed: pip install orjson")
+
+        size, repeat = options['size'], options['repeat']
+        Conversion.objects.record([
+            Conversion(
+                user=user,
+                meters_value=Decimal(i % 1000) / 7,
+                feet_value=(Decimal(i % 1000) / 7 * Decimal('3.28084')).quantize(Decimal('0.000001')),
+                ip_address='2001:db8::1' if i % 2 else '127.0.0.1',
+            )
+            for i in range(size)
+        ])
+        rows = Conversion.objects.filter(user=user).values(*CONVERSION_HISTORY_VALUES)
+        payload = {
+            'count': size,
+            'next': None,
+            'results': serialize_conversion_history(rows, user),
+            'stats': [
+                {'average_meters': i / 7, 'max_feet': Decimal(i) / 3, 'at': timezone.now()}
+                for i in range(size // 10 + 1)
+            ],
+        }
+
+        stdlib, fast = JSONRenderer(), ORJSONRenderer()
+        expected = stdlib.render(payload)
+        if fast.render(payload) != expected:
+            raise CommandError("ORJSONRenderer output differs from JSONRenderer")
+
+        for label, renderer in (('JSONRenderer', stdlib), ('ORJSONRenderer', fast)):
+            self.report(f"{label} x{size}", self.timeit(lambda: renderer.render(payload), repeat), size, 'rows')
+        self.stdout.write(f"{'':<32} {len(expected) / 1024:>10.0f} KB")
+
+    def bench_middleware(self, client, user, options):
+        """
+        Per-request cost of the full WSGI stack with Django's session, CSRF,
+        auth and messages middleware vs the route-aware api.middleware
+        classes, for N authenticated requests to stateless routes.
+        """
+        # A browser that also holds an admin session sends its cookie to the API too
+        paths = ['/api/conversions/units/', '/api/auth/profile/', '/api/conversions/history/']
+        stacks = [
+            ('stock', [STOCK_MIDDLEWARE.get(path, path) for path in settings.MIDDLEWARE]),
+            ('route-aware', settings.MIDDLEWARE),
+        ]
+        self.compare_stacks(user, options, paths, stacks)
+
+    def bench_metrics(self, client, user, options):
+        """
+        Per-request overhead of MetricsMiddleware (timing, query counting and
+        histogram updates), for N authenticated requests with and without it.
+        """
+        paths = ['/api/conversions/units/', '/api/conversions/history/']
+        stacks = [
+            ('no metrics', [path for path in settings.MIDDLEWARE if path != 'api.middleware.MetricsMiddleware']),
+            ('metrics', settings.MIDDLEWARE),
+        ]
+        self.compare_stacks(user, options, paths, stacks)
+
+    def compare_stacks(self, user, options, paths, stacks):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        size, repeat = options['size'], options['repeat']
+        token = str(AccessToken.for_user(user))
+
+        def start_response(status, headers, exc_info=None):
+            pass
+
+        # As Django's test client does, keep the benchmark's transaction open across requests
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            for path in paths:
+                self.compare_middleware(path, token, stacks, start_response, size, repeat)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+    def bench_feed(self, client, user, options):
+        """
+        Open N idle SSE connections to /api/conversions/feed/ on one event
+        loop through the ASGI handler, save one conversion and time until
+        every connection has received it. Reports threads and traced Python
+        memory per connection. Commits for real, since the feed only sees
+        committed conversions.
+        """
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from api.feed import hub
+        from api.models import Conversion
+
+        size = options['size']
+        path = '/api/conversions/feed/'
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Bearer {AccessToken.for_user(user)}'.encode()),
+            ],
+        }
+        handler = ASGIHandler()
+        threads_before = threading.active_count()
+
+        @async_to_sync
+        async def run():
+            disconnected = asyncio.Event()
+            opened, delivered = asyncio.Event(), asyncio.Event()
+            counts = {'opened': 0, 'delivered': 0}
+
+            def receiver():
+                messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+                async def receive():
+                    if messages:
+                        return messages.pop()
+                    await disconnected.wait()
+                    return {'type': 'http.disconnect'}
+                return receive
+
+            async def send(message):
+                if message['type'] == 'http.response.start' and message['status'] != 200:
+                    raise CommandError(f"{path} returned {message['status']}")
+                body = message.get('body', b'')
+                if body.startswith(b'retry:'):
+                    counts['opened'] += 1
+                    if counts['opened'] == size:
+                        opened.set()
+                elif b'event: conversion' in body:
+                    counts['delivered'] += 1
+                    if counts['delivered'] == size:
+                        delivered.set()
+
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            tasks = [asyncio.create_task(handler(dict(scope), receiver(), send)) for _ in range(size)]
+            await opened.wait()
+            # Let every connection read its starting position
+            while any(
+                subscriber.position is None for subscriber in hub._subscribers.get(user.pk, ())
+            ):
+                await asyncio.sleep(0.01)
+            self.report(f"open {size} connections", time.perf_counter() - start, size, 'conn')
+            per_connection = (tracemalloc.get_traced_memory()[0] - baseline) / size
+            tracemalloc.stop()
+            self.stdout.write(
+                f"{'':<32} {per_connection / 1024:>10.1f} KB/conn  "
+                f"{threading.active_count() - threads_before} extra thread(s)"
+            )
+
+            start = time.perf_counter()
+            await sync_to_async(Conversion.objects.record)([
+                Conversion(user=user, meters_value=Decimal(1), feet_value=Decimal(3))
+            ])
+            await delivered.wait()
+            self.report(f"fan-out to {size} connections", time.perf_counter() - start, size, 'msg')
+
+            disconnected.set()
+            await asyncio.gather(*tasks)
+
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            run()
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        self.stdout.write(f"hub: {hub.metrics()}")
+
+    bench_feed.commits = True
+
+    def compare_middleware(self, path, token, stacks, start_response, size, repeat):
+        """Time `size` requests to path through each middleware stack, under WSGI and ASGI."""
+        headers = {'Authorization': f'Bearer {token}', 'Cookie': 'sessionid=stale-session-key'}
+        environ = RequestFactory().get(path, headers=headers).environ
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+            'headers': [(b'host', b'testserver')] + [
+                (name.lower().encode(), value.encode()) for name, value in headers.items()
+            ],
+        }
+
+        def receiver():
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # No disconnect; Django cancels this wait once the response is sent
+                await asyncio.Event().wait()
+            return receive
+
+        async def send(message):
+            if message['type'] == 'http.response.start' and message['status'] != 200:
+                raise CommandError(f"{path} returned {message['status']}")
+
+        self.stdout.write(path)
+        for label, middleware in stacks:
+            with override_settings(MIDDLEWARE=middleware):
+                wsgi_handler = WSGIHandler()
+                asgi_handler = ASGIHandler()
+
+            def wsgi_requests():
+                for _ in range(size):
+                    wsgi_handler(dict(environ), start_response).close()
+
+            @async_to_sync
+            async def asgi_requests():
+                for _ in range(size):
+                    await asgi_handler(dict(scope), receiver(), send)
+
+            with CaptureQueriesContext(connection) as queries:
+                wsgi_handler(dict(environ), start_response).close()
+            query_count = len(queries)
+            self.report(f"  WSGI {label}", self.timeit(wsgi_requests, repeat), size, 'req')
+            self.report(f"  ASGI {label}", self.timeit(asgi_requests, repeat), size, 'req')
+            self.stdout.write(f"{'':<32} {query_count:>10} queries/request")
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Conversion, ConversionRollup
+
+ROLLUP_FIELDS = [
+    'total_conversions',
+    'total_meters',
+    'total_feet',
+    'min_meters',
+    'max_meters',
+    'min_feet',
+    'max_feet',
+    'latest_conversion_id',
+    'latest_meters',
+    'latest_feet',
+    'latest_timestamp',
+]
+
+
+class Command(BaseCommand):
+    """
+    Rebuild or verify the per-user conversion rollups from the raw Conversion table.
+    Usage:
+        python manage.py conversion_rollups            # rebuild every user
+        python manage.py conversion_rollups --verify   # report drift, change nothing
+        python manage.py conversion_rollups --user 42
+    """
+    help = "Rebuild or verify per-user conversion rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Only compare rollups with the raw table")
+        parser.add_argument('--user', type=int, action='append', dest='users', help="Limit to this user id (repeatable)")
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        if not user_ids:
+            user_ids = sorted(
+                set(Conversion.objects.order_by().values_list('user_id', flat=True).distinct())
+                | set(ConversionRollup.objects.values_list('user_id', flat=True))
+            )
+
+        if options['verify']:
+            self.verify(user_ids)
+        else:
+            self.rebuild(user_ids)
+
+    def rebuild(self, user_ids):
+        for user_id in user_ids:
+            ConversionRollup.objects.rebuild(user_id)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {len(user_ids)} user(s)"))
+
+    def verify(self, user_ids):
+        stored = ConversionRollup.objects.in_bulk(user_ids)
+        mismatches = 0
+        for user_id in user_ids:
+            expected = ConversionRollup.objects.compute(user_id)
+            rollup = stored.get(user_id)
+            if rollup is None:
+                if expected['total_conversions']:
+                    mismatches += 1
+                    self.stdout.write(f"user {user_id}: missing rollup")
+                continue
+
+            diffs = [
+                f"{field}={getattr(rollup, field)!r} (expected {expected[field]!r})"
+                for field in ROLLUP_FIELDS
+                if getattr(rollup, field) != expected[field]
+            ]
+            if diffs:
+                mismatches += 1
+                self.stdout.write(f"user {user_id}: " + ", ".join(diffs))
+
+        if mismatches:
+            raise CommandError(f"{mismatches} of {len(user_ids)} rollup(s) out of sync; run without --verify to rebuild")
+        self.stdout.write(self.style.SUCCESS(f"All {len(user_ids)} rollup(s) match the raw table"))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    """
+    Delete expired outstanding refresh tokens and their blacklist entries in
+    small chunks, so each transaction stays short. Meant to run on a schedule.
+    An expired token can't be refreshed whether or not it is blacklisted, so
+    nothing is lost.
+    Usage:
+        python manage.py prune_tokens
+        python manage.py prune_tokens --chunk-size 5000 --pause 0.1
+        python manage.py prune_tokens --dry-run
+    """
+    help = "Delete expired outstanding and blacklisted refresh tokens in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Tokens deleted per transaction")
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between chunks")
+        parser.add_argument('--dry-run', action='store_true', help="Only count expired tokens")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        cutoff = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=cutoff)
+
+        if options['dry_run']:
+            blacklisted = BlacklistedToken.objects.filter(token__expires_at__lte=cutoff).count()
+            self.stdout.write(f"{expired.count()} expired outstanding token(s), {blacklisted} blacklisted")
+            return
+
+        outstanding_deleted = blacklisted_deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(expired.order_by('id').values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                # Blacklist rows first, so the outstanding delete has nothing to cascade
+                blacklisted_deleted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding_deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {outstanding_deleted} expired outstanding token(s) and {blacklisted_deleted} blacklisted"
+        ))
@@ -0,0 +1,349 @@
+"""
+Request, database and Google call metrics in Prometheus text format.
+
+Every thread records into its own accumulator, so the request path takes no
+lock; a scrape sums the accumulators of all threads. With
+METRICS_MULTIPROC_DIR set, each worker process also writes its totals to a
+file in that directory every METRICS_FLUSH_INTERVAL seconds, and a scrape
+served by any worker adds up the files of all of them.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+# name -> (type, help, buckets, label names)
+METRICS = {
+    'api_requests_total': (
+        'counter', "Requests by URL name, method and status code.", None,
+        ('endpoint', 'method', 'status'),
+    ),
+    'api_request_duration_seconds': (
+        'histogram', "Time to produce the response (first byte for streaming responses).",
+        LATENCY_BUCKETS, ('endpoint', 'method'),
+    ),
+    'api_response_size_bytes': (
+        'histogram', "Response body size; streaming responses without Content-Length are not counted.",
+        SIZE_BUCKETS, ('endpoint',),
+    ),
+    'api_db_queries_per_request': (
+        'histogram', "Database queries run while handling a request.", QUERY_BUCKETS, ('endpoint',),
+    ),
+    'api_db_query_duration_seconds_total': (
+        'counter', "Time spent in database queries.", None, ('endpoint',),
+    ),
+    'google_request_duration_seconds': (
+        'histogram', "Outbound calls to Google, including retries.", LATENCY_BUCKETS, ('target', 'outcome'),
+    ),
+}
+
+
+class Accumulator:
+    """One thread's metric values: {metric name: {label values: value}}."""
+
+    def __init__(self):
+        self.values = {name: {} for name in METRICS}
+
+    def inc(self, name, labels, amount=1):
+        series = self.values[name]
+        series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        """Add value to a histogram, stored as [count per bucket..., +Inf count, sum]."""
+        buckets = METRICS[name][2]
+        series = self.values[name]
+        counts = series.get(labels)
+        if counts is None:
+            counts = series[labels] = [0] * (len(buckets) + 1) + [0.0]
+        counts[bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+
+_local = threading.local()
+_accumulators = []
+_accumulators_lock = threading.Lock()
+
+
+def accumulator():
+    """This thread's Accumulator, registered for scrapes on first use."""
+    acc = getattr(_local, 'accumulator', None)
+    if acc is None:
+        acc = _local.accumulator = Accumulator()
+        with _accumulators_lock:
+            _accumulators.append(acc)
+    return acc
+
+
+def merge(into, values):
+    """Add one set of metric values (in memory or loaded from a file) into another."""
+    for name, series in values.items():
+        target = into.setdefault(name, {})
+        for labels, value in series.items():
+            current = target.get(labels)
+            if current is None:
+                target[labels] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    current[i] += item
+            else:
+                target[labels] = current + value
+    return into
+
+
+def process_values():
+    """Totals of every thread in this process."""
+    with _accumulators_lock:
+        accumulators = list(_accumulators)
+    totals = {}
+    for acc in accumulators:
+        # Copy each series first; the owning thread may be adding to it
+        merge(totals, {name: dict(series) for name, series in acc.values.items()})
+    return totals
+
+
+# Per-request database counters, visible to the ORM calls a request makes
+# even when they run in a sync_to_async thread
+_request_stats = contextvars.ContextVar('api_metrics_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+def count_query(execute, sql, params, many, context):
+    """Database execute wrapper installed on every connection."""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+connection_created.connect(install_query_counter, dispatch_uid='api_metrics_query_counter')
+
+
+def endpoint_name(request):
+    """The URL name a request resolved to, so label values stay bounded."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.view_name:
+        return 'unmatched'
+    return match.view_name
+
+
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        length = response.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+    return len(response.content)
+
+
+def record_request(request, response, seconds, stats):
+    acc = accumulator()
+    endpoint = endpoint_name(request)
+    acc.inc('api_requests_total', (endpoint, request.method, str(response.status_code)))
+    acc.observe('api_request_duration_seconds', (endpoint, request.method), seconds)
+    size = response_size(response)
+    if size is not None:
+        acc.observe('api_response_size_bytes', (endpoint,), size)
+    acc.observe('api_db_queries_per_request', (endpoint,), stats.queries)
+    acc.inc('api_db_query_duration_seconds_total', (endpoint,), stats.query_seconds)
+    collector().maybe_start()
+
+
+def google_target(url):
+    """Short label for a Google endpoint URL."""
+    targets = {
+        settings.GOOGLE_TOKEN_URL: 'token',
+        settings.GOOGLE_USERINFO_URL: 'userinfo',
+        settings.GOOGLE_JWKS_URL: 'jwks',
+    }
+    return targets.get(url) or urlsplit(url).netloc
+
+
+def record_google_call(url, seconds, error):
+    accumulator().observe(
+        'google_request_duration_seconds', (google_target(url), 'error' if error else 'ok'), seconds
+    )
+
+
+def begin_request():
+    """Start counting the current request's queries; pass the result to end_request."""
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(started):
+    """Stop counting queries and return the request's RequestStats."""
+    stats, token = started
+    _request_stats.reset(token)
+    return stats
+
+
+class MultiprocessCollector:
+    """
+    Shares metric totals between worker processes through files in a directory.
+    Each process owns one file, replaced atomically on every flush; files of
+    exited workers are kept so counters never go backwards. Clear the
+    directory when the server (re)starts, e.g. in gunicorn's on_starting hook.
+    """
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f"worker-{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        self._started = False
+        self._lock = threading.Lock()
+
+    def maybe_start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._run, name='metrics-flusher', daemon=True).start()
+            atexit.register(self.flush)
+            self._started = True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Could not write metrics to %s", self.path)
+
+    def flush(self):
+        values = {
+            name: [[list(labels), value] for labels, value in series.items()]
+            for name, series in process_values().items()
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(values, f)
+        os.replace(tmp_path, self.path)
+
+    def collect(self):
+        """Totals across every worker's file, with this process's own up to date."""
+        self.flush()
+        totals = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                continue  # Removed or being replaced meanwhile
+            merge(totals, {
+                name: {tuple(labels): value for labels, value in series}
+                for name, series in values.items()
+            })
+        return totals
+
+
+class LocalCollector:
+    """Single-process collector used when METRICS_MULTIPROC_DIR is not set."""
+
+    def maybe_start(self):
+        pass
+
+    def collect(self):
+        return process_values()
+
+
+_collector = None
+_collector_pid = None
+
+
+def collector():
+    """This process's collector; a new one is made after a fork."""
+    global _collector, _collector_pid
+    if _collector is None or _collector_pid != os.getpid():
+        directory = settings.METRICS_MULTIPROC_DIR
+        if directory:
+            _collector = MultiprocessCollector(directory, settings.METRICS_FLUSH_INTERVAL)
+        else:
+            _collector = LocalCollector()
+        _collector_pid = os.getpid()
+    return _collector
+
+
+def clear_multiprocess_dir(directory=None):
+    """Delete the metric files of a previous server run."""
+    directory = directory or settings.METRICS_MULTIPROC_DIR
+    if not directory or not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.startswith('worker-'):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_number(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(values):
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, (kind, help_text, buckets, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(values.get(name, {}).items()):
+            if kind != 'histogram':
+                lines.append(f"{name}{format_labels(label_names, labels)} {format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value[:-1]):
+                cumulative += count
+                le = bound if bound == '+Inf' else format_number(float(bound))
+                lines.append(f"{name}_bucket{format_labels(label_names, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(label_names, labels)} {format_number(value[-1])}")
+            lines.append(f"{name}_count{format_labels(label_names, labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def exposition():
+    return render(collector().collect())
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='conversion',
+            options={'ordering': ['-timestamp', '-id'], 'verbose_name': 'Conversion', 'verbose_name_plural': 'Conversions'},
+        ),
+        migrations.AddIndex(
+            model_name='conversion',
+            index=models.Index(fields=['user', '-timestamp', '-id'], include=('meters_value', 'feet_value', 'ip_address'), name='conversion_user_ts_idx'),
+        ),
+        migrations.AlterField(
+            model_name='conversion',
+            name='user',
+            field=models.ForeignKey(db_index=False, help_text='User who performed the conversion', on_delete=django.db.models.deletion.CASCADE, related_name='conversions', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
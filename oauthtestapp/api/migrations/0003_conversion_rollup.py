@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    """Build a rollup row for every user that already has conversions."""
+    Conversion = apps.get_model('api', 'Conversion')
+    ConversionRollup = apps.get_model('api', 'ConversionRollup')
+
+    totals = (
+        Conversion.objects.order_by()
+        .values('user_id')
+        .annotate(
+            total_conversions=Count('id'),
+            total_meters=Sum('meters_value'),
+            total_feet=Sum('feet_value'),
+            min_meters=Min('meters_value'),
+            max_meters=Max('meters_value'),
+            min_feet=Min('feet_value'),
+            max_feet=Max('feet_value'),
+        )
+    )
+    rollups = []
+    for row in totals.iterator():
+        latest = Conversion.objects.filter(user_id=row['user_id']).order_by('-timestamp', '-id').first()
+        rollups.append(ConversionRollup(
+            latest_conversion_id=latest.id,
+            latest_meters=latest.meters_value,
+            latest_feet=latest.feet_value,
+            latest_timestamp=latest.timestamp,
+            **row,
+        ))
+    ConversionRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_conversion_user_timestamp_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversionRollup',
+            fields=[
+                ('user', models.OneToOneField(help_text='User the rollup belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='conversion_rollup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_conversions', models.PositiveBigIntegerField(default=0)),
+                ('total_meters', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('total_feet', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('min_meters', models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True)),
+                ('max_meters', models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True)),
+                ('min_feet', models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True)),
+                ('max_feet', models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True)),
+                ('latest_conversion_id', models.BigIntegerField(blank=True, help_text='Id of the most recent conversion', null=True)),
+                ('latest_meters', models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True)),
+                ('latest_feet', models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True)),
+                ('latest_timestamp', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Conversion rollup',
+                'verbose_name_plural': 'Conversion rollups',
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
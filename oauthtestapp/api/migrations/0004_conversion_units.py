@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+from api.migration_operations import AddIndexConcurrently, RemoveIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the unit columns and rebuilds the covering history index to
+    include them, dropping and creating it concurrently so writes are not
+    blocked on PostgreSQL.
+    """
+    atomic = False
+
+    dependencies = [
+        ('api', '0003_conversion_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='conversion',
+            name='conversion_user_ts_idx',
+        ),
+        migrations.AddField(
+            model_name='conversion',
+            name='from_unit',
+            field=models.CharField(default='meter', help_text='Unit of meters_value (a key of api.units.UNITS)', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='conversion',
+            name='to_unit',
+            field=models.CharField(default='foot', help_text='Unit of feet_value (a key of api.units.UNITS)', max_length=32),
+        ),
+        AddIndexConcurrently(
+            model_name='conversion',
+            index=models.Index(fields=['user', '-timestamp', '-id'], include=('meters_value', 'feet_value', 'ip_address', 'from_unit', 'to_unit'), name='conversion_user_ts_idx'),
+        ),
+    ]
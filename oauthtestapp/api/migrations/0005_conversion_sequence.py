@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_sequences(apps, schema_editor):
+    """Number every user's existing conversions oldest first and set their counters."""
+    Conversion = apps.get_model('api', 'Conversion')
+    ConversionSequence = apps.get_model('api', 'ConversionSequence')
+
+    counters = []
+    user_ids = Conversion.objects.order_by().values_list('user_id', flat=True).distinct()
+    for user_id in user_ids.iterator():
+        ids = Conversion.objects.filter(user_id=user_id).order_by('timestamp', 'id').values_list('id', flat=True)
+        numbered = [Conversion(id=pk, sequence=sequence) for sequence, pk in enumerate(ids.iterator(), start=1)]
+        Conversion.objects.bulk_update(numbered, ['sequence'], batch_size=1000)
+        counters.append(ConversionSequence(user_id=user_id, last_sequence=len(numbered)))
+    ConversionSequence.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_conversion_units'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversion',
+            name='sequence',
+            field=models.PositiveBigIntegerField(help_text='Per-user change sequence number, assigned by Conversion.objects.record()', null=True),
+        ),
+        migrations.CreateModel(
+            name='ConversionSequence',
+            fields=[
+                ('user', models.OneToOneField(help_text='User the counter belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='conversion_sequence', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_sequence', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Conversion sequence',
+                'verbose_name_plural': 'Conversion sequences',
+            },
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Kept apart from 0005 so the backfill's updates are committed before the table is altered."""
+
+    dependencies = [
+        ('api', '0005_conversion_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversion',
+            name='sequence',
+            field=models.PositiveBigIntegerField(help_text='Per-user change sequence number, assigned by Conversion.objects.record()'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversion',
+            constraint=models.UniqueConstraint(fields=('user', 'sequence'), name='conversion_user_sequence_uniq'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    First step of moving conversion values to integer columns: add the
+    micrometer/microfeet columns and let the NUMERIC ones go NULL, so both
+    the previous release (NUMERIC only) and the next one (integers only)
+    can insert rows while 0008 and 0009 copy the values over.
+    """
+
+    dependencies = [
+        ('api', '0006_conversion_sequence_constraint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversion',
+            name='meters_value',
+            field=models.DecimalField(decimal_places=6, help_text='Input value in meters', max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='conversion',
+            name='feet_value',
+            field=models.DecimalField(decimal_places=6, help_text='Converted value in feet', max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversion',
+            name='meters_micros',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='conversion',
+            name='feet_micros',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:12
+
+from django.db import migrations, models, transaction
+from django.db.models.functions import Cast, Round
+
+# Rows (by id range) copied per transaction
+BACKFILL_CHUNK_SIZE = 10000
+
+
+def to_micros(field_name):
+    return Cast(Round(models.F(field_name) * 1000000), models.BigIntegerField())
+
+
+def from_micros(field_name):
+    # Exact: values have at most 10 significant digits, well within a double
+    return Cast(models.F(field_name), models.FloatField()) / 1000000
+
+
+def copy_in_chunks(schema_editor, conversions, pending, **values):
+    """
+    Update the pending rows with values, one short transaction per
+    BACKFILL_CHUNK_SIZE ids, so no lock is held for long while the app
+    keeps serving.
+    """
+    bounds = conversions.aggregate(first=models.Min('id'), last=models.Max('id'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BACKFILL_CHUNK_SIZE):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            pending.filter(id__gte=start, id__lt=start + BACKFILL_CHUNK_SIZE).update(**values)
+
+
+def backfill_micros(apps, schema_editor):
+    """
+    Copy NUMERIC values into the integer columns. Only rows without integer
+    values are touched, so it is safe to run again.
+    """
+    Conversion = apps.get_model('api', 'Conversion')
+    conversions = Conversion.objects.using(schema_editor.connection.alias)
+    copy_in_chunks(
+        schema_editor,
+        conversions,
+        conversions.filter(meters_micros__isnull=True, meters_value__isnull=False),
+        meters_micros=to_micros('meters_value'),
+        feet_micros=to_micros('feet_value'),
+    )
+
+
+def backfill_numeric(apps, schema_editor):
+    """
+    Reverse of backfill_micros: copy integer values back into the NUMERIC
+    columns of rows that have none (saved by a release that only writes the
+    integer columns), so unapplying 0007 can make them NOT NULL again.
+    """
+    Conversion = apps.get_model('api', 'Conversion')
+    conversions = Conversion.objects.using(schema_editor.connection.alias)
+    copy_in_chunks(
+        schema_editor,
+        conversions,
+        conversions.filter(meters_value__isnull=True, meters_micros__isnull=False),
+        meters_value=from_micros('meters_micros'),
+        feet_value=from_micros('feet_micros'),
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Can run (python manage.py migrate api 0008) while the previous release
+    is serving; every chunk commits on its own.
+    """
+    atomic = False
+
+    dependencies = [
+        ('api', '0007_conversion_micros'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_micros, backfill_numeric),
+    ]
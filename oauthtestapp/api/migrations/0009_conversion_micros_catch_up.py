@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:12
+
+from importlib import import_module
+
+from django.db import migrations
+
+backfill = import_module('api.migrations.0008_conversion_micros_backfill')
+
+
+class Migration(migrations.Migration):
+    """
+    Copies the values of rows the previous release inserted after 0008 ran.
+    Run it once no worker of the previous release is left. Unapplying it
+    copies the values of rows this release inserted back to NUMERIC.
+    """
+    atomic = False
+
+    dependencies = [
+        ('api', '0008_conversion_micros_backfill'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill.backfill_micros, backfill.backfill_numeric),
+    ]
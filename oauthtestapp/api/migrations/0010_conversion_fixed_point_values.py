@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:12
+
+import api.fields
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Drops the NUMERIC columns and makes the integer columns the storage of
+    meters_value and feet_value. Kept apart from 0009 so the catch-up's
+    updates are committed before the table is altered.
+    """
+
+    dependencies = [
+        ('api', '0009_conversion_micros_catch_up'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Its included columns are being replaced; 0011 builds it again
+        migrations.RemoveIndex(
+            model_name='conversion',
+            name='conversion_user_ts_idx',
+        ),
+        migrations.RemoveField(
+            model_name='conversion',
+            name='meters_value',
+        ),
+        migrations.RemoveField(
+            model_name='conversion',
+            name='feet_value',
+        ),
+        migrations.AlterField(
+            model_name='conversion',
+            name='meters_micros',
+            field=api.fields.FixedPointDecimalField(db_column='meters_micros', decimal_places=6, help_text='Input value in meters, stored as micrometers', max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='conversion',
+            name='feet_micros',
+            field=api.fields.FixedPointDecimalField(db_column='feet_micros', decimal_places=6, help_text='Converted value in feet, stored as microfeet', max_digits=10),
+        ),
+        migrations.RenameField(
+            model_name='conversion',
+            old_name='meters_micros',
+            new_name='meters_value',
+        ),
+        migrations.RenameField(
+            model_name='conversion',
+            old_name='feet_micros',
+            new_name='feet_value',
+        ),
+    ]
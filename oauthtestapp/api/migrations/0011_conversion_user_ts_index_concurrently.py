@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:12
+
+from django.db import migrations, models
+
+from api.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    """
+    Rebuilds the covering history index over the integer columns without
+    blocking writes. If the build fails, PostgreSQL leaves an INVALID index
+    behind: drop it and run the migration again.
+    """
+    atomic = False
+
+    dependencies = [
+        ('api', '0010_conversion_fixed_point_values'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='conversion',
+            index=models.Index(fields=['user', '-timestamp', '-id'], include=['meters_value', 'feet_value', 'ip_address', 'from_unit', 'to_unit'], name='conversion_user_ts_idx'),
+        ),
+    ]
@@ -1,28 +1,86 @@
-from django.db import models
+from collections import defaultdict
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
+from django.dispatch import Signal
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest, Least
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from . import units
+from .fields import FixedPointDecimalField
+
 # Create your models here.
 
+# Sent with conversions=[...] once the transaction that saved them commits
+conversions_recorded = Signal()
+
+class ConversionQuerySet(models.QuerySet):
+    def meters_to_feet(self):
+        """Only meters→feet conversions, the ones stats and rollups cover."""
+        return self.filter(
+            from_unit=Conversion.DEFAULT_FROM_UNIT,
+            to_unit=Conversion.DEFAULT_TO_UNIT,
+        )
+
+class ConversionManager(models.Manager.from_queryset(ConversionQuerySet)):
+    def record(self, conversions):
+        """
+        Insert conversions with a single bulk INSERT and fold them into the
+        per-user rollups in the same transaction.
+        All code paths that save new conversions should go through here so
+        ConversionRollup stays in sync with the raw table and the feed
+        (conversions_recorded) sees every new row.
+        """
+        with transaction.atomic():
+            ConversionSequence.objects.assign(conversions)
+            conversions = self.bulk_create(conversions)
+            by_user = defaultdict(list)
+            for conversion in conversions:
+                if conversion.is_meters_to_feet:
+                    by_user[conversion.user_id].append(conversion)
+            for user_id, user_conversions in by_user.items():
+                ConversionRollup.objects.add(user_id, user_conversions)
+            transaction.on_commit(partial(conversions_recorded.send, sender=Conversion, conversions=conversions))
+        return conversions
+    
+    async def arecord(self, conversions):
+        """
+        Async version of record(). Transactions are not available in async
+        code, so the insert and rollup update run together in a worker thread.
+        """
+        return await sync_to_async(self.record)(conversions)
+
 class Conversion(models.Model):
     """
-    Model to store meter-to-feet conversion history
+    Model to store conversion history.
+    meters_value/feet_value hold the input and output values; for conversions
+    other than meters to feet the actual units are in from_unit/to_unit.
+    Both are Decimals stored as integer millionths (see api/fields.py).
     """
+    DEFAULT_FROM_UNIT = 'meter'
+    DEFAULT_TO_UNIT = 'foot'
+    
+
     user = models.ForeignKey(
         User, 
         on_delete=models.CASCADE, 
         related_name='conversions',
+        db_index=False,  # Covered by conversion_user_ts_idx
         help_text="User who performed the conversion"
     )
-    meters_value = models.DecimalField(
+    meters_value = FixedPointDecimalField(
         max_digits=10, 
         decimal_places=6,
-        help_text="Input value in meters"
+        db_column='meters_micros',
+        help_text="Input value in meters, stored as micrometers"
     )
-    feet_value = models.DecimalField(
+    feet_value = FixedPointDecimalField(
         max_digits=10, 
         decimal_places=6,
-        help_text="Converted value in feet"
+        db_column='feet_micros',
+        help_text="Converted value in feet, stored as microfeet"
     )
     timestamp = models.DateTimeField(
         default=timezone.now,
@@ -33,16 +91,256 @@ class Conversion(models.Model):
         blank=True,
         help_text="IP address of the user (optional)"
     )
+    from_unit = models.CharField(
+        max_length=32,
+        default=DEFAULT_FROM_UNIT,
+        help_text="Unit of meters_value (a key of api.units.UNITS)"
+    )
+    to_unit = models.CharField(
+        max_length=32,
+        default=DEFAULT_TO_UNIT,
+        help_text="Unit of feet_value (a key of api.units.UNITS)"
+    )
+    sequence = models.PositiveBigIntegerField(
+        help_text="Per-user change sequence number, assigned by Conversion.objects.record()"
+    )
+    
+    objects = ConversionManager()
     
     class Meta:
-        ordering = ['-timestamp']  # Most recent first
+        ordering = ['-timestamp', '-id']  # Most recent first
+        indexes = [
+            # Serves history, stats and latest-conversion lookups: filter by
+            # user, walk newest first. On PostgreSQL the included columns make
+            # it a covering index, so history pages and stats aggregates can be
+            # answered with an index-only scan.
+            models.Index(
+                fields=['user', '-timestamp', '-id'],
+                name='conversion_user_ts_idx',
+                include=['meters_value', 'feet_value', 'ip_address', 'from_unit', 'to_unit'],
+            ),
+        ]
+        constraints = [
+            # Serves delta sync (changes after a sequence number) and the
+            # latest-sequence lookup that versions history and stats ETags
+            models.UniqueConstraint(fields=['user', 'sequence'], name='conversion_user_sequence_uniq'),
+        ]
         verbose_name = "Conversion"
         verbose_name_plural = "Conversions"
     
     def __str__(self):
-        return f"{self.user.username}: {self.meters_value}m → {self.feet_value}ft"
+        return (
+            f"{self.user.username}: {self.meters_value} {units.UNITS[self.from_unit].symbol} → "
+            f"{self.feet_value} {units.UNITS[self.to_unit].symbol}"
+        )
+    
+    @property
+    def is_meters_to_feet(self):
+        return self.from_unit == self.DEFAULT_FROM_UNIT and self.to_unit == self.DEFAULT_TO_UNIT
     
     @property
     def conversion_formula_used(self):
         """Return the conversion formula for reference"""
-        return "feet = meters × 3.28084"
+        return units.formula(self.from_unit, self.to_unit)
+
+
+class ConversionSequenceManager(models.Manager):
+    def allocate(self, user_id, count):
+        """
+        Reserve count sequence numbers for a user and return the first.
+        The relative UPDATE locks the user's counter row until the
+        transaction ends, so a user's conversions commit in sequence order
+        and a reader never sees sequence n + 1 before n.
+        """
+        updated = self.filter(user_id=user_id).update(last_sequence=F('last_sequence') + count)
+        if updated:
+            return self.filter(user_id=user_id).values_list('last_sequence', flat=True).get() - count + 1
+        
+        try:
+            with transaction.atomic():
+                self.create(user_id=user_id, last_sequence=count)
+            return 1
+        except IntegrityError:
+            # Another transaction created the row first
+            return self.allocate(user_id, count)
+    
+    def assign(self, conversions):
+        """
+        Set the sequence of unsaved conversions, in order. Must run in the
+        transaction that inserts them.
+        """
+        by_user = defaultdict(list)
+        for conversion in conversions:
+            by_user[conversion.user_id].append(conversion)
+        # Counter rows are locked in user id order, so concurrent writers can't deadlock
+        for user_id in sorted(by_user):
+            user_conversions = by_user[user_id]
+            first = self.allocate(user_id, len(user_conversions))
+            for sequence, conversion in enumerate(user_conversions, start=first):
+                conversion.sequence = sequence
+
+class ConversionSequence(models.Model):
+    """
+    Last sequence number given to each user's conversions; see
+    ConversionSequenceManager.allocate().
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='conversion_sequence',
+        help_text="User the counter belongs to"
+    )
+    last_sequence = models.PositiveBigIntegerField(default=0)
+    
+    objects = ConversionSequenceManager()
+    
+    class Meta:
+        verbose_name = "Conversion sequence"
+        verbose_name_plural = "Conversion sequences"
+    
+    def __str__(self):
+        return f"{self.user.username}: {self.last_sequence}"
+
+
+class ConversionRollupManager(models.Manager):
+    def compute(self, user_id):
+        """
+        Compute a user's rollup field values from the raw Conversion table.
+        """
+        conversions = Conversion.objects.filter(user_id=user_id).meters_to_feet()
+        values = conversions.aggregate(
+            total_conversions=models.Count('id'),
+            total_meters=models.Sum('meters_value'),
+            total_feet=models.Sum('feet_value'),
+            min_meters=models.Min('meters_value'),
+            max_meters=models.Max('meters_value'),
+            min_feet=models.Min('feet_value'),
+            max_feet=models.Max('feet_value'),
+        )
+        latest = conversions.first()  # Most recent due to ordering
+        values.update(
+            total_meters=values['total_meters'] or 0,
+            total_feet=values['total_feet'] or 0,
+            latest_conversion_id=latest.id if latest else None,
+            latest_meters=latest.meters_value if latest else None,
+            latest_feet=latest.feet_value if latest else None,
+            latest_timestamp=latest.timestamp if latest else None,
+        )
+        return values
+    
+    def rebuild(self, user_id):
+        """
+        Recompute a user's rollup from the raw table and store it.
+        The rollup row is locked first so concurrent inserts wait and then
+        apply their increments on top of the rebuilt values.
+        """
+        with transaction.atomic():
+            list(self.select_for_update().filter(user_id=user_id))
+            values = self.compute(user_id)
+            if not values['total_conversions']:
+                self.filter(user_id=user_id).delete()
+                return None
+            rollup, _ = self.update_or_create(user_id=user_id, defaults=values)
+            return rollup
+    
+    def add(self, user_id, conversions):
+        """
+        Fold newly inserted conversions of one user into their rollup row.
+        Uses a single relative UPDATE so concurrent writers never lose counts,
+        and creates the row on the user's first conversion.
+        """
+        count = len(conversions)
+        total_meters = sum(c.meters_value for c in conversions)
+        total_feet = sum(c.feet_value for c in conversions)
+        min_meters = min(c.meters_value for c in conversions)
+        max_meters = max(c.meters_value for c in conversions)
+        min_feet = min(c.feet_value for c in conversions)
+        max_feet = max(c.feet_value for c in conversions)
+        latest = max(conversions, key=lambda c: (c.timestamp, c.id))
+        
+        # (latest.timestamp, latest.id) is newer than the stored latest conversion
+        is_newer = Q(latest_timestamp__lt=latest.timestamp) | Q(
+            latest_timestamp=latest.timestamp, latest_conversion_id__lt=latest.id
+        )
+        
+        def newest(field, value):
+            return Case(
+                When(is_newer, then=Value(value)),
+                default=F(field),
+                output_field=self.model._meta.get_field(field),
+            )
+        
+        updated = self.filter(user_id=user_id).update(
+            total_conversions=F('total_conversions') + count,
+            total_meters=F('total_meters') + total_meters,
+            total_feet=F('total_feet') + total_feet,
+            min_meters=Least('min_meters', Value(min_meters)),
+            max_meters=Greatest('max_meters', Value(max_meters)),
+            min_feet=Least('min_feet', Value(min_feet)),
+            max_feet=Greatest('max_feet', Value(max_feet)),
+            latest_conversion_id=newest('latest_conversion_id', latest.id),
+            latest_meters=newest('latest_meters', latest.meters_value),
+            latest_feet=newest('latest_feet', latest.feet_value),
+            latest_timestamp=newest('latest_timestamp', latest.timestamp),
+        )
+        if updated:
+            return
+        
+        try:
+            with transaction.atomic():
+                self.create(
+                    user_id=user_id,
+                    total_conversions=count,
+                    total_meters=total_meters,
+                    total_feet=total_feet,
+                    min_meters=min_meters,
+                    max_meters=max_meters,
+                    min_feet=min_feet,
+                    max_feet=max_feet,
+                    latest_conversion_id=latest.id,
+                    latest_meters=latest.meters_value,
+                    latest_feet=latest.feet_value,
+                    latest_timestamp=latest.timestamp,
+                )
+        except IntegrityError:
+            # Another transaction created the row first
+            self.add(user_id, conversions)
+
+class ConversionRollup(models.Model):
+    """
+    Per-user running totals of the user's meters→feet conversions, maintained incrementally
+    by Conversion.objects.record() so stats never have to scan history.
+    Rebuild or verify with: python manage.py conversion_rollups
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='conversion_rollup',
+        help_text="User the rollup belongs to"
+    )
+    total_conversions = models.PositiveBigIntegerField(default=0)
+    total_meters = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    total_feet = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    min_meters = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    max_meters = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    min_feet = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    max_feet = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    latest_conversion_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Id of the most recent conversion"
+    )
+    latest_meters = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    latest_feet = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    latest_timestamp = models.DateTimeField(null=True, blank=True)
+    
+    objects = ConversionRollupManager()
+    
+    class Meta:
+        verbose_name = "Conversion rollup"
+        verbose_name_plural = "Conversion rollups"
+    
+    def __str__(self):
+        return f"{self.user.username}: {self.total_conversions} conversion(s)"
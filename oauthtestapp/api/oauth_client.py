@@ -0,0 +1,319 @@
+"""
+Shared, per-process HTTP client for Google OAuth calls.
+
+A single requests.Session is reused for every call so TCP+TLS connections to
+Google are pooled and kept alive between logins. Every request gets bounded
+connect/read timeouts, idempotent requests are retried with backoff, and a
+circuit breaker fails fast while Google is unreachable.
+
+AsyncOAuthHTTPClient is the asyncio counterpart used by the async views; it
+needs the optional httpx package.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `threshold` consecutive failures the circuit opens and calls fail
+    immediately for `reset_timeout` seconds. After that a single trial call is
+    let through (half-open); its outcome closes or re-opens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == self.OPEN or (state == self.HALF_OPEN and self.trial_in_progress):
+                raise CircuitOpenError("Circuit breaker is open for Google OAuth calls")
+            if state == self.HALF_OPEN:
+                self.trial_in_progress = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyRecorder:
+    """Keeps call counts and a window of recent latencies for percentile metrics."""
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=False):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.errors += int(error)
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self.samples)
+            count, errors = self.count, self.errors
+            total, maximum = self.total_seconds, self.max_seconds
+
+        def percentile(p):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            "requests": count,
+            "errors": errors,
+            "avg_ms": round(total / count * 1000, 2) if count else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(maximum * 1000, 2) if count else None,
+        }
+
+
+class OAuthHTTPClient:
+    """
+    Pooled, keep-alive HTTP client with timeouts, retries and a circuit breaker.
+    """
+
+    def __init__(self, connect_timeout, read_timeout, pool_size, max_retries,
+                 breaker_threshold, breaker_reset_timeout):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            # Only idempotent calls are retried once a request may have been sent;
+            # the authorization-code exchange (POST) must not be replayed.
+            allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.adapter = adapter
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+        self.latency = LatencyRecorder()
+
+    def request(self, method, url, **kwargs):
+        self.breaker.before_call()
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except BaseException:
+            # Any exit without a response has to settle the breaker, otherwise
+            # a half-open trial that raised something other than a
+            # RequestException would keep the circuit shut for good.
+            self.record(url, time.perf_counter() - start, error=True)
+            self.breaker.record_failure()
+            raise
+
+        failed = response.status_code >= 500
+        self.record(url, time.perf_counter() - start, error=failed)
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def record(self, url, seconds, error):
+        self.latency.record(seconds, error=error)
+        metrics.record_google_call(url, seconds, error)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def metrics(self):
+        """Return connection pool, latency and circuit breaker metrics."""
+        pools = {}
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                # The pool queue is pre-filled with None placeholders for unopened slots
+                "idle_connections": sum(
+                    1 for conn in list(pool.pool.queue) if conn is not None
+                ) if pool.pool is not None else 0,
+                "max_size": self.adapter._pool_maxsize,
+            }
+        return {
+            "pools": pools,
+            "latency": self.latency.snapshot(),
+            "circuit_breaker": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+            },
+        }
+
+
+class AsyncOAuthHTTPClient:
+    """
+    Asyncio version of OAuthHTTPClient built on a pooled httpx.AsyncClient.
+    Same timeouts, retry policy and circuit breaker semantics.
+    """
+    RETRY_STATUSES = (502, 503, 504)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, connect_timeout, read_timeout, pool_size, max_retries,
+                 breaker_threshold, breaker_reset_timeout):
+        import httpx
+
+        self.httpx = httpx
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(
+                # Transport-level retries only cover failed connection attempts,
+                # which are safe for every method
+                retries=max_retries,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            ),
+        )
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+        self.latency = LatencyRecorder()
+
+    async def request(self, method, url, **kwargs):
+        self.breaker.before_call()
+        retryable = method in self.IDEMPOTENT_METHODS
+        start = time.perf_counter()
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = not retryable or attempt == self.max_retries
+                try:
+                    response = await self.client.request(method, url, **kwargs)
+                except self.httpx.HTTPError:
+                    if last_attempt:
+                        raise
+                else:
+                    if last_attempt or response.status_code not in self.RETRY_STATUSES:
+                        break
+                await asyncio.sleep(0.2 * 2 ** attempt)
+        except BaseException:
+            # Includes cancellation while awaiting the request or the backoff;
+            # a half-open trial must always be settled.
+            self.record(url, time.perf_counter() - start, error=True)
+            self.breaker.record_failure()
+            raise
+
+        failed = response.status_code >= 500
+        self.record(url, time.perf_counter() - start, error=failed)
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def record(self, url, seconds, error):
+        self.latency.record(seconds, error=error)
+        metrics.record_google_call(url, seconds, error)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+
+def _client_settings():
+    return dict(
+        connect_timeout=settings.GOOGLE_HTTP_CONNECT_TIMEOUT,
+        read_timeout=settings.GOOGLE_HTTP_READ_TIMEOUT,
+        pool_size=settings.GOOGLE_HTTP_POOL_SIZE,
+        max_retries=settings.GOOGLE_HTTP_MAX_RETRIES,
+        breaker_threshold=settings.GOOGLE_HTTP_BREAKER_THRESHOLD,
+        breaker_reset_timeout=settings.GOOGLE_HTTP_BREAKER_RESET_TIMEOUT,
+    )
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_oauth_client():
+    """
+    Return this process's shared OAuthHTTPClient, creating it on first use.
+    A new client is created after a fork so gunicorn workers never share sockets.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = OAuthHTTPClient(**_client_settings())
+                _client_pid = pid
+    return _client
+
+
+# httpx.AsyncClient is bound to the event loop it was first used on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_oauth_client():
+    """
+    Return the AsyncOAuthHTTPClient for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOAuthHTTPClient(**_client_settings())
+    return client
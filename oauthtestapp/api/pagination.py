@@ -0,0 +1,135 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_NEXT = 'next'
+CURSOR_PREV = 'prev'
+
+# Largest value of the id and sequence columns (signed 64-bit integers)
+MAX_BIGINT = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+class InvalidSyncToken(ValueError):
+    """Raised when a delta-sync token cannot be decoded."""
+
+
+def encode_cursor(conversion, direction):
+    """
+    Encode a (timestamp, id) position and direction as an opaque cursor string.
+    conversion may be a model instance or a .values() row.
+    """
+    if isinstance(conversion, dict):
+        timestamp, pk = conversion['timestamp'], conversion['id']
+    else:
+        timestamp, pk = conversion.timestamp, conversion.id
+    payload = json.dumps({
+        't': timestamp.isoformat(),
+        'i': pk,
+        'd': direction,
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor string into (timestamp, id, direction).
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        timestamp = parse_datetime(payload['t'])
+        pk = payload['i']
+        direction = payload['d']
+    except (ValueError, TypeError, KeyError, OverflowError):
+        raise InvalidCursor("Invalid cursor")
+
+    if timestamp is None or direction not in (CURSOR_NEXT, CURSOR_PREV):
+        raise InvalidCursor("Invalid cursor")
+    # Cursors only ever hold an int id; anything else would reach the database
+    if type(pk) is not int or not 0 <= pk <= MAX_BIGINT:
+        raise InvalidCursor("Invalid cursor")
+    return timestamp, pk, direction
+
+
+def paginate_by_cursor(queryset, cursor, limit):
+    """
+    Keyset-paginate a queryset over the (-timestamp, -id) ordering.
+
+    Returns (rows, next_cursor, prev_cursor). Rows are always in newest-first
+    order regardless of the direction the cursor points in. A page is fetched
+    with limit + 1 rows so the existence of a further page is known without
+    counting.
+    """
+    if cursor:
+        timestamp, pk, direction = decode_cursor(cursor)
+    else:
+        timestamp, pk, direction = None, None, CURSOR_NEXT
+
+    if direction == CURSOR_NEXT:
+        if timestamp is not None:
+            # (timestamp, id) < (t, pk), written so the index range is bounded by timestamp <= t
+            queryset = queryset.filter(
+                Q(timestamp__lte=timestamp) & (Q(timestamp__lt=timestamp) | Q(id__lt=pk))
+            )
+        rows = list(queryset.order_by('-timestamp', '-id')[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        has_next, has_previous = has_more, timestamp is not None
+    else:
+        # (timestamp, id) > (t, pk), walked oldest-first and flipped back
+        queryset = queryset.filter(
+            Q(timestamp__gte=timestamp) & (Q(timestamp__gt=timestamp) | Q(id__gt=pk))
+        )
+        rows = list(queryset.order_by('timestamp', 'id')[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_next, has_previous = True, has_more
+
+    next_cursor = encode_cursor(rows[-1], CURSOR_NEXT) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0], CURSOR_PREV) if rows and has_previous else None
+    return rows, next_cursor, prev_cursor
+
+
+def encode_sync_token(sequence):
+    """Encode a per-user conversion sequence number as an opaque sync token."""
+    payload = json.dumps({'s': sequence}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_sync_token(token):
+    """
+    Decode a sync token into a sequence number.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sequence = json.loads(base64.urlsafe_b64decode(padded.encode()))['s']
+    except (ValueError, TypeError, KeyError, OverflowError):
+        raise InvalidSyncToken("Invalid sync token")
+
+    # Tokens only ever hold an int; json also parses floats, Infinity and NaN
+    if type(sequence) is not int or not 0 <= sequence <= MAX_BIGINT:
+        raise InvalidSyncToken("Invalid sync token")
+    return sequence
+
+
+def changes_since(queryset, token, limit):
+    """
+    Rows of a user's conversion queryset saved after a sync token, in
+    sequence order, walking the (user, sequence) index.
+
+    Returns (rows, next_token, has_more). next_token is the token to send
+    next time; it is unchanged when there is nothing new.
+    """
+    sequence = decode_sync_token(token) if token else 0
+    rows = list(queryset.filter(sequence__gt=sequence).order_by('sequence')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        sequence = rows[-1]['sequence'] if isinstance(rows[-1], dict) else rows[-1].sequence
+    return rows, encode_sync_token(sequence), has_more
@@ -0,0 +1,38 @@
+"""
+JSON parser backed by orjson.
+
+Drop-in replacement for rest_framework.parsers.JSONParser. Bodies orjson
+rejects (including NaN and Infinity literals) are re-parsed by JSONParser, so
+what is accepted, and the error reported for what is not, stay the same.
+Integers beyond 64 bits come back as floats rather than ints. Without orjson
+installed it simply behaves like JSONParser.
+"""
+import io
+
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONParser(JSONParser):
+    """Parses JSON request bodies with orjson when available."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or stream is None:
+            return super().parse(stream, media_type, parser_context)
+
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8').lower()
+        if encoding not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Non-standard literals, or invalid input that should get
+            # JSONParser's error message
+            return super().parse(io.BytesIO(body), media_type, parser_context)
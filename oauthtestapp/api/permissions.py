@@ -0,0 +1,24 @@
+"""
+Access control for operational endpoints.
+"""
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class HasMetricsAccess(BasePermission):
+    """
+    Allows requests that send METRICS_TOKEN as a bearer token or come from an
+    address in METRICS_ALLOWED_IPS. With neither setting, nobody is allowed.
+    The address is REMOTE_ADDR, never X-Forwarded-For, which clients can set.
+    """
+    message = "Metrics access requires the metrics token or an allowed address."
+
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        if token:
+            scheme, _, value = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+            if scheme.lower() == 'bearer' and hmac.compare_digest(value.strip().encode(), token.encode()):
+                return True
+        return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
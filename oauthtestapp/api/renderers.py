@@ -0,0 +1,90 @@
+"""
+JSON renderer backed by orjson.
+
+Drop-in replacement for rest_framework.renderers.JSONRenderer that produces
+the same bytes for the same data. Types orjson would format differently
+(datetimes, Decimals, lazy strings, ...) are handed to DRF's own encoder, and
+any response orjson can't reproduce exactly is rendered by JSONRenderer.
+Without orjson installed it simply behaves like JSONRenderer.
+"""
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson writes 1e-07 as 1e-7, 1e+16 as 1e16 and 1e-05 as 0.00001, where the
+# stdlib uses repr(). Every such float token either has an exponent or is
+# 0.0000..., so only those spots are checked, and only if they start a value.
+EXPONENT = re.compile(rb'e[-0-9]')
+SMALL_FRACTION = b'0.0000'
+VALUE_START = frozenset(b':,[')
+NUMBER_CHARS = frozenset(b'0123456789.-')
+DIGITS = frozenset(b'0123456789')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer using orjson for the common case: compact, UTF-8 output
+    with no indentation requested.
+    One difference remains: orjson writes NaN and infinities as null where
+    JSONRenderer (with STRICT_JSON) raises ValueError.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not self.can_render_fast(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        encoder = self.encoder_class()
+        try:
+            ret = orjson.dumps(
+                data,
+                default=encoder.default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits; let the stdlib path decide
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if float_repr_differs(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping of U+2028/U+2029 as JSONRenderer, for JavaScript compatibility
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+    def can_render_fast(self, accepted_media_type, renderer_context):
+        if orjson is None:
+            return False
+        if self.ensure_ascii or not self.compact:
+            return False
+        renderer_context = renderer_context or {}
+        return self.get_indent(accepted_media_type or '', renderer_context) is None
+
+
+
+def starts_value(ret, index):
+    """True if the number token ending just before index begins a JSON value."""
+    while index > 0 and ret[index - 1] in NUMBER_CHARS:
+        index -= 1
+    return index > 0 and ret[index - 1] in VALUE_START
+
+
+def float_repr_differs(ret):
+    """True if the rendered bytes hold a float orjson formats unlike the stdlib."""
+    for match in EXPONENT.finditer(ret):
+        index = match.start()
+        if index > 0 and ret[index - 1] in DIGITS and starts_value(ret, index):
+            return True
+    index = ret.find(SMALL_FRACTION)
+    while index != -1:
+        if index > 0 and (ret[index - 1] in VALUE_START or (ret[index - 1] == ord('-') and starts_value(ret, index))):
+            return True
+        index = ret.find(SMALL_FRACTION, index + 1)
+    return False
@@ -1,6 +1,11 @@
+from decimal import Decimal
 from django.contrib.auth.models import User
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from .models import Conversion
+from .tokens import RevocableRefreshToken
+from . import units
 
 class UserSerializer(serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
@@ -34,6 +39,10 @@ class UserProfileSerializer(serializers.ModelSerializer):
         """Return the user's full name."""
         return f"{obj.first_name} {obj.last_name}".strip() or obj.username
 
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """TokenRefreshSerializer checking the blacklist through the revocation filter."""
+    token_class = RevocableRefreshToken
+
 class ConversionInputSerializer(serializers.Serializer):
     """Serializer for accepting meter input for conversion."""
     meters = serializers.DecimalField(
@@ -43,6 +52,80 @@ class ConversionInputSerializer(serializers.Serializer):
         help_text="Value in meters to convert to feet"
     )
 
+class ConversionBatchInputSerializer(serializers.Serializer):
+    """Serializer for accepting a list of meter values for batch conversion."""
+    meters = serializers.ListField(
+        child=serializers.DecimalField(
+            max_digits=10,
+            decimal_places=6,
+            min_value=0
+        ),
+        allow_empty=False,
+        help_text="Values in meters to convert to feet"
+    )
+
+    def validate_meters(self, value):
+        """Enforce the configurable batch size cap."""
+        max_size = settings.CONVERSION_BATCH_MAX_SIZE
+        if len(value) > max_size:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {max_size} elements."
+            )
+        return value
+
+class ConversionMultiInputSerializer(serializers.Serializer):
+    """Serializer for converting one value to several units."""
+    value = serializers.DecimalField(
+        max_digits=10,
+        decimal_places=6,
+        min_value=0,
+        help_text="Value to convert"
+    )
+    from_unit = serializers.CharField(help_text="Unit of value (key, symbol or plural)")
+    to_units = serializers.ListField(
+        child=serializers.CharField(),
+        allow_empty=False,
+        help_text="Units to convert to, all of the same dimension as from_unit"
+    )
+
+    def validate_from_unit(self, value):
+        try:
+            return units.resolve_unit(value)
+        except units.UnknownUnit as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate_to_units(self, value):
+        resolved = []
+        for name in value:
+            try:
+                key = units.resolve_unit(name)
+            except units.UnknownUnit as e:
+                raise serializers.ValidationError(str(e))
+            if key not in resolved:
+                resolved.append(key)
+        return resolved
+
+    def validate(self, data):
+        """
+        Check dimensions and convert, so results that don't fit the stored
+        value column are rejected before anything is saved.
+        """
+        value, from_unit = data['value'], data['from_unit']
+        max_value = Decimal(10) ** (Conversion._meta.get_field('feet_value').max_digits - 6)
+        results = []
+        for to_unit in data['to_units']:
+            try:
+                converted_value = units.convert(value, from_unit, to_unit)
+            except units.IncompatibleUnits as e:
+                raise serializers.ValidationError({"to_units": [str(e)]})
+            if converted_value >= max_value:
+                raise serializers.ValidationError({
+                    "to_units": [f"Result in {to_unit} must be less than {max_value}."]
+                })
+            results.append((to_unit, converted_value))
+        data['results'] = results
+        return data
+
 class ConversionSerializer(serializers.ModelSerializer):
     """Serializer for conversion history."""
     user_name = serializers.CharField(source='user.username', read_only=True)
@@ -59,14 +142,122 @@ class ConversionSerializer(serializers.ModelSerializer):
             'user_name',
             'user_full_name',
             'conversion_formula',
-            'ip_address'
+            'ip_address',
+            'from_unit',
+            'to_unit'
         ]
-        read_only_fields = ['id', 'timestamp', 'user_name', 'user_full_name', 'conversion_formula']
+        read_only_fields = ['id', 'timestamp', 'user_name', 'user_full_name', 'conversion_formula', 'from_unit', 'to_unit']
     
     def get_user_full_name(self, obj):
         """Return the user's full name."""
         return f"{obj.user.first_name} {obj.user.last_name}".strip() or obj.user.username
 
+# Columns read by serialize_conversion_history()
+CONVERSION_HISTORY_VALUES = ('id', 'meters_value', 'feet_value', 'timestamp', 'ip_address', 'from_unit', 'to_unit')
+
+# History entry fields in response order, and the columns each one reads
+CONVERSION_HISTORY_FIELDS = {
+    'id': ('id',),
+    'meters_value': ('meters_value',),
+    'feet_value': ('feet_value',),
+    'timestamp': ('timestamp',),
+    'user_name': (),
+    'user_full_name': (),
+    'conversion_formula': ('from_unit', 'to_unit'),
+    'ip_address': ('ip_address',),
+    'from_unit': ('from_unit',),
+    'to_unit': ('to_unit',),
+}
+
+def parse_fields(value, allowed):
+    """
+    Parse a comma-separated ?fields= value into a tuple of field names, in
+    the order of allowed. Returns None for an empty value (all fields);
+    raises ValueError on unknown names.
+    """
+    if not value:
+        return None
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(
+            f"Unknown field(s): {', '.join(sorted(unknown))}. Expected any of: {', '.join(allowed)}"
+        )
+    return tuple(name for name in allowed if name in requested) or None
+
+def history_columns(fields=None):
+    """The .values() columns serialize_conversion_history() needs for fields."""
+    if fields is None:
+        return CONVERSION_HISTORY_VALUES
+    columns = {}
+    for name in fields:
+        columns.update(dict.fromkeys(CONVERSION_HISTORY_FIELDS[name]))
+    return tuple(columns)
+
+# Shared field instances, only used for their to_representation()
+_decimal_field = serializers.DecimalField(max_digits=10, decimal_places=6)
+_datetime_field = serializers.DateTimeField()
+
+def history_field_getters(user):
+    """Field name -> function of a .values() row, for projected history entries."""
+    user_name = user.username
+    user_full_name = f"{user.first_name} {user.last_name}".strip() or user.username
+    decimal = _decimal_field.to_representation
+    datetime = _datetime_field.to_representation
+    formulas = units.FORMULAS
+    return {
+        'id': lambda row: row['id'],
+        'meters_value': lambda row: decimal(row['meters_value']),
+        'feet_value': lambda row: decimal(row['feet_value']),
+        'timestamp': lambda row: datetime(row['timestamp']),
+        'user_name': lambda row: user_name,
+        'user_full_name': lambda row: user_full_name,
+        'conversion_formula': lambda row: formulas[row['from_unit'], row['to_unit']],
+        'ip_address': lambda row: row['ip_address'],
+        'from_unit': lambda row: row['from_unit'],
+        'to_unit': lambda row: row['to_unit'],
+    }
+
+def serialize_conversion_columns(rows, user, fields=None):
+    """
+    Columnar form of serialize_conversion_history(): one list per field,
+    with the values of every row in the same order.
+    """
+    rows = list(rows)
+    getters = history_field_getters(user)
+    return {name: [getters[name](row) for row in rows] for name in fields or CONVERSION_HISTORY_FIELDS}
+
+def serialize_conversion_history(rows, user, fields=None):
+    """
+    Fast equivalent of ConversionSerializer(many=True).data for one user's
+    conversions. rows are dicts from .values(*history_columns(fields));
+    the user-derived fields are computed once instead of per row. fields
+    (from parse_fields()) limits each entry to those fields.
+    """
+    if fields is not None:
+        getters = [(name, getter) for name, getter in history_field_getters(user).items() if name in fields]
+        return [{name: getter(row) for name, getter in getters} for row in rows]
+    user_name = user.username
+    user_full_name = f"{user.first_name} {user.last_name}".strip() or user.username
+    decimal = _decimal_field.to_representation
+    datetime = _datetime_field.to_representation
+    formulas = units.FORMULAS
+    return [
+        {
+            'id': row['id'],
+            'meters_value': decimal(row['meters_value']),
+            'feet_value': decimal(row['feet_value']),
+            'timestamp': datetime(row['timestamp']),
+            'user_name': user_name,
+            'user_full_name': user_full_name,
+            'conversion_formula': formulas[row['from_unit'], row['to_unit']],
+            'ip_address': row['ip_address'],
+            'from_unit': row['from_unit'],
+            'to_unit': row['to_unit'],
+        }
+        for row in rows
+    ]
+
 class ConversionResponseSerializer(serializers.Serializer):
     """Serializer for conversion API response."""
     meters = serializers.DecimalField(max_digits=10, decimal_places=6)
@@ -74,4 +265,34 @@ class ConversionResponseSerializer(serializers.Serializer):
     conversion_id = serializers.IntegerField()
     timestamp = serializers.DateTimeField()
     formula_used = serializers.CharField()
-    message = serializers.CharField()
\ No newline at end of file
+    message = serializers.CharField()
+
+class ConversionResultSerializer(serializers.Serializer):
+    """Serializer for a single item of a batch conversion response."""
+    meters = serializers.DecimalField(max_digits=10, decimal_places=6)
+    feet = serializers.DecimalField(max_digits=10, decimal_places=6)
+    conversion_id = serializers.IntegerField()
+    timestamp = serializers.DateTimeField()
+
+class ConversionBatchResponseSerializer(serializers.Serializer):
+    """Serializer for batch conversion API response."""
+    results = ConversionResultSerializer(many=True)
+    count = serializers.IntegerField()
+    formula_used = serializers.CharField()
+    message = serializers.CharField()
+
+class ConversionMultiResultSerializer(serializers.Serializer):
+    """Serializer for a single target unit of a multi-unit conversion response."""
+    unit = serializers.CharField()
+    value = serializers.DecimalField(max_digits=10, decimal_places=6)
+    formula_used = serializers.CharField()
+    conversion_id = serializers.IntegerField()
+
+class ConversionMultiResponseSerializer(serializers.Serializer):
+    """Serializer for multi-unit conversion API response."""
+    value = serializers.DecimalField(max_digits=10, decimal_places=6)
+    from_unit = serializers.CharField()
+    results = ConversionMultiResultSerializer(many=True)
+    count = serializers.IntegerField()
+    timestamp = serializers.DateTimeField()
+    message = serializers.CharField()
@@ -1,3 +1,1968 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import io
+import json
+import re
+import threading
+import time
+import tracemalloc
+import unittest
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import jwt
+import requests
+from cryptography.hazmat.primitives.asymmetric import rsa
+from allauth.socialaccount.models import SocialAccount
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.db.models import F
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import authentication, export, feed, google, renderers, units, views, write_behind
+from .management.commands.conversion_rollups import ROLLUP_FIELDS
+from .models import Conversion, ConversionRollup
+from .oauth_client import AsyncOAuthHTTPClient, CircuitBreaker, CircuitOpenError, OAuthHTTPClient
+from .pagination import InvalidSyncToken, decode_sync_token, encode_sync_token
+from .parsers import ORJSONParser
+from .renderers import ORJSONRenderer
+from .serializers import CONVERSION_HISTORY_VALUES, ConversionSerializer, serialize_conversion_history
+from .tokens import FeedToken, RevocationFilter
+
+try:
+    import numpy as np
+except ImportError:  # optional, like in api/arrays.py
+    np = None
+
+# The test client talks to 'testserver' over plain HTTP
+api_test_settings = override_settings(ALLOWED_HOSTS=['testserver'], SECURE_SSL_REDIRECT=False)
+
+
+def create_conversions(user, count, start=0, now=None):
+    """Save count meters→feet conversions for user through record(), newest first."""
+    now = now or timezone.now()
+    return Conversion.objects.record([
+        Conversion(
+            user=user,
+            meters_value=Decimal(i) / 100,
+            feet_value=(Decimal(i) / 100 * Decimal('3.28084')).quantize(Decimal('0.000001')),
+            timestamp=now - timedelta(minutes=i),
+            ip_address='127.0.0.1',
+        )
+        for i in range(start, start + count)
+    ])
+
+
+# Plan fragments that mean a query fell back to a full scan or an explicit sort
+BAD_PLAN_PATTERNS = {
+    'postgresql': [
+        re.compile(r'\bSeq Scan\b'),
+        re.compile(r'(^|->)\s*(Incremental )?Sort\b', re.MULTILINE),
+    ],
+    'sqlite': [
+        re.compile(r'\bSCAN api_conversion\b(?! USING)'),
+        re.compile(r'\bUSE TEMP B-TREE FOR ORDER BY\b'),
+    ],
+}
+
+
+@api_test_settings
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every query the conversion endpoints (and deleting a user) run
+    against api_conversion, and fail if one falls back to a sequential scan
+    or a sort instead of an index. On PostgreSQL seqscan and sort are
+    disabled, so the planner picks an index whenever one is usable, even on
+    a small table.
+    """
+    endpoints = [
+        '/api/conversions/history/?limit=50',
+        '/api/conversions/history/?limit=50&offset=100',
+        '/api/conversions/history/?pagination=cursor&limit=50',
+        '/api/conversions/stats/',
+        '/api/conversions/stats/?since=2000-01-01&bucket=hour',
+        '/api/conversions/stats/?bucket=day',
+        '/api/conversions/changes/?limit=50',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='plans')
+        cls.other = User.objects.create_user(username='plans-other')
+        create_conversions(cls.user, 1000)
+        create_conversions(cls.other, 1000)
+
+    def setUp(self):
+        if connection.vendor not in BAD_PLAN_PATTERNS:
+            self.skipTest(f"No plan patterns for {connection.vendor}")
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE api_conversion')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+            else:
+                cursor.execute('ANALYZE')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+
+    def assertIndexedPlans(self, queries, statement='SELECT'):
+        checked = 0
+        for query in queries:
+            sql, params = query
+            if 'api_conversion' not in sql or not sql.lstrip().upper().startswith(statement):
+                continue
+            plan = self.explain(sql, params)
+            for pattern in BAD_PLAN_PATTERNS[connection.vendor]:
+                self.assertIsNone(pattern.search(plan), f"{sql}\n{plan}")
+            checked += 1
+        self.assertGreater(checked, 0, f"No {statement} on api_conversion was run")
+
+    def capture(self, func):
+        """Run func and return the (sql, params) of every query it ran."""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            func()
+        return queries
+
+    def test_endpoints_use_an_index(self):
+        for path in self.endpoints:
+            with self.subTest(path=path):
+                responses = []
+                queries = self.capture(lambda: responses.append(self.client.get(path)))
+                self.assertEqual(responses[0].status_code, 200)
+                self.assertIndexedPlans(queries)
+
+    def test_cursor_pages_use_an_index(self):
+        first = self.client.get('/api/conversions/history/?pagination=cursor&limit=50')
+        next_cursor = first.data['pagination']['next_cursor']
+        queries = self.capture(lambda: self.client.get(f'/api/conversions/history/?cursor={next_cursor}&limit=50'))
+        self.assertIndexedPlans(queries)
+
+    def test_deleting_a_user_uses_an_index(self):
+        queries = self.capture(self.other.delete)
+        self.assertIndexedPlans(queries, statement='DELETE')
+
+
+class StubResponse:
+    def __init__(self, status_code=200, payload=None, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers or {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+
+class StubHTTPClient:
+    """
+    Stand-in for the shared OAuth HTTP clients: answers GETs from `responses`
+    (url -> StubResponse or a function returning one) and counts the calls.
+    With `gate` set, every call waits for it first.
+    """
+
+    def __init__(self, responses, gate=None):
+        self.responses = responses
+        self.gate = gate
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def response_for(self, url, kwargs):
+        with self._lock:
+            self.calls.append((url, kwargs))
+        response = self.responses[url]
+        return response() if callable(response) else response
+
+    def get(self, url, **kwargs):
+        if self.gate is not None:
+            self.gate.wait(5)
+        return self.response_for(url, kwargs)
+
+
+class AsyncStubHTTPClient(StubHTTPClient):
+    async def get(self, url, **kwargs):
+        if self.gate is not None:
+            await self.gate.wait()
+        return self.response_for(url, kwargs)
+
+
+USER_INFO = {'id': '1234', 'email': 'user@example.com', 'verified_email': True, 'name': 'Test User'}
+
+
+@override_settings(GOOGLE_USERINFO_CACHE_TTL=300, GOOGLE_USERINFO_URL='https://google.test/userinfo')
+class GoogleUserInfoCacheTests(SimpleTestCase):
+    def setUp(self):
+        google.userinfo_cache.clear()
+        self.addCleanup(google.userinfo_cache.clear)
+
+    def stub(self, response=None, gate=None, client_class=StubHTTPClient):
+        client = client_class({'https://google.test/userinfo': response or StubResponse(payload=USER_INFO)}, gate)
+        target = 'api.google.get_async_oauth_client' if client_class is AsyncStubHTTPClient else 'api.google.get_oauth_client'
+        patcher = mock.patch(target, return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client
+
+    def test_lookups_are_cached_per_token(self):
+        client = self.stub()
+        first = google.get_google_user_info('token-a')
+        first['email'] = 'changed@example.com'  # Callers get copies
+        self.assertEqual(google.get_google_user_info('token-a'), USER_INFO)
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(client.calls[0][1]['headers'], {'Authorization': 'Bearer token-a'})
+        google.get_google_user_info('token-b')
+        self.assertEqual(len(client.calls), 2)
+
+    def test_raw_tokens_are_not_cache_keys(self):
+        self.stub()
+        google.get_google_user_info('token-a')
+        self.assertNotIn('token-a', repr(list(google.userinfo_cache._entries)))
+
+    def test_failures_are_not_cached(self):
+        client = self.stub(StubResponse(status_code=401))
+        self.assertIsNone(google.get_google_user_info('token-a'))
+        self.assertIsNone(google.get_google_user_info('token-a'))
+        self.assertEqual(len(client.calls), 2)
+
+    def test_entries_expire_after_ttl(self):
+        client = self.stub()
+        with mock.patch('api.google.time.monotonic', return_value=1000.0):
+            google.get_google_user_info('token-a')
+        with mock.patch('api.google.time.monotonic', return_value=1000.0 + google.userinfo_cache.ttl - 1):
+            google.get_google_user_info('token-a')
+        self.assertEqual(len(client.calls), 1)
+        with mock.patch('api.google.time.monotonic', return_value=1000.0 + google.userinfo_cache.ttl):
+            google.get_google_user_info('token-a')
+        self.assertEqual(len(client.calls), 2)
+
+    @override_settings(GOOGLE_USERINFO_CACHE_TTL=0)
+    def test_ttl_zero_disables_the_cache(self):
+        client = self.stub()
+        google.get_google_user_info('token-a')
+        google.get_google_user_info('token-a')
+        self.assertEqual(len(client.calls), 2)
+
+    def test_concurrent_lookups_share_one_call(self):
+        gate = threading.Event()
+        client = self.stub(gate=gate)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(google.get_google_user_info('token-a')))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        # Give every thread time to join the in-flight lookup before it completes
+        time.sleep(0.2)
+        gate.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, [USER_INFO] * 8)
+        self.assertEqual(len(client.calls), 1)
+
+    def test_concurrent_async_lookups_share_one_call(self):
+        async def lookups():
+            gate = asyncio.Event()
+            client = self.stub(gate=gate, client_class=AsyncStubHTTPClient)
+            tasks = [asyncio.create_task(google.get_google_user_info_async('token-a')) for _ in range(8)]
+            await asyncio.sleep(0)
+            gate.set()
+            return client, await asyncio.gather(*tasks)
+
+        client, results = asyncio.run(lookups())
+        self.assertEqual(results, [USER_INFO] * 8)
+        self.assertEqual(len(client.calls), 1)
+        # The async path fills the cache the sync path reads
+        sync_client = self.stub()
+        self.assertEqual(google.get_google_user_info('token-a'), USER_INFO)
+        self.assertEqual(sync_client.calls, [])
+
+
+def generate_signing_key(kid):
+    """A fresh RSA key pair: (private key, public JWK dict with kid)."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    return private_key, {**jwk, 'kid': kid, 'alg': 'RS256', 'use': 'sig'}
+
+
+@override_settings(
+    GOOGLE_OAUTH_CLIENT_ID='client-id.apps.googleusercontent.com',
+    GOOGLE_JWKS_URL='https://google.test/certs',
+    GOOGLE_USERINFO_URL='https://google.test/userinfo',
+)
+class GoogleIDTokenTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key, cls.jwk = generate_signing_key('key-1')
+        cls.rotated_key, cls.rotated_jwk = generate_signing_key('key-2')
+
+    def setUp(self):
+        google.jwks_cache.clear()
+        self.addCleanup(google.jwks_cache.clear)
+        self.published = [self.jwk]
+        self.client_stub = StubHTTPClient({
+            'https://google.test/certs': lambda: StubResponse(
+                payload={'keys': list(self.published)}, headers={'Cache-Control': 'public, max-age=3600'}
+            ),
+            'https://google.test/userinfo': StubResponse(status_code=500),
+        })
+        patcher = mock.patch('api.google.get_oauth_client', return_value=self.client_stub)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_token(self, key=None, kid='key-1', **overrides):
+        now = int(time.time())
+        claims = {
+            'iss': 'https://accounts.google.com',
+            'aud': 'client-id.apps.googleusercontent.com',
+            'sub': '1234567890',
+            'email': 'user@example.com',
+            'email_verified': True,
+            'given_name': 'Test',
+            'family_name': 'User',
+            'iat': now,
+            'exp': now + 3600,
+            **overrides,
+        }
+        return jwt.encode(claims, key or self.key, algorithm='RS256', headers={'kid': kid})
+
+    def jwks_fetches(self):
+        return sum(1 for url, kwargs in self.client_stub.calls if url == 'https://google.test/certs')
+
+    def test_valid_token_returns_userinfo_shaped_claims(self):
+        user_info = google.verify_google_id_token(self.make_token())
+        self.assertEqual(user_info, {
+            'id': '1234567890',
+            'email': 'user@example.com',
+            'verified_email': True,
+            'name': '',
+            'given_name': 'Test',
+            'family_name': 'User',
+            'picture': '',
+        })
+
+    def test_key_set_is_fetched_once(self):
+        for _ in range(3):
+            self.assertIsNotNone(google.verify_google_id_token(self.make_token()))
+        self.assertEqual(self.jwks_fetches(), 1)
+        self.assertEqual(google.jwks_cache.max_age, 3600)
+
+    def test_rejects_wrong_audience(self):
+        self.assertIsNone(google.verify_google_id_token(self.make_token(aud='someone-else.apps.googleusercontent.com')))
+
+    def test_rejects_wrong_issuer(self):
+        self.assertIsNone(google.verify_google_id_token(self.make_token(iss='https://evil.example.com')))
+
+    def test_rejects_expired_token(self):
+        now = int(time.time())
+        expired = self.make_token(iat=now - 7200, exp=now - google.GOOGLE_ID_TOKEN_LEEWAY - 5)
+        self.assertIsNone(google.verify_google_id_token(expired))
+        within_leeway = self.make_token(iat=now - 7200, exp=now - google.GOOGLE_ID_TOKEN_LEEWAY + 5)
+        self.assertIsNotNone(google.verify_google_id_token(within_leeway))
+
+    def test_rejects_missing_claims_and_unverified_email(self):
+        self.assertIsNone(google.verify_google_id_token(self.make_token(email_verified=False)))
+        token = jwt.encode({'aud': 'client-id.apps.googleusercontent.com'}, self.key, algorithm='RS256', headers={'kid': 'key-1'})
+        self.assertIsNone(google.verify_google_id_token(token))
+
+    def test_rejects_token_signed_with_another_key(self):
+        forged = self.make_token(key=self.rotated_key, kid='key-1')
+        self.assertIsNone(google.verify_google_id_token(forged))
+
+    def test_unknown_key_id_refetches_the_key_set(self):
+        self.assertIsNotNone(google.verify_google_id_token(self.make_token()))
+        # Google rotates its keys; the next token is signed with the new one
+        self.published = [self.jwk, self.rotated_jwk]
+        google.jwks_cache.last_attempt -= google.jwks_cache.min_refetch_interval
+        rotated = self.make_token(key=self.rotated_key, kid='key-2')
+        self.assertIsNotNone(google.verify_google_id_token(rotated))
+        self.assertEqual(self.jwks_fetches(), 2)
+
+    def test_unknown_key_ids_do_not_refetch_more_than_once_a_minute(self):
+        self.assertIsNotNone(google.verify_google_id_token(self.make_token()))
+        for _ in range(3):
+            self.assertIsNone(google.verify_google_id_token(self.make_token(key=self.rotated_key, kid='key-9')))
+        self.assertEqual(self.jwks_fetches(), 1)
+
+    def get_signing_keys_concurrently(self, kid, count=8):
+        """Call get_signing_key from `count` threads while Google is slow."""
+        self.client_stub.gate = threading.Event()
+        results = [None] * count
+
+        def worker(i):
+            results[i] = google.jwks_cache.get_signing_key(kid)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.client_stub.gate.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_logins_on_a_cold_cache_share_one_fetch(self):
+        keys = self.get_signing_keys_concurrently('key-1')
+        self.assertTrue(all(key is not None and key.key_id == 'key-1' for key in keys))
+        self.assertEqual(self.jwks_fetches(), 1)
+
+    def test_concurrent_logins_after_a_rotation_share_one_refetch(self):
+        self.assertIsNotNone(google.jwks_cache.get_signing_key('key-1'))
+        self.published = [self.jwk, self.rotated_jwk]
+        google.jwks_cache.last_attempt -= google.jwks_cache.min_refetch_interval
+        keys = self.get_signing_keys_concurrently('key-2')
+        self.assertTrue(all(key is not None and key.key_id == 'key-2' for key in keys))
+        self.assertEqual(self.jwks_fetches(), 2)
+
+    @api_test_settings
+    def test_login_with_id_token_skips_userinfo(self):
+        response = self.client.post(
+            '/api/auth/google/', {'id_token': self.make_token()}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['user']['email'], 'user@example.com')
+        self.assertFalse(any(url == 'https://google.test/userinfo' for url, kwargs in self.client_stub.calls))
+
+    @api_test_settings
+    def test_login_with_invalid_id_token_fails(self):
+        response = self.client.post(
+            '/api/auth/google/', {'id_token': self.make_token(aud='other')}, content_type='application/json'
+        )
+        self.assertGreaterEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+class GoogleUserResolutionTests(TestCase):
+    """get_or_create_user_from_google resolves by uid, then email, then creates."""
+
+    def user_info(self, **overrides):
+        return {
+            'id': 'google-1',
+            'email': 'alice@example.com',
+            'given_name': 'Alice',
+            'family_name': 'Liddell',
+            **overrides,
+        }
+
+    def test_existing_social_account_is_resolved_by_uid(self):
+        user = User.objects.create_user(username='alice', email='old@example.com', last_name='Liddell')
+        SocialAccount.objects.create(user=user, provider='google', uid='google-1')
+        with mock.patch.object(User, 'save', autospec=True, side_effect=User.save) as save:
+            resolved = views.get_or_create_user_from_google(self.user_info())
+        self.assertEqual(resolved, user)
+        # Only the blank field is written back, the email is left alone
+        save.assert_called_once_with(user, update_fields=['first_name'])
+        user.refresh_from_db()
+        self.assertEqual((user.first_name, user.email), ('Alice', 'old@example.com'))
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_unchanged_user_is_not_saved(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com', first_name='A', last_name='L')
+        SocialAccount.objects.create(user=user, provider='google', uid='google-1')
+        with mock.patch.object(User, 'save', autospec=True) as save:
+            self.assertEqual(views.get_or_create_user_from_google(self.user_info()), user)
+        save.assert_not_called()
+
+    def test_email_match_links_the_google_account(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com')
+        resolved = views.get_or_create_user_from_google(self.user_info())
+        self.assertEqual(resolved, user)
+        self.assertEqual(SocialAccount.objects.get(provider='google', uid='google-1').user, user)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_username_collision_gets_the_next_free_suffix(self):
+        for username in ('alice', 'alice1', 'alicex'):
+            User.objects.create_user(username=username, email=f'{username}@other.example.com')
+        self.assertEqual(views.allocate_username('alice'), 'alice2')
+        self.assertEqual(views.allocate_username('bob'), 'bob')
+        user = views.get_or_create_user_from_google(self.user_info())
+        self.assertEqual(user.username, 'alice2')
+        self.assertEqual(user.email, 'alice@example.com')
+
+    def test_concurrent_first_login_retries_and_returns_the_winner(self):
+        # Another request linked this Google account after our uid lookup
+        winner = User.objects.create_user(username='alice', email='alice@example.com')
+        SocialAccount.objects.create(user=winner, provider='google', uid='google-1')
+        select_related = SocialAccount.objects.select_related
+        lookups = []
+
+        def stale_first_lookup(*args):
+            lookups.append(args)
+            if len(lookups) == 1:
+                return SocialAccount.objects.none()
+            return select_related(*args)
+
+        info = self.user_info(email='alice@new.example.com')
+        with mock.patch.object(SocialAccount.objects, 'select_related', side_effect=stale_first_lookup):
+            resolved = views.get_or_create_user_from_google(info)
+        self.assertEqual(resolved, winner)
+        self.assertEqual(len(lookups), 2)
+        # The user created by the losing attempt was rolled back
+        self.assertFalse(User.objects.filter(email='alice@new.example.com').exists())
+        self.assertEqual(SocialAccount.objects.count(), 1)
+
+    def test_gives_up_after_the_attempts_are_spent(self):
+        with mock.patch.object(SocialAccount.objects, 'create', side_effect=IntegrityError):
+            self.assertIsNone(views.get_or_create_user_from_google(self.user_info(), attempts=2))
+        self.assertEqual(User.objects.count(), 0)
+
+
+class CircuitBreakerTrialTests(SimpleTestCase):
+    """A half-open trial must be settled however the request exits."""
+
+    def half_open(self, client):
+        client.breaker.failures = client.breaker.threshold
+        client.breaker.opened_at = time.monotonic() - client.breaker.reset_timeout
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def assertTrialSettled(self, breaker):
+        self.assertFalse(breaker.trial_in_progress)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_sync_trial_is_settled_by_unexpected_exceptions(self):
+        client = OAuthHTTPClient(1, 1, 1, 0, breaker_threshold=2, breaker_reset_timeout=30)
+        self.half_open(client)
+        with mock.patch.object(client.session, 'request', side_effect=ValueError('bad header')):
+            with self.assertRaises(ValueError):
+                client.get('https://google.test/userinfo')
+        self.assertTrialSettled(client.breaker)
+
+    def test_async_trial_is_settled_by_cancellation(self):
+        client = AsyncOAuthHTTPClient(1, 1, 1, 0, breaker_threshold=2, breaker_reset_timeout=30)
+        self.half_open(client)
+
+        async def hang(*args, **kwargs):
+            await asyncio.sleep(60)
+
+        async def cancelled_request():
+            with mock.patch.object(client.client, 'request', side_effect=hang):
+                task = asyncio.ensure_future(client.get('https://google.test/userinfo'))
+                await asyncio.sleep(0)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+        asyncio.run(cancelled_request())
+        self.assertTrialSettled(client.breaker)
+
+    def test_next_call_after_a_settled_trial_is_rejected_until_reset(self):
+        client = OAuthHTTPClient(1, 1, 1, 0, breaker_threshold=2, breaker_reset_timeout=30)
+        self.half_open(client)
+        with mock.patch.object(client.session, 'request', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                client.get('https://google.test/userinfo')
+        with self.assertRaises(CircuitOpenError):
+            client.get('https://google.test/userinfo')
+        self.half_open(client)
+        with mock.patch.object(client.session, 'request', return_value=StubResponse()):
+            client.get('https://google.test/userinfo')
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+
+def npy_header(shape, dtype='<f8', version=(1, 0)):
+    """The bytes of a .npy header declaring shape and dtype, without any data."""
+    buffer = io.BytesIO()
+    header = {'descr': dtype, 'fortran_order': False, 'shape': shape}
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(buffer, header)
+    else:
+        np.lib.format.write_array_header_2_0(buffer, header)
+    return buffer.getvalue()
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+@api_test_settings
+@override_settings(CONVERSION_ARRAY_MAX_ELEMENTS=1000)
+class NpyArrayParserTests(TestCase):
+    url = '/api/conversions/convert/array/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='arrays')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def post(self, body):
+        return self.client.post(self.url, body, content_type='application/x-npy')
+
+    def save(self, array):
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        return buffer.getvalue()
+
+    def test_converts_float64_arrays(self):
+        for dtype in ('<f8', '>f8'):
+            with self.subTest(dtype=dtype):
+                response = self.post(self.save(np.array([1.0, 2.5], dtype=dtype)))
+                self.assertEqual(response.status_code, 200)
+                feet = np.load(io.BytesIO(response.content))
+                np.testing.assert_array_equal(feet, [3.28084, 8.2021])
+
+    def test_accepts_version_2_headers(self):
+        body = npy_header((2,), version=(2, 0)) + np.array([1.0, 2.5]).tobytes()
+        self.assertEqual(self.post(body).status_code, 200)
+
+    def test_rejects_huge_declared_shape_without_loading(self):
+        with mock.patch('numpy.load') as load:
+            response = self.post(npy_header((10 ** 15,)) + b'\0' * 16)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1000', response.json()['detail'])
+        load.assert_not_called()
+
+    def test_rejects_other_dtypes_and_shapes(self):
+        for header in (npy_header((4,), dtype='<i8'), npy_header((4,), dtype='<f4'),
+                       npy_header((2, 2)), npy_header((4,), dtype='|O')):
+            with self.subTest(header=header[:60]):
+                self.assertEqual(self.post(header + b'\0' * 32).status_code, 400)
+
+    def test_rejects_data_that_does_not_match_the_header(self):
+        self.assertEqual(self.post(npy_header((4,)) + b'\0' * 16).status_code, 400)
+        self.assertEqual(self.post(npy_header((1,)) + b'\0' * 16).status_code, 400)
+
+    def test_rejects_garbage(self):
+        self.assertEqual(self.post(b'not an npy file').status_code, 400)
+
+
+@api_test_settings
+class ExportTests(TestCase):
+    url = '/api/conversions/export/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='export')
+        cls.other = User.objects.create_user(username='export-other')
+        cls.now = timezone.now().replace(microsecond=0)
+        create_conversions(cls.user, 30, now=cls.now)
+        create_conversions(cls.other, 5, now=cls.now)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def download(self, query=''):
+        response = self.client.get(f'{self.url}{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def expected_rows(self):
+        return list(
+            Conversion.objects.filter(user=self.user).order_by('-timestamp', '-id')
+            .values_list(*export.EXPORT_FIELDS)
+        )
+
+    def test_csv(self):
+        response, body = self.download()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="conversions.csv"')
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0], list(export.EXPORT_FIELDS))
+        self.assertEqual(rows[1:], [
+            [str(id_), export.format_timestamp(timestamp), str(meters), str(feet), from_unit, to_unit, ip]
+            for id_, timestamp, meters, feet, from_unit, to_unit, ip in self.expected_rows()
+        ])
+
+    def test_ndjson(self):
+        response, body = self.download('?output=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        entries = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(entries, [
+            {
+                'id': id_,
+                'timestamp': export.format_timestamp(timestamp),
+                'meters_value': str(meters),
+                'feet_value': str(feet),
+                'from_unit': from_unit,
+                'to_unit': to_unit,
+                'ip_address': ip,
+            }
+            for id_, timestamp, meters, feet, from_unit, to_unit, ip in self.expected_rows()
+        ])
+
+    def test_gzip_matches_plain_output(self):
+        for output in export.EXPORT_FORMATS:
+            with self.subTest(output=output):
+                _, plain = self.download(f'?output={output}')
+                response, compressed = self.download(f'?output={output}&gzip=true')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_fields_and_time_window(self):
+        since = (self.now - timedelta(minutes=9)).isoformat()
+        _, body = self.download(f'?fields=id,feet_value&since={since}'.replace('+', '%2B'))
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0], ['id', 'feet_value'])
+        self.assertEqual(rows[1:], [[str(id_), str(feet)] for id_, _, _, feet, *_ in self.expected_rows()[:10]])
+
+    def test_rejects_unknown_output(self):
+        response = self.client.get(f'{self.url}?output=xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+@api_test_settings
+class ExportMemoryTests(TestCase):
+    """The export streams: peak memory must not grow with the history size."""
+    rows = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='export-memory')
+        create_conversions(cls.user, cls.rows)
+
+    def test_peak_memory_is_bounded(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        for query in ('', '?output=ndjson', '?gzip=true'):
+            with self.subTest(query=query):
+                lines = size = 0
+                tracemalloc.start()
+                try:
+                    response = client.get(f'/api/conversions/export/{query}')
+                    for chunk in response.streaming_content:
+                        size += len(chunk)
+                        if not query.startswith('?gzip'):
+                            lines += chunk.count(b'\n')
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+                if lines:
+                    self.assertEqual(lines, self.rows + (query == ''))
+                # A fetch batch plus one encoded chunk, far below the whole export
+                self.assertLess(peak, 4 * 1024 * 1024, f"{size} bytes exported")
+
+
+@api_test_settings
+class ConversionHistoryTests(TestCase):
+    url = '/api/conversions/history/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='history', first_name='Ada', last_name='Lovelace')
+        cls.now = timezone.now()
+        create_conversions(cls.user, 120, now=cls.now)
+        Conversion.objects.record([
+            Conversion(user=cls.user, meters_value=Decimal('12.5'), feet_value=Decimal('0.0125'),
+                       from_unit='kilometer', to_unit='meter', timestamp=cls.now + timedelta(seconds=1)),
+            Conversion(user=cls.user, meters_value=Decimal('0.000001'), feet_value=Decimal('0.000003'),
+                       timestamp=cls.now + timedelta(seconds=2), ip_address='2001:db8::1'),
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        # Pin the ETag's own version lookup (tested with the conditional
+        # responses) so only the queries of the page itself are counted
+        patcher = mock.patch('api.conditional.conversions_version', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_offset_page_is_one_query(self):
+        for offset in (0, 50):
+            with self.subTest(offset=offset), self.assertNumQueries(1):
+                response = self.client.get(f'{self.url}?limit=50&offset={offset}')
+            self.assertEqual(len(response.data['conversions']), 50)
+            self.assertEqual(response.data['pagination']['total_count'], 122)
+            self.assertTrue(response.data['pagination']['has_next'])
+
+    def test_offset_past_the_end_still_counts(self):
+        response = self.client.get(f'{self.url}?limit=50&offset=500')
+        self.assertEqual(response.data['conversions'], [])
+        self.assertEqual(response.data['pagination']['total_count'], 122)
+        self.assertFalse(response.data['pagination']['has_next'])
+
+    def test_cursor_page_is_one_query(self):
+        with self.assertNumQueries(1):
+            first = self.client.get(f'{self.url}?pagination=cursor&limit=50')
+        with self.assertNumQueries(1):
+            second = self.client.get(f"{self.url}?cursor={first.data['pagination']['next_cursor']}&limit=50")
+        self.assertEqual(len(first.data['conversions']), 50)
+        self.assertEqual(len(second.data['conversions']), 50)
+        self.assertLess(second.data['conversions'][0]['timestamp'], first.data['conversions'][-1]['timestamp'])
+
+    def test_fast_path_matches_conversion_serializer(self):
+        instances = list(Conversion.objects.filter(user=self.user).order_by('-timestamp', '-id')[:60])
+        rows = list(
+            Conversion.objects.filter(user=self.user).order_by('-timestamp', '-id')
+            .values(*CONVERSION_HISTORY_VALUES)[:60]
+        )
+        expected = ConversionSerializer(instances, many=True).data
+        fast = serialize_conversion_history(rows, self.user)
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            with self.subTest(renderer=type(renderer).__name__):
+                self.assertEqual(renderer.render(fast), renderer.render(expected))
+
+    def test_history_response_matches_conversion_serializer(self):
+        response = self.client.get(f'{self.url}?limit=60')
+        instances = Conversion.objects.filter(user=self.user).order_by('-timestamp', '-id')[:60]
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(response.data['conversions']),
+            renderer.render(ConversionSerializer(instances, many=True).data),
+        )
+
+    def test_unknown_fields_and_layouts_are_rejected(self):
+        for query in ('fields=id,nope', 'fields=password', 'layout=columns', 'pagination=cursor&fields=id,nope'):
+            with self.subTest(query=query):
+                response = self.client.get(f'{self.url}?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], 'Invalid input')
+        response = self.client.get(f'{self.url}?fields=id,nope,password')
+        self.assertIn('Unknown field(s): nope, password', response.data['details'])
+
+    def test_fields_limit_each_entry_in_a_fixed_order(self):
+        response = self.client.get(f'{self.url}?fields=timestamp, id,conversion_formula&limit=5')
+        self.assertEqual(response.status_code, 200)
+        entries = response.data['conversions']
+        self.assertEqual([list(entry) for entry in entries], [['id', 'timestamp', 'conversion_formula']] * 5)
+        full = self.client.get(f'{self.url}?limit=5').data['conversions']
+        self.assertEqual(entries, [{name: entry[name] for name in entries[0]} for entry in full])
+
+    def test_columnar_layout_matches_rows_column_by_column(self):
+        queries = ('limit=30&offset=10', 'limit=30&fields=meters_value,user_full_name,ip_address',
+                   'pagination=cursor&limit=30', 'pagination=cursor&limit=30&fields=id,to_unit')
+        for query in queries:
+            with self.subTest(query=query):
+                rows = self.client.get(f'{self.url}?{query}').data
+                columnar = self.client.get(f'{self.url}?{query}&layout=columnar').data
+                self.assertEqual(list(columnar['conversions']), list(rows['conversions'][0]))
+                for name, column in columnar['conversions'].items():
+                    self.assertEqual(column, [entry[name] for entry in rows['conversions']])
+                self.assertEqual(columnar['pagination'], rows['pagination'])
+
+    def test_fields_and_columnar_keep_pagination_metadata(self):
+        response = self.client.get(f'{self.url}?fields=id&layout=columnar&limit=50&offset=100')
+        self.assertEqual(response.data['pagination'], {
+            'total_count': 122, 'limit': 50, 'offset': 100, 'has_next': False, 'has_previous': True,
+        })
+        self.assertEqual(len(response.data['conversions']['id']), 22)
+
+        first = self.client.get(f'{self.url}?pagination=cursor&fields=id&layout=columnar&limit=100&include_total=true')
+        self.assertEqual(first.data['pagination']['total_count'], 122)
+        self.assertTrue(first.data['pagination']['has_next'])
+        second = self.client.get(
+            f"{self.url}?cursor={first.data['pagination']['next_cursor']}&fields=id&layout=columnar&limit=100"
+        )
+        self.assertFalse(second.data['pagination']['has_next'])
+        self.assertEqual(len(first.data['conversions']['id']) + len(second.data['conversions']['id']), 122)
+        self.assertFalse(set(first.data['conversions']['id']) & set(second.data['conversions']['id']))
+
+
+@unittest.skipIf(renderers.orjson is None, 'orjson is not installed')
+class ORJSONTests(SimpleTestCase):
+    """The orjson renderer and parser must be indistinguishable from DRF's."""
+
+    data = {
+        'meters': Decimal('10.500000'),
+        'feet': Decimal('-0.25'),
+        'aware': datetime(2026, 10, 17, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'naive': datetime(2026, 10, 17, 12, 30),
+        'date': datetime(2026, 10, 17).date(),
+        'missing': None,
+        'rows': [[1, None, Decimal('3.28084')], {'next': None, 'count': 2 ** 40}],
+        'text': 'pieds \u2028 feet',
+    }
+
+    def test_renders_the_same_json_as_json_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        # Nothing here needs the stdlib fallback
+        with mock.patch.object(JSONRenderer, 'render', side_effect=AssertionError('fell back')):
+            rendered = ORJSONRenderer().render(self.data)
+        self.assertEqual(json.loads(rendered), json.loads(expected))
+        self.assertEqual(rendered, expected)
+
+    def test_floats_orjson_formats_differently_fall_back(self):
+        data = {'small': 1e-07, 'big': 1e16, 'fraction': 1e-05, 'micro': Decimal('-0.000001'), 'plain': 0.5}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parses_the_same_as_json_parser(self):
+        body = '{"value": 10.5, "units": ["ft", "in"], "note": null, "text": "pieds é"}'.encode()
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+
+    def test_malformed_bodies_raise_parse_error(self):
+        for body in (b'', b'{"value": ', b'{value: 1}', b'[1, 2,]', b'\xff\xfe', b'{"a": 1} trailing', b'{"value": NaN}'):
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as raised:
+                    ORJSONParser().parse(io.BytesIO(body))
+                with self.assertRaises(ParseError) as expected:
+                    JSONParser().parse(io.BytesIO(body))
+                self.assertEqual(str(raised.exception.detail), str(expected.exception.detail))
+
+
+@override_settings(JWT_USER_CACHE_TTL=30)
+class CachedJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cached', password='first-password')
+
+    def setUp(self):
+        authentication.user_cache.clear()
+        self.addCleanup(authentication.user_cache.clear)
+        self.auth = authentication.CachedJWTAuthentication()
+        self.token = AccessToken.for_user(self.user)
+
+    def get_user(self, token=None):
+        return self.auth.get_user(token or self.token)
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            first = self.get_user()
+        with self.assertNumQueries(0):
+            second = self.get_user()
+        self.assertEqual(first, self.user)
+        # Each request gets its own copy
+        self.assertIsNot(first, second)
+
+    def test_deactivation_invalidates(self):
+        self.get_user()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User is inactive'):
+            self.get_user()
+
+    def test_profile_change_invalidates(self):
+        self.get_user()
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(self.get_user().first_name, 'Changed')
+
+    def test_password_change_invalidates(self):
+        with mock.patch.object(authentication.api_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = AccessToken.for_user(self.user)
+            self.get_user(token)
+            self.user.set_password('second-password')
+            self.user.save()
+            with self.assertRaisesMessage(AuthenticationFailed, "The user's password has been changed."):
+                self.get_user(token)
+
+    def test_deletion_invalidates(self):
+        self.get_user()
+        self.user.delete()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User not found'):
+            self.get_user()
+
+    def test_entries_expire_after_the_ttl(self):
+        self.get_user()
+        # A change that bypasses signals is only picked up once the entry expires
+        User.objects.filter(pk=self.user.pk).update(first_name='Bulk')
+        self.assertEqual(self.get_user().first_name, '')
+        later = time.monotonic() + 31
+        with mock.patch('api.google.time.monotonic', return_value=later):
+            self.assertEqual(self.get_user().first_name, 'Bulk')
+
+    @override_settings(JWT_USER_CACHE_MAX_SIZE=3)
+    def test_versions_are_bounded(self):
+        self.get_user()
+        for user_id in range(1000, 1010):
+            authentication.invalidate_cached_user(user_id)
+            self.assertLessEqual(len(authentication._versions), 3)
+        # Forgetting versions must not bring back an entry cached before a change
+        User.objects.filter(pk=self.user.pk).update(first_name='Bulk')
+        self.assertEqual(self.get_user().first_name, 'Bulk')
+
+    def test_stale_fetch_is_not_served_after_a_change(self):
+        key = authentication.user_cache_key(self.user.pk)
+        stale = User.objects.get(pk=self.user.pk)
+        self.user.is_active = False
+        self.user.save()
+        # A lookup that started before the save finishes after it
+        authentication.user_cache.set(key, stale)
+        with self.assertRaisesMessage(AuthenticationFailed, 'User is inactive'):
+            self.get_user()
+
+
+@override_settings(JWT_USER_CACHE_TTL=30)
+class AsyncJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='async-cached', password='first-password')
+
+    def setUp(self):
+        authentication.user_cache.clear()
+        self.addCleanup(authentication.user_cache.clear)
+        self.auth = authentication.AsyncJWTAuthentication()
+        self.token = AccessToken.for_user(self.user)
+
+    async def test_aauthenticate(self):
+        request = mock.Mock(META={'HTTP_AUTHORIZATION': f'Bearer {self.token}'})
+        user, token = await self.auth.aauthenticate(request)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token['user_id'], str(self.user.pk))
+
+    async def test_shares_the_cache_with_the_sync_class(self):
+        await self.auth.aget_user(self.token)
+        cached = authentication.user_cache.get(authentication.user_cache_key(self.user.pk))
+        self.assertEqual(cached, self.user)
+
+    async def test_deactivation_invalidates(self):
+        await self.auth.aget_user(self.token)
+        self.user.is_active = False
+        await self.user.asave()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User is inactive'):
+            await self.auth.aget_user(self.token)
+
+    async def test_password_change_invalidates(self):
+        with mock.patch.object(authentication.api_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = AccessToken.for_user(self.user)
+            await self.auth.aget_user(token)
+            self.user.set_password('second-password')
+            await self.user.asave()
+            with self.assertRaisesMessage(AuthenticationFailed, "The user's password has been changed."):
+                await self.auth.aget_user(token)
+
+    async def test_deletion_invalidates(self):
+        await self.auth.aget_user(self.token)
+        await self.user.adelete()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User not found'):
+            await self.auth.aget_user(self.token)
+
+    async def test_entries_expire_after_the_ttl(self):
+        await self.auth.aget_user(self.token)
+        await User.objects.filter(pk=self.user.pk).aupdate(first_name='Bulk')
+        self.assertEqual((await self.auth.aget_user(self.token)).first_name, '')
+        later = time.monotonic() + 31
+        with mock.patch('api.google.time.monotonic', return_value=later):
+            self.assertEqual((await self.auth.aget_user(self.token)).first_name, 'Bulk')
+
+
+class RevocationFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='revocation')
+
+    def setUp(self):
+        self.filter = RevocationFilter(capacity=100, error_rate=0.001, sync_interval=5, rebuild_interval=300)
+
+    def blacklist(self, jti, pk=None):
+        token = OutstandingToken.objects.create(
+            user=self.user, jti=jti, token=f'token-{jti}', expires_at=timezone.now() + timedelta(days=1)
+        )
+        return BlacklistedToken.objects.create(id=pk, token=token)
+
+    def test_pulls_new_rows(self):
+        self.blacklist('before')
+        self.filter.sync(force=True)
+        self.blacklist('after')
+        self.filter.sync(force=True)
+        self.assertTrue(self.filter.might_be_revoked('before'))
+        self.assertTrue(self.filter.might_be_revoked('after'))
+        self.assertFalse(self.filter.might_be_revoked('never-revoked'))
+
+    def test_pull_picks_up_rows_that_commit_late(self):
+        self.filter.sync(force=True)
+        self.blacklist('first', pk=10)
+        self.blacklist('third', pk=12)
+        self.filter.sync(force=True)
+        # id 11 was assigned before id 12 but its transaction committed later
+        self.blacklist('second', pk=11)
+        self.filter.sync(force=True)
+        self.assertTrue(self.filter.might_be_revoked('second'))
+
+    def test_repulled_rows_stay_out_of_the_recent_set(self):
+        self.blacklist('old')
+        self.filter.sync(force=True)
+        self.filter.sync(force=True)
+        self.assertEqual(self.filter.metrics()['recent_entries'], 0)
+
+    def test_rebuild_keeps_local_revocations(self):
+        self.filter.sync(force=True)
+        self.filter.add('local-only')
+        self.filter._built_at -= self.filter.rebuild_interval
+        self.filter.sync(force=True)
+        self.assertTrue(self.filter.might_be_revoked('local-only'))
+
+
+@api_test_settings
+class StatelessRouteMiddlewareTests(TestCase):
+    """Session, CSRF, auth and messages middleware skip API_STATELESS_ROUTES only."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='session-user')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_stateless_route_skips_session_and_auth(self):
+        response = self.client.get('/api/conversions/units/')
+        self.assertEqual(response.status_code, 200)
+        request = response.wsgi_request
+        self.assertFalse(hasattr(request, 'session'))
+        self.assertFalse(hasattr(request, '_messages'))
+        # The session cookie is ignored; only DRF's JWT authentication ran
+        self.assertFalse(request.user.is_authenticated)
+        self.assertNotIn('csrftoken', response.cookies)
+
+    def test_other_routes_keep_session_auth_and_csrf(self):
+        response = self.client.get('/admin/login/')
+        request = response.wsgi_request
+        self.assertEqual(request.session['_auth_user_id'], str(self.user.pk))
+        self.assertEqual(request.user, self.user)
+        self.assertTrue(hasattr(request, '_messages'))
+        self.assertIn('csrftoken', response.cookies)
+
+        client = APIClient(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(client.post('/admin/logout/').status_code, 403)
+
+
+@api_test_settings
+class MetricsAccessTests(SimpleTestCase):
+    internal_sections = ('google_oauth_client', 'conversion_buffer', 'token_revocation', 'conversion_feed')
+
+    def test_off_by_default(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        health = self.client.get('/api/health/').json()
+        self.assertEqual(health['status'], 'ok')
+        for section in self.internal_sections:
+            self.assertNotIn(section, health)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'api_requests_total', response.content)
+        health = self.client.get('/api/health/', HTTP_AUTHORIZATION='Bearer scrape-secret').json()
+        for section in self.internal_sections:
+            self.assertIn(section, health)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowed_addresses(self):
+        self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.6').status_code, 403)
+        spoofed = self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.6', HTTP_X_FORWARDED_FOR='10.0.0.5')
+        self.assertEqual(spoofed.status_code, 403)
+
+
+@api_test_settings
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etags', first_name='Grace')
+        create_conversions(cls.user, 20)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def revalidate(self, path):
+        etag = self.client.get(path)['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def test_not_modified_costs_one_query(self):
+        for path in ('/api/conversions/history/?limit=50', '/api/conversions/stats/'):
+            with self.subTest(path=path):
+                etag = self.client.get(path)['ETag']
+                with self.assertNumQueries(1):
+                    response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_profile_not_modified_costs_no_query(self):
+        etag = self.client.get('/api/auth/profile/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_conversion_changes_the_etag(self):
+        paths = ('/api/conversions/history/?limit=50', '/api/conversions/stats/')
+        etags = {path: self.revalidate(path) for path in paths}
+        # Older than every existing row, so only the sequence number moves
+        create_conversions(self.user, 1, now=timezone.now() - timedelta(days=30))
+        for path in paths:
+            with self.subTest(path=path):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etags[path])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etags[path])
+
+    def test_profile_change_changes_the_etag(self):
+        etag = self.revalidate('/api/auth/profile/')
+        self.user.first_name = 'Ada'
+        self.user.save()
+        response = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['first_name'], 'Ada')
+
+    def test_query_string_is_part_of_the_etag(self):
+        etag = self.revalidate('/api/conversions/history/?limit=50')
+        response = self.client.get('/api/conversions/history/?limit=10', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+def raw_sync_token(payload):
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+class SyncTokenTests(SimpleTestCase):
+    def test_round_trip(self):
+        for sequence in (0, 1, 2 ** 63 - 1):
+            self.assertEqual(decode_sync_token(encode_sync_token(sequence)), sequence)
+
+    def test_rejects_malformed_tokens(self):
+        tokens = [
+            'not base64!',
+            raw_sync_token('not json'),
+            raw_sync_token('[1]'),
+            raw_sync_token('{}'),
+            raw_sync_token('{"s":-1}'),
+            raw_sync_token('{"s":Infinity}'),
+            raw_sync_token('{"s":NaN}'),
+            raw_sync_token('{"s":1.5}'),
+            raw_sync_token('{"s":1e400}'),
+            raw_sync_token('{"s":"5"}'),
+            raw_sync_token('{"s":true}'),
+            raw_sync_token('{"s":null}'),
+            raw_sync_token('{"s":%d}' % 2 ** 63),
+        ]
+        for token in tokens:
+            with self.subTest(token=token), self.assertRaises(InvalidSyncToken):
+                decode_sync_token(token)
+
+
+@api_test_settings
+class ConversionChangesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='changes')
+        create_conversions(cls.user, 5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_walks_all_changes(self):
+        first = self.client.get('/api/conversions/changes/?limit=3').json()
+        self.assertEqual(len(first['conversions']), 3)
+        self.assertTrue(first['has_more'])
+        second = self.client.get(f"/api/conversions/changes/?limit=3&since={first['next_token']}").json()
+        self.assertEqual(len(second['conversions']), 2)
+        self.assertFalse(second['has_more'])
+        third = self.client.get(f"/api/conversions/changes/?since={second['next_token']}").json()
+        self.assertEqual(third['conversions'], [])
+        self.assertEqual(third['next_token'], second['next_token'])
+
+    def test_bad_token_is_a_client_error(self):
+        for payload in ('{"s":Infinity}', '{"s":1e400}', '{"s":%d}' % 10 ** 30):
+            with self.subTest(payload=payload):
+                response = self.client.get(f'/api/conversions/changes/?since={raw_sync_token(payload)}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid sync token'})
+
+
+class ConversionStorageMigrationTests(TransactionTestCase):
+    """Moving values to integer columns (0007-0011) works both ways."""
+    before = [('api', '0006_conversion_sequence_constraint')]
+    after = [('api', '0011_conversion_user_ts_index_concurrently')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_forwards_and_backwards(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model('auth', 'User').objects.create(username='migrations')
+        old = apps.get_model('api', 'Conversion').objects.create(
+            user_id=user.pk, meters_value=Decimal('1234.567891'), feet_value=Decimal('4050.420240'), sequence=1
+        )
+
+        apps = self.migrate(self.after)
+        Conversion = apps.get_model('api', 'Conversion')
+        self.assertEqual(
+            Conversion.objects.values_list('meters_value', 'feet_value').get(pk=old.pk),
+            (Decimal('1234.567891'), Decimal('4050.420240')),
+        )
+        new = Conversion.objects.create(
+            user_id=user.pk, meters_value=Decimal('0.000001'), feet_value=Decimal('9999.999999'), sequence=2
+        )
+
+        apps = self.migrate(self.before)
+        self.assertEqual(
+            dict(apps.get_model('api', 'Conversion').objects.values_list('pk', 'feet_value')),
+            {old.pk: Decimal('4050.420240'), new.pk: Decimal('9999.999999')},
+        )
+
+
+@api_test_settings
+@override_settings(CONVERSION_DURABILITY='sync', CONVERSION_BATCH_MAX_SIZE=5)
+class BatchConversionTests(TestCase):
+    url = '/api/conversions/convert/batch/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='batch')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def post(self, meters):
+        return self.client.post(self.url, {'meters': meters}, format='json')
+
+    def test_converts_in_input_order(self):
+        response = self.post(['10.5', 3, '0.25'])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['meters'] for result in results], ['10.500000', '3.000000', '0.250000'])
+        self.assertEqual([result['feet'] for result in results], ['34.448820', '9.842520', '0.820210'])
+        self.assertEqual(
+            [result['conversion_id'] for result in results],
+            list(Conversion.objects.filter(user=self.user).order_by('sequence').values_list('id', flat=True)),
+        )
+
+    def test_rows_are_saved_with_one_insert(self):
+        queries = CaptureQueriesContext(connection)
+        with queries:
+            response = self.post([1, 2, 3, 4, 5])
+        self.assertEqual(response.status_code, 200)
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "api_conversion"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Conversion.objects.filter(user=self.user).count(), 5)
+
+    def test_invalid_items_are_reported_by_index(self):
+        response = self.post([1, -2, 'abc', 4])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['details']['meters']
+        self.assertEqual(sorted(errors), ['1', '2'])
+        self.assertFalse(Conversion.objects.filter(user=self.user).exists())
+
+    def test_over_the_limit_is_rejected(self):
+        response = self.post([1] * 6)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('no more than 5 elements', response.json()['details']['meters'][0])
+        self.assertFalse(Conversion.objects.filter(user=self.user).exists())
+
+    def test_empty_batch_is_rejected(self):
+        self.assertEqual(self.post([]).status_code, 400)
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@api_test_settings
+class UnitsTests(SimpleTestCase):
+    def test_units_resolve_by_key_symbol_or_plural(self):
+        for name in ('foot', 'ft', 'feet', ' FT ', 'Feet'):
+            self.assertEqual(units.resolve_unit(name), 'foot')
+        self.assertEqual(units.resolve_unit('fluid ounces'), 'fluid_ounce')
+        with self.assertRaises(units.UnknownUnit):
+            units.resolve_unit('furlong')
+
+    def test_meters_to_feet_keeps_the_published_factor(self):
+        self.assertEqual(units.factor('meter', 'foot'), Decimal('3.28084'))
+        self.assertEqual(units.convert(Decimal('10'), 'meter', 'foot'), Decimal('32.808400'))
+        self.assertEqual(units.formula('meter', 'foot'), 'feet = meters × 3.28084')
+        # Other pairs use the exact ratio
+        self.assertEqual(units.factor('foot', 'meter'), Decimal('0.3048'))
+        self.assertEqual(units.convert(Decimal('1'), 'kilometer', 'foot'), Decimal('3280.839895'))
+
+    def test_pairs_across_dimensions_or_with_unknown_keys_are_rejected(self):
+        with self.assertRaises(units.IncompatibleUnits):
+            units.factor('meter', 'kilogram')
+        with self.assertRaises(units.UnknownUnit):
+            units.convert(Decimal('1'), 'meter', 'furlong')
+
+
+class MultiUnitConversionTests(TestCase):
+    url = '/api/conversions/convert/multi/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='multi')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def post(self, value, from_unit, to_units):
+        return self.client.post(
+            self.url, {'value': value, 'from_unit': from_unit, 'to_units': to_units}, format='json'
+        )
+
+    def test_aliases_are_resolved_and_saved_by_key(self):
+        response = self.post('10', 'm', ['ft', 'inches', 'Yard', 'feet'])
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual(body['from_unit'], 'meter')
+        self.assertEqual(
+            [(result['unit'], result['value']) for result in body['results']],
+            [('foot', '32.808400'), ('inch', '393.700787'), ('yard', '10.936133')],
+        )
+        self.assertEqual(body['results'][0]['formula_used'], 'feet = meters × 3.28084')
+        self.assertEqual(
+            list(Conversion.objects.order_by('sequence').values_list('from_unit', 'to_unit')),
+            [('meter', 'foot'), ('meter', 'inch'), ('meter', 'yard')],
+        )
+
+    def test_unknown_unit_is_rejected(self):
+        for from_unit, to_units in (('furlong', ['foot']), ('meter', ['foot', 'furlong'])):
+            response = self.post('1', from_unit, to_units)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error'], 'Invalid input')
+            self.assertIn("Unknown unit 'furlong'", json.dumps(response.json()['details']))
+        self.assertFalse(Conversion.objects.exists())
+
+    def test_incompatible_units_are_rejected(self):
+        response = self.post('1', 'meter', ['foot', 'kg'])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Cannot convert length (meter) to mass (kilogram)', json.dumps(response.json()['details']))
+        self.assertFalse(Conversion.objects.exists())
+
+
+class CursorPaginationTests(TestCase):
+    url = '/api/conversions/history/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cursor')
+        now = timezone.now()
+        # Groups of three rows share a timestamp, so ties are broken by id
+        Conversion.objects.record([
+            Conversion(user=cls.user, meters_value=Decimal(i), feet_value=Decimal(i),
+                       timestamp=now - timedelta(minutes=i // 3))
+            for i in range(23)
+        ])
+        cls.expected = list(
+            Conversion.objects.filter(user=cls.user).order_by('-timestamp', '-id').values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def page(self, query):
+        response = self.client.get(f'{self.url}?limit=4&{query}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [entry['id'] for entry in data['conversions']], data['pagination']
+
+    def test_next_then_prev_walks_the_same_pages(self):
+        pages = []
+        ids, pagination = self.page('pagination=cursor')
+        pages.append(ids)
+        self.assertFalse(pagination['has_previous'])
+        while pagination['next_cursor']:
+            ids, pagination = self.page(f"cursor={pagination['next_cursor']}")
+            pages.append(ids)
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual(len(pages[-1]), 23 % 4)
+
+        walked_back = [pages[-1]]
+        while pagination['prev_cursor']:
+            ids, pagination = self.page(f"cursor={pagination['prev_cursor']}")
+            walked_back.append(ids)
+        self.assertEqual(walked_back[::-1], pages)
+        self.assertTrue(pagination['has_next'])
+
+    def test_malformed_cursors_are_rejected(self):
+        timestamp = timezone.now().isoformat()
+        cursors = [
+            'not a cursor!',
+            raw_cursor([1]),
+            raw_cursor({'t': timestamp, 'd': 'next'}),
+            raw_cursor({'t': 'yesterday', 'i': 1, 'd': 'next'}),
+            raw_cursor({'t': timestamp, 'i': 1, 'd': 'sideways'}),
+            raw_cursor({'t': timestamp, 'i': '1', 'd': 'next'}),
+            raw_cursor({'t': timestamp, 'i': 1.5, 'd': 'next'}),
+            raw_cursor({'t': timestamp, 'i': True, 'd': 'next'}),
+            raw_cursor({'t': timestamp, 'i': -1, 'd': 'next'}),
+            raw_cursor({'t': timestamp, 'i': 2 ** 63, 'd': 'next'}),
+            raw_cursor({'t': timestamp, 'i': 10 ** 30, 'd': 'prev'}),
+            raw_cursor({'t': timestamp, 'i': float('inf'), 'd': 'next'}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'{self.url}?cursor={cursor}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+STATS_START = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+@api_test_settings
+class ConversionStatsTests(TestCase):
+    url = '/api/conversions/stats/'
+    # (hours after STATS_START, meters)
+    data = [(0, '1.5'), (0.5, '2'), (1, '0.25'), (5, '10'), (24, '3'), (25.25, '7.125'), (49, '0.000001'), (60, '100')]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='stats')
+        cls.conversions = Conversion.objects.record([
+            Conversion(
+                user=cls.user,
+                meters_value=Decimal(meters),
+                feet_value=(Decimal(meters) * Decimal('3.28084')).quantize(Decimal('0.000001')),
+                timestamp=STATS_START + timedelta(hours=hours),
+            )
+            for hours, meters in cls.data
+        ])
+        # Other units are not part of the stats
+        Conversion.objects.record([Conversion(
+            user=cls.user, meters_value=Decimal('5'), feet_value=Decimal('5000'),
+            from_unit='kilometer', to_unit='meter', timestamp=STATS_START + timedelta(hours=2),
+        )])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get(self, query=''):
+        response = self.client.get(f'{self.url}{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def expected(self, since=None, until=None):
+        rows = [
+            c for c in self.conversions
+            if (since is None or c.timestamp >= since) and (until is None or c.timestamp < until)
+        ]
+        meters = [c.meters_value for c in rows]
+        feet = [c.feet_value for c in rows]
+        latest = max(rows, key=lambda c: c.timestamp)
+        return {
+            'total_conversions': len(rows),
+            'total_meters_converted': float(sum(meters)),
+            'total_feet_converted': float(sum(feet)),
+            'average_meters_per_conversion': float(sum(meters) / len(rows)),
+            'average_feet_per_conversion': float(sum(feet) / len(rows)),
+            'min_meters': float(min(meters)),
+            'max_meters': float(max(meters)),
+            'min_feet': float(min(feet)),
+            'max_feet': float(max(feet)),
+            'latest_conversion': {
+                'meters': float(latest.meters_value),
+                'feet': float(latest.feet_value),
+                'timestamp': latest.timestamp.isoformat().replace('+00:00', 'Z'),
+            },
+            'user': 'stats',
+        }
+
+    def test_whole_history(self):
+        self.assertEqual(self.get(), self.expected())
+
+    def test_rollup_and_aggregate_paths_agree(self):
+        from_rollup = self.get()
+        # Without a rollup row the view falls back to aggregating the table
+        ConversionRollup.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get('?'), from_rollup)
+
+    def test_whole_history_reads_only_the_rollup(self):
+        with mock.patch('api.conditional.conversions_version', return_value=0), self.assertNumQueries(1):
+            self.assertEqual(self.get()['total_conversions'], len(self.data))
+
+    def test_windows(self):
+        windows = [
+            ('?since=2025-01-02', STATS_START + timedelta(days=1), None),
+            ('?until=2025-01-02', None, STATS_START + timedelta(days=1)),
+            # Half-open: a row exactly at since is in, one exactly at until is out
+            ('?since=2025-01-01T01:00:00Z&until=2025-01-02T01:15:00Z',
+             STATS_START + timedelta(hours=1), STATS_START + timedelta(hours=25.25)),
+            ('?since=2025-01-01T05:00:00%2B00:00', STATS_START + timedelta(hours=5), None),
+        ]
+        for query, since, until in windows:
+            with self.subTest(query=query):
+                expected = self.expected(since, until)
+                expected['window'] = {
+                    'since': since and since.isoformat().replace('+00:00', 'Z'),
+                    'until': until and until.isoformat().replace('+00:00', 'Z'),
+                }
+                self.assertEqual(self.get(query), expected)
+
+    def test_empty_window(self):
+        self.assertEqual(self.get('?since=2030-01-01'), {
+            'total_conversions': 0,
+            'message': 'No conversions found for this user',
+        })
+
+    def test_buckets(self):
+        hours = defaultdict(list)
+        days = defaultdict(list)
+        for conversion in self.conversions:
+            hours[conversion.timestamp.replace(minute=0)].append(conversion)
+            days[conversion.timestamp.replace(hour=0, minute=0)].append(conversion)
+        for bucket, groups in (('hour', hours), ('day', days)):
+            with self.subTest(bucket=bucket):
+                data = self.get(f'?bucket={bucket}')
+                self.assertEqual(data['bucket'], bucket)
+                self.assertEqual(data['total_conversions'], len(self.data))
+                self.assertEqual(data['series'], [
+                    {
+                        'bucket': start.isoformat().replace('+00:00', 'Z'),
+                        'count': len(group),
+                        'total_meters': float(sum(c.meters_value for c in group)),
+                        'total_feet': float(sum(c.feet_value for c in group)),
+                    }
+                    for start, group in sorted(groups.items())
+                ])
+
+    def test_bucket_within_a_window(self):
+        data = self.get('?bucket=day&since=2025-01-02&until=2025-01-03')
+        self.assertEqual([row['count'] for row in data['series']], [2])
+
+    def test_invalid_input(self):
+        for query in ('?since=soon', '?until=2025-13-01', '?bucket=week'):
+            with self.subTest(query=query):
+                response = self.client.get(f'{self.url}{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Invalid input')
+
+
+class ConversionRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='rollups')
+        cls.other = User.objects.create_user(username='rollups-other')
+        cls.now = timezone.now()
+
+    def record(self, *values, user=None, **kwargs):
+        """Record conversions of (meters, minutes ago) pairs."""
+        return Conversion.objects.record([
+            Conversion(
+                user=user or self.user,
+                meters_value=Decimal(meters),
+                feet_value=(Decimal(meters) * Decimal('3.28084')).quantize(Decimal('0.000001')),
+                timestamp=self.now - timedelta(minutes=minutes),
+                **kwargs,
+            )
+            for meters, minutes in values
+        ])
+
+    def assertRollupMatches(self, user):
+        rollup = ConversionRollup.objects.get(user=user)
+        expected = ConversionRollup.objects.compute(user.pk)
+        for field in ROLLUP_FIELDS:
+            self.assertEqual(getattr(rollup, field), expected[field], field)
+
+    def test_record_keeps_the_rollup_exact(self):
+        steps = [
+            [('5', 10)],
+            [('2', 8), ('7', 9)],
+            # Older than the latest conversion: latest_* must not move
+            [('6', 60)],
+            # A new minimum and a new maximum in the same batch
+            [('0.000001', 5), ('3000', 7)],
+            # Same timestamp as the latest, higher id: it becomes the latest
+            [('3', 5)],
+        ]
+        for values in steps:
+            with self.subTest(values=values):
+                self.record(*values)
+                self.assertRollupMatches(self.user)
+        rollup = ConversionRollup.objects.get(user=self.user)
+        self.assertEqual(rollup.total_conversions, 7)
+        self.assertEqual(rollup.min_meters, Decimal('0.000001'))
+        self.assertEqual(rollup.max_meters, Decimal('3000'))
+        self.assertEqual(rollup.latest_meters, Decimal('3'))
+
+    def test_rollups_are_per_user_and_skip_other_units(self):
+        self.record(('1', 1))
+        self.record(('4', 2), user=self.other)
+        self.record(('1000', 0), from_unit='kilometer', to_unit='meter')
+        self.assertRollupMatches(self.user)
+        self.assertRollupMatches(self.other)
+        self.assertEqual(ConversionRollup.objects.get(user=self.user).total_conversions, 1)
+
+    def test_verify_reports_drift_and_rebuild_fixes_it(self):
+        self.record(('1', 1), ('2', 2))
+        self.record(('3', 3), user=self.other)
+        call_command('conversion_rollups', '--verify', stdout=io.StringIO())
+
+        ConversionRollup.objects.filter(user=self.user).update(
+            total_conversions=F('total_conversions') + 1, max_meters=Decimal('50')
+        )
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '1 of 2 rollup(s) out of sync'):
+            call_command('conversion_rollups', '--verify', stdout=out)
+        self.assertIn(f'user {self.user.pk}: total_conversions=3', out.getvalue())
+
+        call_command('conversion_rollups', '--user', str(self.user.pk), stdout=io.StringIO())
+        self.assertRollupMatches(self.user)
+        call_command('conversion_rollups', '--verify', stdout=io.StringIO())
+
+    def test_verify_reports_missing_rollups_and_rebuild_restores_them(self):
+        self.record(('1', 1))
+        ConversionRollup.objects.filter(user=self.user).delete()
+        with self.assertRaises(CommandError):
+            call_command('conversion_rollups', '--verify', stdout=io.StringIO())
+        call_command('conversion_rollups', stdout=io.StringIO())
+        self.assertRollupMatches(self.user)
+
+    def test_rebuild_drops_rollups_without_conversions(self):
+        self.record(('1', 1))
+        Conversion.objects.filter(user=self.user).delete()
+        call_command('conversion_rollups', stdout=io.StringIO())
+        self.assertFalse(ConversionRollup.objects.filter(user=self.user).exists())
+
+
+class ConversionWriteBufferTests(TestCase):
+    """
+    The flusher thread is kept out of the way (it would need its own
+    connection); flush() and drain() run in the test thread instead.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buffered')
+        self.buffer = write_behind.ConversionWriteBuffer(flush_size=2, flush_interval=0.01, max_pending=5)
+        patcher = mock.patch.object(self.buffer, '_ensure_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def conversions(self, *meters):
+        return [
+            Conversion(
+                user=self.user,
+                meters_value=Decimal(value),
+                feet_value=(Decimal(value) * Decimal('3.28084')).quantize(Decimal('0.000001')),
+                timestamp=timezone.now(),
+                ip_address='127.0.0.1',
+            )
+            for value in meters
+        ]
+
+    def test_ids_are_reserved_before_the_insert(self):
+        queued = self.buffer.save(self.conversions('1', '2'))
+        ids = [conversion.id for conversion in queued]
+        self.assertTrue(all(ids))
+        self.assertFalse(Conversion.objects.exists())
+        # A row written directly meanwhile does not collide with the reserved ids
+        direct, = create_conversions(self.user, 1)
+        self.assertNotIn(direct.id, ids)
+        self.assertTrue(self.buffer.flush())
+        self.assertEqual(
+            sorted(Conversion.objects.exclude(pk=direct.pk).values_list('id', flat=True)), sorted(ids)
+        )
+
+    def test_flush_inserts_in_enqueue_order(self):
+        queued = self.buffer.save(self.conversions('1', '2', '3'))
+        queued += self.buffer.save(self.conversions('4', '5'))
+        with mock.patch.object(Conversion.objects, 'record', wraps=Conversion.objects.record) as record:
+            self.assertTrue(self.buffer.flush())
+        # flush_size rows per INSERT
+        self.assertEqual([len(call.args[0]) for call in record.call_args_list], [2, 2, 1])
+        self.assertEqual(
+            list(Conversion.objects.order_by('sequence').values_list('id', flat=True)),
+            [conversion.id for conversion in queued],
+        )
+        self.assertEqual(self.buffer.metrics()['flushed'], 5)
+        self.assertEqual(self.buffer.metrics()['queue_depth'], 0)
+
+    def test_failed_flush_requeues_the_batch_in_order(self):
+        queued = self.buffer.save(self.conversions('1', '2', '3'))
+        with mock.patch.object(Conversion.objects, 'record', side_effect=DatabaseError('down')):
+            self.assertFalse(self.buffer.flush())
+        self.assertEqual(list(self.buffer.pending), queued)
+        self.assertEqual(self.buffer.flush_errors, 1)
+        self.assertTrue(self.buffer.flush())
+        self.assertEqual(Conversion.objects.count(), 3)
+
+    def test_full_buffer_falls_back_to_a_synchronous_write(self):
+        self.buffer.save(self.conversions('1', '2', '3', '4'))
+        written = self.buffer.save(self.conversions('5', '6'))
+        self.assertEqual(self.buffer.sync_fallbacks, 1)
+        self.assertEqual(set(Conversion.objects.values_list('id', flat=True)), {c.id for c in written})
+        self.assertEqual(len(self.buffer.pending), 4)
+
+    def test_drain_writes_everything_and_later_saves_are_synchronous(self):
+        self.buffer.save(self.conversions('1', '2', '3'))
+        self.buffer.drain(timeout=1)
+        self.assertEqual(Conversion.objects.count(), 3)
+        self.assertFalse(self.buffer.pending)
+        self.buffer.save(self.conversions('4'))
+        self.assertEqual(Conversion.objects.count(), 4)
+        self.assertEqual(self.buffer.sync_fallbacks, 1)
+
+    def test_worker_backs_off_and_gives_up_when_the_database_stays_down_at_shutdown(self):
+        self.buffer.pending.extend(self.conversions('1'))
+        self.buffer._stopping = True
+        with mock.patch.object(self.buffer, 'flush', return_value=False) as flush, \
+                mock.patch('api.write_behind.time.sleep') as sleep:
+            worker = threading.Thread(target=self.buffer._run)
+            worker.start()
+            worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(flush.call_count, write_behind.MAX_DRAIN_ATTEMPTS)
+        self.assertEqual(sleep.call_count, write_behind.MAX_DRAIN_ATTEMPTS)
+
+
+def event_sequences(chunks):
+    """Sequence numbers of the conversion events among SSE chunks."""
+    return [
+        decode_sync_token(re.match(rb'id: (\S+)\n', chunk).group(1).decode())
+        for chunk in chunks if chunk.startswith(b'id: ')
+    ]
+
+
+class ConversionFeedHubTests(TestCase):
+    """
+    Feed connections are driven directly through ConversionHub.stream();
+    record() only publishes on commit, so the tests call publish() themselves.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='feed')
+        cls.other = User.objects.create_user(username='feed-other')
+
+    def setUp(self):
+        self.hub = feed.ConversionHub(queue_size=2, heartbeat=5, poll_interval=0)
+
+    async def record(self, user, count):
+        return await sync_to_async(create_conversions)(user, count)
+
+    async def connect(self, user, since=None):
+        """Open a stream and let it subscribe; returns the async generator."""
+        stream = self.hub.stream(user, since)
+        self.assertTrue((await anext(stream)).startswith(b'retry: '))
+        return stream
+
+    async def receive(self, stream, count):
+        return [await asyncio.wait_for(anext(stream), 2) for _ in range(count)]
+
+    async def settle(self):
+        """Let the subscribers' start() run and published events be delivered."""
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+
+    async def test_publish_fans_out_to_every_connection_of_the_user(self):
+        first, second = await self.connect(self.user), await self.connect(self.user)
+        other = await self.connect(self.other)
+        readers = [asyncio.ensure_future(self.receive(stream, 2)) for stream in (first, second)]
+        await self.settle()
+
+        self.hub.publish(await self.record(self.user, 2))
+        for reader in readers:
+            self.assertEqual(event_sequences(await reader), [1, 2])
+        other_reader = asyncio.ensure_future(self.receive(other, 1))
+        await self.settle()
+        self.assertFalse(other_reader.done())
+        self.assertEqual(self.hub.metrics()['connections'], 3)
+        self.assertEqual(self.hub.metrics()['catch_ups'], 0)
+        other_reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await other_reader
+        for stream in (first, second, other):
+            await stream.aclose()
+        self.assertEqual(self.hub.metrics()['connections'], 0)
+
+    async def test_full_queue_drops_to_a_catch_up_without_gaps_or_duplicates(self):
+        stream = await self.connect(self.user)
+        starting = asyncio.ensure_future(anext(stream))
+        await self.settle()
+        # Nothing reads the stream while five events arrive for a queue of two
+        self.hub.publish(await self.record(self.user, 5))
+        chunks = [await asyncio.wait_for(starting, 2)] + await self.receive(stream, 4)
+        self.assertEqual(event_sequences(chunks), [1, 2, 3, 4, 5])
+        self.assertEqual(self.hub.overflows, 1)
+        self.assertEqual(self.hub.catch_ups, 1)
+        await stream.aclose()
+
+    async def test_missed_sequence_is_caught_up_from_the_database(self):
+        stream = await self.connect(self.user)
+        reader = asyncio.ensure_future(self.receive(stream, 3))
+        await self.settle()
+        # Conversion 1 was saved by another worker; only 2 and 3 are published here
+        conversions = await self.record(self.user, 3)
+        self.hub.publish(conversions[1:])
+        self.assertEqual(event_sequences(await reader), [1, 2, 3])
+        self.assertEqual(self.hub.catch_ups, 1)
+        await stream.aclose()
+
+    async def test_reconnect_replays_after_the_given_sequence(self):
+        await self.record(self.user, 4)
+        stream = await self.connect(self.user, since=2)
+        self.assertEqual(event_sequences(await self.receive(stream, 2)), [3, 4])
+        reader = asyncio.ensure_future(self.receive(stream, 1))
+        await self.settle()
+        self.hub.publish(await self.record(self.user, 1))
+        self.assertEqual(event_sequences(await reader), [5])
+        await stream.aclose()
+
+
+@api_test_settings
+class ConversionFeedTokenTests(TestCase):
+    url = '/api/conversions/feed/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='feed-token')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def feed_token(self):
+        response = self.client.post('/api/conversions/feed/token/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['expires_in'], 60)
+        return response.json()['token']
+
+    def test_feed_token_is_short_lived_and_single_purpose(self):
+        token = FeedToken(self.feed_token())
+        self.assertEqual(token['token_type'], 'feed')
+        self.assertEqual(token['user_id'], str(self.user.pk))
+        self.assertLessEqual(token['exp'] - token['iat'], 60)
+        # Not accepted where an access token is expected
+        client = APIClient()
+        response = client.get('/api/conversions/history/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_feed_accepts_a_feed_token_in_the_query_string(self):
+        token = await sync_to_async(self.feed_token)()
+        response = await self.async_client.get(f'{self.url}?token={token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        await response.streaming_content.aclose()
+
+    async def test_feed_rejects_other_tokens_in_the_query_string(self):
+        access = AccessToken.for_user(self.user)
+        expired = FeedToken.for_user(self.user)
+        expired.set_exp(lifetime=-timedelta(seconds=1))
+        for token in (access, expired, 'not-a-token'):
+            with self.subTest(token=str(token)[:20]):
+                response = await self.async_client.get(f'{self.url}?token={token}')
+                self.assertEqual(response.status_code, 401)
+                self.assertIn('detail', response.json())
@@ -0,0 +1,195 @@
+"""
+In-memory revocation filter for the refresh token blacklist.
+
+Each worker keeps the JTIs of unexpired blacklisted refresh tokens in a Bloom
+filter, rebuilt from the BlacklistedToken table every
+JWT_REVOCATION_REBUILD_INTERVAL seconds, plus an exact set of JTIs
+blacklisted since the last rebuild (picked up from the table every
+JWT_REVOCATION_SYNC_INTERVAL seconds, or added directly when this worker
+blacklists a token). A refresh token only costs a blacklist query when the
+filter says it may be revoked.
+
+Also defines FeedToken, the short-lived ticket a browser passes to the
+conversion feed in the query string.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+logger = logging.getLogger(__name__)
+
+# Blacklist ids below the highest one seen that every pull reads again
+PULL_OVERLAP_IDS = 1000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing of one BLAKE2b digest."""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    """
+    Answers "may this JTI be blacklisted?" without a query for tokens that
+    certainly are not.
+    Revocations made by other workers are seen within sync_interval seconds.
+    If the table can't be read, every check goes to the database until a
+    sync succeeds again.
+    """
+
+    def __init__(self, capacity, error_rate, sync_interval, rebuild_interval):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._bloom = None
+        self._recent = set()
+        self._last_id = 0
+        self._synced_at = None
+        self._built_at = None
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.possible_positives = 0
+        self.sync_errors = 0
+
+    def might_be_revoked(self, jti):
+        self.checks += 1
+        self.sync()
+        if not self.is_fresh() or jti in self._recent or jti in self._bloom:
+            self.possible_positives += 1
+            return True
+        return False
+
+    def add(self, jti):
+        """Record a JTI this worker just blacklisted."""
+        self._recent.add(jti)
+
+    def is_fresh(self):
+        synced_at = self._synced_at
+        return synced_at is not None and time.monotonic() - synced_at <= 2 * self.sync_interval
+
+    def sync(self, force=False):
+        """Pull new blacklist rows if sync_interval has passed (or force)."""
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        # One worker thread syncs; the others keep answering from the current data
+        if not self._lock.acquire(blocking=force):
+            return
+        try:
+            if self._built_at is None or now - self._built_at >= self.rebuild_interval or len(self._recent) > self.capacity:
+                self._rebuild()
+            else:
+                self._pull()
+            self._synced_at = time.monotonic()
+        except DatabaseError:
+            self.sync_errors += 1
+            logger.exception("Refresh token revocation filter sync failed")
+        finally:
+            self._lock.release()
+
+    def _unexpired(self):
+        return BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+
+    def _rebuild(self):
+        rows = list(self._unexpired().values_list('id', 'token__jti'))
+        bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+        for _, jti in rows:
+            bloom.add(jti)
+        self._last_id = max((pk for pk, _ in rows), default=self._last_id)
+        # Swap in the new filter before trimming the recent set it now covers.
+        # A JTI add()ed while the set is copied is still in the table, so the
+        # next pull brings it back.
+        self._bloom = bloom
+        self._recent = {jti for jti in self._recent.copy() if jti not in bloom}
+        self._built_at = time.monotonic()
+
+    def _pull(self):
+        # Ids are assigned at insert but rows become visible at commit, so a
+        # row can commit after a higher id was pulled; re-read a window of ids
+        # below the highest one seen to pick those up.
+        since_id = self._last_id - PULL_OVERLAP_IDS
+        rows = self._unexpired().filter(id__gt=since_id).values_list('id', 'token__jti')
+        for pk, jti in rows:
+            # Re-read rows are usually in the filter already
+            if jti not in self._bloom:
+                self._recent.add(jti)
+            self._last_id = max(self._last_id, pk)
+
+    def metrics(self):
+        return {
+            "enabled": bool(self.sync_interval),
+            "fresh": self.is_fresh(),
+            "filter_entries": self._bloom.count if self._bloom is not None else 0,
+            "recent_entries": len(self._recent),
+            "checks": self.checks,
+            "possible_positives": self.possible_positives,
+            "sync_errors": self.sync_errors,
+        }
+
+
+revocation_filter = RevocationFilter(
+    capacity=settings.JWT_REVOCATION_FILTER_CAPACITY,
+    error_rate=settings.JWT_REVOCATION_FILTER_ERROR_RATE,
+    sync_interval=settings.JWT_REVOCATION_SYNC_INTERVAL,
+    rebuild_interval=settings.JWT_REVOCATION_REBUILD_INTERVAL,
+)
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    RefreshToken whose blacklist check consults revocation_filter first.
+    With JWT_REVOCATION_SYNC_INTERVAL set to 0 every check queries the table.
+    """
+
+    def check_blacklist(self):
+        if revocation_filter.sync_interval:
+            jti = self.payload[api_settings.JTI_CLAIM]
+            if not revocation_filter.might_be_revoked(jti):
+                return
+        super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        revocation_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+class FeedToken(AccessToken):
+    """
+    Access token that only opens the conversion feed. EventSource cannot
+    send an Authorization header, so browsers pass this in the URL instead;
+    it is valid for CONVERSION_FEED_TOKEN_LIFETIME seconds and is rejected
+    by every other endpoint, which accept 'access' tokens only.
+    """
+    token_type = 'feed'
+    lifetime = timedelta(seconds=settings.CONVERSION_FEED_TOKEN_LIFETIME)
@@ -0,0 +1,179 @@
+"""
+Unit conversion engine.
+
+Units are registered with their size in the base unit of their dimension
+(meter, square meter, cubic meter, kilogram). Factors for every
+source→target pair of a dimension are computed once at import time, as exact
+Decimals and as floats, so a conversion is a dictionary lookup and one
+multiplication.
+"""
+from decimal import Decimal, localcontext
+
+SIX_PLACES = Decimal('0.000001')
+
+
+class Unit:
+    """A unit of measure and its size in the base unit of its dimension."""
+
+    def __init__(self, key, symbol, plural, dimension, size):
+        self.key = key
+        self.symbol = symbol
+        self.plural = plural
+        self.dimension = dimension
+        self.size = Decimal(size)
+
+    def __repr__(self):
+        return f"Unit({self.key!r})"
+
+
+class UnknownUnit(ValueError):
+    """Raised for a unit name, symbol or plural that is not registered."""
+
+
+class IncompatibleUnits(ValueError):
+    """Raised when converting between units of different dimensions."""
+
+
+UNITS = {}
+
+
+def register(key, symbol, plural, dimension, size):
+    UNITS[key] = Unit(key, symbol, plural, dimension, size)
+
+
+# Length (base: meter)
+register('meter', 'm', 'meters', 'length', '1')
+register('kilometer', 'km', 'kilometers', 'length', '1000')
+register('centimeter', 'cm', 'centimeters', 'length', '0.01')
+register('millimeter', 'mm', 'millimeters', 'length', '0.001')
+register('inch', 'in', 'inches', 'length', '0.0254')
+register('foot', 'ft', 'feet', 'length', '0.3048')
+register('yard', 'yd', 'yards', 'length', '0.9144')
+register('mile', 'mi', 'miles', 'length', '1609.344')
+register('nautical_mile', 'nmi', 'nautical miles', 'length', '1852')
+
+# Area (base: square meter)
+register('square_meter', 'm2', 'square meters', 'area', '1')
+register('square_kilometer', 'km2', 'square kilometers', 'area', '1000000')
+register('square_centimeter', 'cm2', 'square centimeters', 'area', '0.0001')
+register('square_inch', 'in2', 'square inches', 'area', '0.00064516')
+register('square_foot', 'ft2', 'square feet', 'area', '0.09290304')
+register('square_yard', 'yd2', 'square yards', 'area', '0.83612736')
+register('square_mile', 'mi2', 'square miles', 'area', '2589988.110336')
+register('acre', 'ac', 'acres', 'area', '4046.8564224')
+register('hectare', 'ha', 'hectares', 'area', '10000')
+
+# Volume (base: cubic meter; US customary liquid measures)
+register('cubic_meter', 'm3', 'cubic meters', 'volume', '1')
+register('liter', 'l', 'liters', 'volume', '0.001')
+register('milliliter', 'ml', 'milliliters', 'volume', '0.000001')
+register('cubic_inch', 'in3', 'cubic inches', 'volume', '0.000016387064')
+register('cubic_foot', 'ft3', 'cubic feet', 'volume', '0.028316846592')
+register('gallon', 'gal', 'gallons', 'volume', '0.003785411784')
+register('quart', 'qt', 'quarts', 'volume', '0.000946352946')
+register('pint', 'pt', 'pints', 'volume', '0.000473176473')
+register('fluid_ounce', 'fl_oz', 'fluid ounces', 'volume', '0.0000295735295625')
+
+# Mass (base: kilogram)
+register('kilogram', 'kg', 'kilograms', 'mass', '1')
+register('gram', 'g', 'grams', 'mass', '0.001')
+register('milligram', 'mg', 'milligrams', 'mass', '0.000001')
+register('tonne', 't', 'tonnes', 'mass', '1000')
+register('pound', 'lb', 'pounds', 'mass', '0.45359237')
+register('ounce', 'oz', 'ounces', 'mass', '0.028349523125')
+register('stone', 'st', 'stone', 'mass', '6.35029318')
+
+# Published factors that differ from the exact ratio. The API has always
+# converted meters to feet with the rounded 3.28084, so keep it.
+FACTOR_OVERRIDES = {
+    ('meter', 'foot'): Decimal('3.28084'),
+}
+
+
+def display_factor(factor):
+    """Factor rounded to 10 significant digits, in plain notation."""
+    with localcontext() as ctx:
+        ctx.prec = 10
+        return f"{(+factor).normalize():f}"
+
+
+def build_factor_tables():
+    """
+    Return (decimal_factors, float_factors, formulas) keyed by
+    (source key, target key) for every pair of units in the same dimension.
+    """
+    decimal_factors, float_factors, formulas = {}, {}, {}
+    with localcontext() as ctx:
+        ctx.prec = 34
+        for source in UNITS.values():
+            for target in UNITS.values():
+                if source.dimension != target.dimension:
+                    continue
+                pair = (source.key, target.key)
+                factor = FACTOR_OVERRIDES.get(pair)
+                if factor is None:
+                    factor = (source.size / target.size).normalize()
+                decimal_factors[pair] = factor
+                float_factors[pair] = float(factor)
+                formulas[pair] = f"{target.plural} = {source.plural} × {display_factor(factor)}"
+    return decimal_factors, float_factors, formulas
+
+
+DECIMAL_FACTORS, FLOAT_FACTORS, FORMULAS = build_factor_tables()
+
+# Lower-cased key, symbol and plural -> unit key
+ALIASES = {}
+for _unit in UNITS.values():
+    for _name in (_unit.key, _unit.symbol, _unit.plural):
+        ALIASES[_name.lower()] = _unit.key
+del _unit, _name
+
+DIMENSIONS = {}
+for _unit in UNITS.values():
+    DIMENSIONS.setdefault(_unit.dimension, []).append(_unit.key)
+del _unit
+
+
+def resolve_unit(name):
+    """Return the unit key for a key, symbol or plural (case-insensitive)."""
+    try:
+        return ALIASES[str(name).strip().lower()]
+    except KeyError:
+        raise UnknownUnit(f"Unknown unit '{name}'") from None
+
+
+def _pair(source, target):
+    pair = (source, target)
+    if pair not in DECIMAL_FACTORS:
+        for key in pair:
+            if key not in UNITS:
+                raise UnknownUnit(f"Unknown unit '{key}'")
+        raise IncompatibleUnits(
+            f"Cannot convert {UNITS[source].dimension} ({source}) to {UNITS[target].dimension} ({target})"
+        )
+    return pair
+
+
+def factor(source, target):
+    """Exact Decimal factor from source to target (unit keys)."""
+    return DECIMAL_FACTORS[_pair(source, target)]
+
+
+def float_factor(source, target):
+    """Float factor from source to target (unit keys)."""
+    return FLOAT_FACTORS[_pair(source, target)]
+
+
+def formula(source, target):
+    """Human-readable formula, e.g. "feet = meters × 3.28084"."""
+    return FORMULAS[_pair(source, target)]
+
+
+def convert(value, source, target):
+    """Convert a Decimal value, rounded to 6 decimal places."""
+    return (value * DECIMAL_FACTORS[_pair(source, target)]).quantize(SIX_PLACES)
+
+
+def convert_float(value, source, target):
+    """Convert a float value without rounding."""
+    return value * FLOAT_FACTORS[_pair(source, target)]
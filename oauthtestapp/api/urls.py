@@ -1,20 +1,34 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under the ASGI profile the login and convert endpoints are served by their
+# async implementations, which don't block the worker while waiting on Google
+if settings.API_ASYNC_VIEWS:
+    google_oauth_callback = async_views.google_oauth_callback
+    google_oauth_login = async_views.google_oauth_login
+    convert_meters_to_feet = async_views.convert_meters_to_feet
+else:
+    google_oauth_callback = views.google_oauth_callback
+    google_oauth_login = views.google_oauth_login
+    convert_meters_to_feet = views.convert_meters_to_feet
 
 urlpatterns = [
     # Health check
     path('health/', views.health_check, name='health_check'),
+    path('metrics/', views.metrics_view, name='metrics'),
     
     # Debug endpoint
     path('auth/debug/', views.oauth_config_debug, name='oauth_config_debug'),  # Debug OAuth config
     
     # Google OAuth endpoints
     path('auth/google/login/', views.google_oauth_initiate, name='google_oauth_initiate'),  # NEW: Start OAuth flow
-    path('auth/google/callback/', views.google_oauth_callback, name='google_oauth_callback'),  # Handle Google redirect
-    path('auth/google/', views.google_oauth_login, name='google_oauth_login'),  # API endpoint for frontend
+    path('auth/google/callback/', google_oauth_callback, name='google_oauth_callback'),  # Handle Google redirect
+    path('auth/google/', google_oauth_login, name='google_oauth_login'),  # API endpoint for frontend
     
     # Other auth endpoints
     path('auth/logout/', views.logout, name='logout'),
+    path('auth/token/refresh/', views.TokenRefresh.as_view(), name='token_refresh'),
     path('auth/profile/', views.user_profile, name='user_profile'),
     
     # User management
@@ -22,7 +36,15 @@ urlpatterns = [
     path('users/me/', views.UserDetail.as_view(), name='user_detail'),
     
     # Conversion endpoints
-    path('conversions/convert/', views.convert_meters_to_feet, name='convert_meters_to_feet'),
+    path('conversions/convert/', convert_meters_to_feet, name='convert_meters_to_feet'),
+    path('conversions/convert/batch/', views.convert_meters_to_feet_batch, name='convert_meters_to_feet_batch'),
+    path('conversions/convert/array/', views.convert_meters_to_feet_array, name='convert_meters_to_feet_array'),
+    path('conversions/convert/multi/', views.convert_to_many_units, name='convert_to_many_units'),
+    path('conversions/units/', views.list_units, name='list_units'),
     path('conversions/history/', views.conversion_history, name='conversion_history'),
+    path('conversions/changes/', views.conversion_changes, name='conversion_changes'),
+    path('conversions/feed/', async_views.conversion_feed, name='conversion_feed'),  # SSE, ASGI only
+    path('conversions/feed/token/', views.conversion_feed_token, name='conversion_feed_token'),
+    path('conversions/export/', views.export_conversions, name='export_conversions'),
     path('conversions/stats/', views.conversion_stats, name='conversion_stats'),
 ] 
\ No newline at end of file
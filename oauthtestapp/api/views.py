@@ -1,28 +1,57 @@
 from django.shortcuts import redirect
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Subquery, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, parser_classes, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
 from allauth.socialaccount.models import SocialAccount, SocialToken
 from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter
 from allauth.socialaccount.providers.oauth2.client import OAuth2Client
-from .serializers import UserSerializer, UserProfileSerializer
-from .serializers import ConversionInputSerializer, ConversionSerializer, ConversionResponseSerializer
-from .models import Conversion
+from .serializers import UserSerializer, UserProfileSerializer, RevocableTokenRefreshSerializer
+from .serializers import ConversionInputSerializer, ConversionResponseSerializer
+from .serializers import (
+    CONVERSION_HISTORY_FIELDS,
+    CONVERSION_HISTORY_VALUES,
+    history_columns,
+    parse_fields,
+    serialize_conversion_columns,
+    serialize_conversion_history,
+)
+from .serializers import ConversionBatchInputSerializer, ConversionBatchResponseSerializer
+from .serializers import ConversionMultiInputSerializer, ConversionMultiResponseSerializer
+from . import arrays, export, feed, metrics, units
+from .conditional import conditional_etag
+from .google import exchange_google_code, get_google_user_info, verify_google_id_token
+from .oauth_client import get_oauth_client
+from .permissions import HasMetricsAccess
+from .models import Conversion, ConversionRollup
+from .pagination import InvalidCursor, InvalidSyncToken, changes_since, paginate_by_cursor
+from .tokens import FeedToken, RevocableRefreshToken, revocation_filter
+from .write_behind import get_conversion_buffer, save_conversions
 import json
-import requests
 import urllib.parse
+from datetime import datetime
 from decimal import Decimal
 
 User = get_user_model()
 
+METERS_TO_FEET = units.factor(Conversion.DEFAULT_FROM_UNIT, Conversion.DEFAULT_TO_UNIT)
+SIX_PLACES = units.SIX_PLACES
+CONVERSION_FORMULA = units.formula(Conversion.DEFAULT_FROM_UNIT, Conversion.DEFAULT_TO_UNIT)
+
 class UserCreate(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -36,6 +65,14 @@ class UserDetail(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+class TokenRefresh(TokenRefreshView):
+    """
+    Exchange a refresh token for a new access token (and, with
+    ROTATE_REFRESH_TOKENS, a new refresh token).
+    Expects: { "refresh": "refresh_token" }
+    """
+    serializer_class = RevocableTokenRefreshSerializer
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def oauth_config_debug(request):
@@ -97,24 +134,35 @@ def google_oauth_login(request):
     Handle Google OAuth login from frontend.
     This endpoint receives Google access token from your NextJS app.
     Expects: { "access_token": "google_access_token_from_frontend" }
+         or: { "id_token": "google_id_token_from_frontend" }
+    An ID token is verified locally against Google's cached signing keys,
+    so it avoids a round trip to Google on the login path.
     Returns: { "access_token": "jwt_token", "refresh_token": "refresh_token", "user": {...} }
     """
     try:
         data = json.loads(request.body)
         google_access_token = data.get('access_token')
+        google_id_token = data.get('id_token')
         
-        if not google_access_token:
+        if not google_access_token and not google_id_token:
             return JsonResponse({
-                "error": "Google access token is required",
+                "error": "Google access token or ID token is required",
                 "help": "Your frontend should get this token from Google OAuth and send it here"
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Verify Google token and get user info
-        google_user_info = get_google_user_info(google_access_token)
-        if not google_user_info:
-            return JsonResponse({
-                "error": "Invalid Google access token"
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        if google_id_token:
+            google_user_info = verify_google_id_token(google_id_token)
+            if not google_user_info:
+                return JsonResponse({
+                    "error": "Invalid Google ID token"
+                }, status=status.HTTP_401_UNAUTHORIZED)
+        else:
+            google_user_info = get_google_user_info(google_access_token)
+            if not google_user_info:
+                return JsonResponse({
+                    "error": "Invalid Google access token"
+                }, status=status.HTTP_401_UNAUTHORIZED)
         
         # Get or create user
         user = get_or_create_user_from_google(google_user_info)
@@ -149,10 +197,12 @@ def google_oauth_login(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_etag()
 def user_profile(request):
     """
     Get current user profile data.
     Returns: { "user": {...} }
+    Send the ETag back in If-None-Match to get 304 when nothing changed.
     """
     serializer = UserProfileSerializer(request.user)
     return Response({
@@ -171,7 +221,7 @@ def logout(request):
         refresh_token = data.get('refresh_token')
         
         if refresh_token:
-            token = RefreshToken(refresh_token)
+            token = RevocableRefreshToken(refresh_token)
             token.blacklist()
         
         return JsonResponse({
@@ -183,27 +233,44 @@ def logout(request):
             "message": "Logout successful"
         }, status=status.HTTP_200_OK)
 
-def get_google_user_info(access_token):
+def allocate_username(base):
     """
-    Get user information from Google using the access token.
+    Return the first free username out of base, base1, base2, ...
+    using a single prefix query instead of probing each candidate.
     """
-    try:
-        response = requests.get(
-            'https://www.googleapis.com/oauth2/v2/userinfo',
-            headers={'Authorization': f'Bearer {access_token}'},
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        return None
-        
-    except requests.RequestException:
-        return None
+    taken = set(
+        User.objects.filter(username__startswith=base).values_list('username', flat=True)
+    )
+    if base not in taken:
+        return base
+    counter = 1
+    while f"{base}{counter}" in taken:
+        counter += 1
+    return f"{base}{counter}"
+
+def update_user_from_google(user, first_name, last_name):
+    """
+    Fill in blank name fields from Google; only writes when something changed.
+    """
+    changed = []
+    if not user.first_name and first_name:
+        user.first_name = first_name
+        changed.append('first_name')
+    if not user.last_name and last_name:
+        user.last_name = last_name
+        changed.append('last_name')
+    if changed:
+        user.save(update_fields=changed)
+    return user
 
-def get_or_create_user_from_google(google_user_info):
+def get_or_create_user_from_google(google_user_info, attempts=3):
     """
     Get or create a user from Google user information.
+    Resolves by the Google account id (indexed SocialAccount uid) first, then
+    by email, and only creates a user when neither matches. New users and
+    their SocialAccount are created in one transaction; the unique
+    (provider, uid) constraint makes concurrent first logins of the same
+    Google account converge on a single user.
     """
     try:
         email = google_user_info.get('email')
@@ -214,50 +281,41 @@ def get_or_create_user_from_google(google_user_info):
         if not email:
             return None
         
-        # Try to get existing user by email
-        try:
-            user = User.objects.get(email=email)
-            # Update user info if needed
-            if not user.first_name and first_name:
-                user.first_name = first_name
-            if not user.last_name and last_name:
-                user.last_name = last_name
-            user.save()
-            return user
-        except User.DoesNotExist:
-            pass
-        
-        # Create new user
-        username = email.split('@')[0]
-        # Ensure username is unique
-        original_username = username
-        counter = 1
-        while User.objects.filter(username=username).exists():
-            username = f"{original_username}{counter}"
-            counter += 1
-        
-        user = User.objects.create_user(
-            username=username,
-            email=email,
-            first_name=first_name,
-            last_name=last_name
-        )
-        
-        # Create or update social account
-        try:
-            social_account, created = SocialAccount.objects.get_or_create(
-                user=user,
-                provider='google',
-                defaults={'uid': google_id}
-            )
-            if not created and social_account.uid != google_id:
-                social_account.uid = google_id
-                social_account.save()
-        except Exception:
-            # If social account creation fails, still return the user
-            pass
+        for _ in range(attempts):
+            # Known Google account
+            if google_id:
+                social_account = (
+                    SocialAccount.objects
+                    .select_related('user')
+                    .filter(provider='google', uid=google_id)
+                    .first()
+                )
+                if social_account:
+                    return update_user_from_google(social_account.user, first_name, last_name)
+            
+            try:
+                with transaction.atomic():
+                    # Existing user by email: link the Google account to it
+                    user = User.objects.filter(email=email).order_by('id').first()
+                    if user:
+                        update_user_from_google(user, first_name, last_name)
+                    else:
+                        user = User.objects.create_user(
+                            username=allocate_username(email.split('@')[0]),
+                            email=email,
+                            first_name=first_name,
+                            last_name=last_name
+                        )
+                    
+                    if google_id:
+                        SocialAccount.objects.create(user=user, provider='google', uid=google_id)
+                    return user
+            except IntegrityError:
+                # Lost a race: the Google account was linked or the username
+                # was taken by a concurrent login. Resolve again.
+                continue
         
-        return user
+        return None
         
     except Exception:
         return None
@@ -279,19 +337,9 @@ def google_oauth_callback(request):
     
     try:
         # Exchange code for access token
-        token_url = "https://oauth2.googleapis.com/token"
-        token_data = {
-            'client_id': settings.GOOGLE_OAUTH_CLIENT_ID,
-            'client_secret': settings.GOOGLE_OAUTH_CLIENT_SECRET,
-            'code': code,
-            'grant_type': 'authorization_code',
-            'redirect_uri': settings.GOOGLE_OAUTH_REDIRECT_URI,
-        }
-        
-        token_response = requests.post(token_url, data=token_data)
-        token_json = token_response.json()
+        token_json = exchange_google_code(code)
         
-        if 'access_token' not in token_json:
+        if not token_json or 'access_token' not in token_json:
             frontend_url = settings.FRONTEND_URL
             return redirect(f'{frontend_url}/auth/callback?error=token_exchange_failed')
         
@@ -356,6 +404,25 @@ def validate_google_token(request):
             return JsonResponse({"detail": "Invalid JSON"}, status=400)
     return JsonResponse({"detail": "Invalid request method"}, status=405)
 
+def get_client_ip(request):
+    """
+    Get the client's IP address, honouring X-Forwarded-For.
+    """
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[0]
+    else:
+        ip = request.META.get('REMOTE_ADDR')
+    return ip
+
+def meters_to_feet(meters_value):
+    """
+    Convert a Decimal meters value to feet, rounded to 6 decimal places.
+    """
+    # Precomputed meters→feet factor, kept out of the generic unit lookup
+    feet_value = meters_value * METERS_TO_FEET
+    return feet_value.quantize(SIX_PLACES)  # Round to 6 decimal places
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def convert_meters_to_feet(request):
@@ -375,26 +442,17 @@ def convert_meters_to_feet(request):
         
         meters_value = input_serializer.validated_data['meters']
         
-        # Conversion formula: feet = meters * 3.28084
-        feet_value = meters_value * Decimal('3.28084')
-        feet_value = feet_value.quantize(Decimal('0.000001'))  # Round to 6 decimal places
-        
-        # Get user's IP address
-        def get_client_ip(request):
-            x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-            if x_forwarded_for:
-                ip = x_forwarded_for.split(',')[0]
-            else:
-                ip = request.META.get('REMOTE_ADDR')
-            return ip
-        
-        # Save conversion to database
-        conversion = Conversion.objects.create(
-            user=request.user,
-            meters_value=meters_value,
-            feet_value=feet_value,
-            ip_address=get_client_ip(request)
-        )
+        feet_value = meters_to_feet(meters_value)
+        
+        # Save conversion (committed now, or queued in buffered mode)
+        conversion, = save_conversions([
+            Conversion(
+                user=request.user,
+                meters_value=meters_value,
+                feet_value=feet_value,
+                ip_address=get_client_ip(request)
+            )
+        ])
         
         # Prepare response
         response_data = {
@@ -402,7 +460,7 @@ def convert_meters_to_feet(request):
             "feet": feet_value,
             "conversion_id": conversion.id,
             "timestamp": conversion.timestamp,
-            "formula_used": "feet = meters × 3.28084",
+            "formula_used": CONVERSION_FORMULA,
             "message": f"Successfully converted {meters_value} meters to {feet_value} feet"
         }
         
@@ -415,17 +473,270 @@ def convert_meters_to_feet(request):
             "details": str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def convert_meters_to_feet_batch(request):
+    """
+    Convert a list of meter values to feet and save them with a single bulk insert.
+    POST /api/conversions/convert/batch/
+    Body: {"meters": [10.5, 3, 0.25]}
+    Results are returned in the same order as the input values.
+    """
+    try:
+        # Validate input
+        input_serializer = ConversionBatchInputSerializer(data=request.data)
+        if not input_serializer.is_valid():
+            return Response({
+                "error": "Invalid input",
+                "details": input_serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        meters_values = input_serializer.validated_data['meters']
+        ip_address = get_client_ip(request)
+        timestamp = timezone.now()
+        
+        # Save all conversions with one INSERT (or queue them in buffered mode)
+        conversions = save_conversions([
+            Conversion(
+                user=request.user,
+                meters_value=meters_value,
+                feet_value=meters_to_feet(meters_value),
+                timestamp=timestamp,
+                ip_address=ip_address
+            )
+            for meters_value in meters_values
+        ])
+        
+        # Prepare response
+        response_data = {
+            "results": [
+                {
+                    "meters": conversion.meters_value,
+                    "feet": conversion.feet_value,
+                    "conversion_id": conversion.id,
+                    "timestamp": conversion.timestamp,
+                }
+                for conversion in conversions
+            ],
+            "count": len(conversions),
+            "formula_used": CONVERSION_FORMULA,
+            "message": f"Successfully converted {len(conversions)} value(s) from meters to feet"
+        }
+        
+        response_serializer = ConversionBatchResponseSerializer(response_data)
+        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        return Response({
+            "error": "Batch conversion failed",
+            "details": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([arrays.Float64ArrayParser, arrays.NpyArrayParser])
+def convert_meters_to_feet_array(request):
+    """
+    Convert a binary array of meter values to feet with one NumPy operation.
+    POST /api/conversions/convert/array/
+    Body: raw little-endian float64 values (Content-Type: application/octet-stream)
+    or a 1-D float64 .npy file (Content-Type: application/x-npy).
+    The response body is the feet array in the same format.
+    Optional query params: ?round=false skips rounding to 6 decimal places,
+    ?persist=true also saves the conversions (up to CONVERSION_BATCH_MAX_SIZE values).
+    """
+    try:
+        arrays.numpy()
+    except ImportError as e:
+        return Response({
+            "error": "Binary array conversion is not available",
+            "details": str(e)
+        }, status=status.HTTP_501_NOT_IMPLEMENTED)
+    
+    # Parse errors and unsupported content types become DRF's 400/415 responses
+    meters = request.data
+    
+    try:
+        error = arrays.validate(meters)
+        if error:
+            return Response({
+                "error": "Invalid input",
+                "details": error
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        persist = request.GET.get('persist', '').lower() == 'true'
+        round_result = persist or request.GET.get('round', 'true').lower() != 'false'
+        feet = arrays.convert(meters, round_result=round_result)
+        
+        saved = 0
+        if persist:
+            max_size = settings.CONVERSION_BATCH_MAX_SIZE
+            if meters.size > max_size:
+                return Response({
+                    "error": "Invalid input",
+                    "details": f"At most {max_size} values can be persisted per request."
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if feet.max() >= 10 ** 4:
+                return Response({
+                    "error": "Invalid input",
+                    "details": "Values must be less than 10000 feet to be persisted."
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            ip_address = get_client_ip(request)
+            timestamp = timezone.now()
+            saved = len(save_conversions([
+                Conversion(
+                    user=request.user,
+                    meters_value=Decimal(meters_micros).scaleb(-6),
+                    feet_value=Decimal(feet_micros).scaleb(-6),
+                    timestamp=timestamp,
+                    ip_address=ip_address
+                )
+                for meters_micros, feet_micros in zip(
+                    arrays.to_micros(meters).tolist(),
+                    arrays.convert_to_micros(meters).tolist()
+                )
+            ]))
+        
+        media_type = arrays.NPY if request.content_type.startswith(arrays.NPY) else arrays.RAW_FLOAT64
+        response = HttpResponse(arrays.serialize(feet, media_type), content_type=media_type)
+        response['X-Conversion-Count'] = str(meters.size)
+        response['X-Conversions-Saved'] = str(saved)
+        return response
+        
+    except Exception as e:
+        return Response({
+            "error": "Array conversion failed",
+            "details": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def convert_to_many_units(request):
+    """
+    Convert one value to several units of the same dimension and save each result.
+    POST /api/conversions/convert/multi/
+    Body: {"value": 10.5, "from_unit": "meter", "to_units": ["foot", "inch", "yd"]}
+    Units may be given by key, symbol or plural (see GET /api/conversions/units/).
+    """
+    try:
+        # Validate input
+        input_serializer = ConversionMultiInputSerializer(data=request.data)
+        if not input_serializer.is_valid():
+            return Response({
+                "error": "Invalid input",
+                "details": input_serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        value = input_serializer.validated_data['value']
+        from_unit = input_serializer.validated_data['from_unit']
+        to_units = input_serializer.validated_data['to_units']
+        ip_address = get_client_ip(request)
+        timestamp = timezone.now()
+        
+        # Save all results with one INSERT (or queue them in buffered mode)
+        conversions = save_conversions([
+            Conversion(
+                user=request.user,
+                meters_value=value,
+                feet_value=converted_value,
+                from_unit=from_unit,
+                to_unit=to_unit,
+                timestamp=timestamp,
+                ip_address=ip_address
+            )
+            for to_unit, converted_value in input_serializer.validated_data['results']
+        ])
+        
+        # Prepare response
+        response_data = {
+            "value": value,
+            "from_unit": from_unit,
+            "results": [
+                {
+                    "unit": conversion.to_unit,
+                    "value": conversion.feet_value,
+                    "formula_used": units.formula(from_unit, conversion.to_unit),
+                    "conversion_id": conversion.id,
+                }
+                for conversion in conversions
+            ],
+            "count": len(conversions),
+            "timestamp": timestamp,
+            "message": f"Successfully converted {value} {units.UNITS[from_unit].plural} to {len(conversions)} unit(s)"
+        }
+        
+        response_serializer = ConversionMultiResponseSerializer(response_data)
+        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        return Response({
+            "error": "Conversion failed",
+            "details": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def list_units(request):
+    """
+    List the supported units, grouped by dimension.
+    GET /api/conversions/units/
+    """
+    return Response({
+        "dimensions": {
+            dimension: [
+                {
+                    "key": key,
+                    "symbol": units.UNITS[key].symbol,
+                    "plural": units.UNITS[key].plural,
+                }
+                for key in keys
+            ]
+            for dimension, keys in units.DIMENSIONS.items()
+        }
+    }, status=status.HTTP_200_OK)
+
+HISTORY_LAYOUTS = ('rows', 'columnar')
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_etag(conversions=True)
 def conversion_history(request):
     """
     Get conversion history for the authenticated user.
     GET /api/conversions/history/
     Optional query params: ?limit=10&offset=0
+    Cursor mode: ?pagination=cursor&limit=10 for the first page, then
+    ?cursor=<next_cursor or prev_cursor>. Add ?include_total=true to also
+    get the exact total_count in cursor mode.
+    ?fields=id,meters_value,timestamp returns (and reads) only those fields;
+    ?layout=columnar returns conversions as one array per field.
+    Send the ETag back in If-None-Match to get 304 when nothing changed.
     """
     try:
-        # Get user's conversions
-        conversions = Conversion.objects.filter(user=request.user)
+        try:
+            fields = parse_fields(request.GET.get('fields'), tuple(CONVERSION_HISTORY_FIELDS))
+        except ValueError as e:
+            return Response({
+                "error": "Invalid input",
+                "details": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        layout = request.GET.get('layout', 'rows')
+        if layout not in HISTORY_LAYOUTS:
+            return Response({
+                "error": "Invalid input",
+                "details": f"Invalid 'layout' value, expected one of: {', '.join(HISTORY_LAYOUTS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Get user's conversions, only the columns the response needs
+        columns = history_columns(fields)
+        cursor = request.GET.get('cursor')
+        cursor_mode = bool(cursor) or request.GET.get('pagination') == 'cursor'
+        if cursor_mode:
+            # Cursors are built from the last and first rows of the page
+            columns = tuple(dict.fromkeys((*columns, 'timestamp', 'id')))
+        conversions = Conversion.objects.filter(user=request.user).values(*columns)
         
         # Pagination
         limit = request.GET.get('limit', 50)
@@ -438,15 +749,23 @@ def conversion_history(request):
             limit = 50
             offset = 0
         
-        # Apply pagination
-        total_count = conversions.count()
-        conversions = conversions[offset:offset + limit]
+        if cursor_mode:
+            return conversion_history_by_cursor(request, conversions, cursor, max(limit, 1), fields, layout)
+        
+        # Apply pagination. The total rides along with the page as an
+        # uncorrelated subquery, which is evaluated once, so a page is one
+        # query; only an empty page needs a separate count.
+        total = Conversion.objects.filter(user=request.user).order_by().values('user').annotate(
+            count=Count('id')
+        ).values('count')
+        page = list(conversions.annotate(total_count=Subquery(total))[offset:offset + limit])
+        total_count = page[0]['total_count'] if page else conversions.count()
         
-        # Serialize data
-        serializer = ConversionSerializer(conversions, many=True)
+        # Serialize data (user fields are computed once for the page)
+        data = serialize_history_page(page, request.user, fields, layout)
         
         return Response({
-            "conversions": serializer.data,
+            "conversions": data,
             "pagination": {
                 "total_count": total_count,
                 "limit": limit,
@@ -454,7 +773,7 @@ def conversion_history(request):
                 "has_next": offset + limit < total_count,
                 "has_previous": offset > 0
             },
-            "message": f"Retrieved {len(serializer.data)} conversion(s) for user {request.user.username}"
+            "message": f"Retrieved {len(page)} conversion(s) for user {request.user.username}"
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -463,44 +782,317 @@ def conversion_history(request):
             "details": str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def serialize_history_page(rows, user, fields, layout):
+    """
+    A history page as a list of entries, or as one list per field for
+    ?layout=columnar.
+    """
+    if layout == 'columnar':
+        return serialize_conversion_columns(rows, user, fields)
+    return serialize_conversion_history(rows, user, fields)
+
+def conversion_history_by_cursor(request, conversions, cursor, limit, fields=None, layout='rows'):
+    """
+    Keyset-paginated variant of conversion_history.
+    Skips the exact total_count unless ?include_total=true is passed.
+    """
+    try:
+        page, next_cursor, prev_cursor = paginate_by_cursor(conversions, cursor, limit)
+    except InvalidCursor:
+        return Response({
+            "error": "Invalid cursor"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serialize_history_page(page, request.user, fields, layout)
+    
+    pagination = {
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "has_next": next_cursor is not None,
+        "has_previous": prev_cursor is not None
+    }
+    if request.GET.get('include_total', '').lower() == 'true':
+        pagination["total_count"] = conversions.count()
+    
+    return Response({
+        "conversions": data,
+        "pagination": pagination,
+        "message": f"Retrieved {len(page)} conversion(s) for user {request.user.username}"
+    }, status=status.HTTP_200_OK)
+
+CHANGES_MAX_LIMIT = 1000
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def conversion_changes(request):
+    """
+    Delta sync for clients that keep a local copy of their history.
+    GET /api/conversions/changes/?since=<next_token>&limit=500
+    Returns the conversions saved after the token, oldest first, and a new
+    next_token. Without ?since= it starts from the first conversion; keep
+    requesting while has_more is true. When nothing is new, conversions is
+    empty and next_token is unchanged. Conversions are only deleted together
+    with their user, so there are no deletions to report.
+    """
+    try:
+        limit = int(request.GET.get('limit', 500))
+    except ValueError:
+        limit = 500
+    limit = min(max(limit, 1), CHANGES_MAX_LIMIT)
+    
+    conversions = Conversion.objects.filter(user=request.user).values(*CONVERSION_HISTORY_VALUES, 'sequence')
+    try:
+        rows, next_token, has_more = changes_since(conversions, request.GET.get('since'), limit)
+    except InvalidSyncToken:
+        return Response({
+            "error": "Invalid sync token"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        "conversions": serialize_conversion_history(rows, request.user),
+        "next_token": next_token,
+        "has_more": has_more
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def conversion_feed_token(request):
+    """
+    Issue a short-lived token for opening the conversion feed from a browser.
+    POST /api/conversions/feed/token/
+    EventSource cannot send an Authorization header, so the page opens
+    /api/conversions/feed/?token=<token> instead. The token only works on
+    the feed and only for CONVERSION_FEED_TOKEN_LIFETIME seconds; fetch a new
+    one before reopening a dropped stream.
+    """
+    return Response({
+        "token": str(FeedToken.for_user(request.user)),
+        "expires_in": settings.CONVERSION_FEED_TOKEN_LIFETIME
+    }, status=status.HTTP_200_OK)
+
+def parse_time_window(request):
+    """
+    Parse the optional ?since=/?until= ISO 8601 query params.
+    Returns (since, until) as aware datetimes or None; raises ValueError on bad input.
+    The window is half-open: since <= timestamp < until.
+    """
+    window = []
+    for param in ('since', 'until'):
+        value = request.GET.get(param)
+        if not value:
+            window.append(None)
+            continue
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                raise ValueError(f"Invalid '{param}' value, expected an ISO 8601 date or datetime")
+            parsed = datetime.combine(parsed_date, datetime.min.time())
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, timezone.get_current_timezone())
+        window.append(parsed)
+    return tuple(window)
+
+def filter_time_window(conversions, since, until):
+    """
+    Restrict a conversion queryset to the since <= timestamp < until window.
+    """
+    if since:
+        conversions = conversions.filter(timestamp__gte=since)
+    if until:
+        conversions = conversions.filter(timestamp__lt=until)
+    return conversions
+
+STATS_BUCKETS = {'hour': TruncHour, 'day': TruncDay}
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_conversions(request):
+    """
+    Stream the authenticated user's full conversion history as a file download.
+    GET /api/conversions/export/
+    Optional query params: ?output=csv|ndjson (default csv), ?gzip=true,
+    ?since=/?until= (same half-open window as stats) and ?fields= to export
+    only some columns.
+    Rows are newest first and read in chunks, so any history size can be exported.
+    """
+    try:
+        try:
+            since, until = parse_time_window(request)
+        except ValueError as e:
+            return Response({
+                "error": "Invalid input",
+                "details": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        export_format = request.GET.get('output', 'csv')
+        if export_format not in export.EXPORT_FORMATS:
+            return Response({
+                "error": "Invalid input",
+                "details": f"Invalid 'output' value, expected one of: {', '.join(export.EXPORT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            fields = parse_fields(request.GET.get('fields'), export.EXPORT_FIELDS)
+        except ValueError as e:
+            return Response({
+                "error": "Invalid input",
+                "details": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        gzip = request.GET.get('gzip', '').lower() == 'true'
+        conversions = filter_time_window(
+            Conversion.objects.filter(user=request.user), since, until
+        ).order_by('-timestamp', '-id')
+        chunks = export.export_chunks(conversions, export_format, gzip=gzip, fields=fields)
+        if isinstance(request._request, ASGIRequest):
+            chunks = export.aiterate(chunks)
+        
+        content_type, extension = export.EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="conversions.{extension}"'
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        return response
+        
+    except Exception as e:
+        return Response({
+            "error": "Failed to export conversion history",
+            "details": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_etag(conversions=True)
 def conversion_stats(request):
     """
     Get conversion statistics for the authenticated user.
     GET /api/conversions/stats/
+    Optional query params: ?since=2025-01-01T00:00:00Z&until=2025-02-01
+    (half-open window) and ?bucket=hour|day for a grouped time series.
+    Send the ETag back in If-None-Match to get 304 when nothing changed.
     """
     try:
-        conversions = Conversion.objects.filter(user=request.user)
+        try:
+            since, until = parse_time_window(request)
+        except ValueError as e:
+            return Response({
+                "error": "Invalid input",
+                "details": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        bucket = request.GET.get('bucket')
+        if bucket and bucket not in STATS_BUCKETS:
+            return Response({
+                "error": "Invalid input",
+                "details": f"Invalid 'bucket' value, expected one of: {', '.join(STATS_BUCKETS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        conversions = filter_time_window(
+            Conversion.objects.filter(user=request.user).meters_to_feet(), since, until
+        )
         
-        if not conversions.exists():
+        # Whole-history stats come from the rollup row (one primary-key read)
+        rollup = None
+        if not (since or until or bucket):
+            rollup = ConversionRollup.objects.filter(user=request.user).first()
+        
+        if rollup is not None:
+            total_conversions = rollup.total_conversions
+            stats = {
+                "total_meters_converted": rollup.total_meters,
+                "total_feet_converted": rollup.total_feet,
+                "average_meters_per_conversion": rollup.total_meters / (total_conversions or 1),
+                "average_feet_per_conversion": rollup.total_feet / (total_conversions or 1),
+                "min_meters": rollup.min_meters,
+                "max_meters": rollup.max_meters,
+                "min_feet": rollup.min_feet,
+                "max_feet": rollup.max_feet,
+            }
+            latest_conversion = {
+                "meters": rollup.latest_meters,
+                "feet": rollup.latest_feet,
+                "timestamp": rollup.latest_timestamp
+            }
+        else:
+            # Calculate statistics in a single aggregate query. Averages are
+            # derived from the sums, as Avg() would not scale the stored integers.
+            values = conversions.aggregate(
+                total_conversions=Count('id'),
+                total_meters=Sum('meters_value', default=0),
+                total_feet=Sum('feet_value', default=0),
+                min_meters=Min('meters_value'),
+                max_meters=Max('meters_value'),
+                min_feet=Min('feet_value'),
+                max_feet=Max('feet_value'),
+            )
+            total_conversions = values['total_conversions']
+            stats = {
+                "total_meters_converted": values['total_meters'],
+                "total_feet_converted": values['total_feet'],
+                "average_meters_per_conversion": values['total_meters'] / (total_conversions or 1),
+                "average_feet_per_conversion": values['total_feet'] / (total_conversions or 1),
+                "min_meters": values['min_meters'],
+                "max_meters": values['max_meters'],
+                "min_feet": values['min_feet'],
+                "max_feet": values['max_feet'],
+            }
+            latest_conversion = None
+        
+        if not total_conversions:
             return Response({
                 "total_conversions": 0,
                 "message": "No conversions found for this user"
             }, status=status.HTTP_200_OK)
         
-        # Calculate statistics
-        total_conversions = conversions.count()
-        total_meters_converted = sum(c.meters_value for c in conversions)
-        total_feet_converted = sum(c.feet_value for c in conversions)
-        avg_meters_per_conversion = total_meters_converted / total_conversions
-        avg_feet_per_conversion = total_feet_converted / total_conversions
-        
-        latest_conversion = conversions.first()  # Most recent due to ordering
+        if latest_conversion is None:
+            latest = conversions.first()  # Most recent due to ordering
+            latest_conversion = {
+                "meters": latest.meters_value,
+                "feet": latest.feet_value,
+                "timestamp": latest.timestamp
+            }
         
-        return Response({
+        response_data = {
             "total_conversions": total_conversions,
-            "total_meters_converted": float(total_meters_converted),
-            "total_feet_converted": float(total_feet_converted),
-            "average_meters_per_conversion": float(avg_meters_per_conversion),
-            "average_feet_per_conversion": float(avg_feet_per_conversion),
+            **{key: float(value) for key, value in stats.items()},
             "latest_conversion": {
-                "meters": float(latest_conversion.meters_value),
-                "feet": float(latest_conversion.feet_value),
-                "timestamp": latest_conversion.timestamp
-            } if latest_conversion else None,
+                "meters": float(latest_conversion["meters"]),
+                "feet": float(latest_conversion["feet"]),
+                "timestamp": latest_conversion["timestamp"]
+            },
             "user": request.user.username
-        }, status=status.HTTP_200_OK)
+        }
+        
+        if since or until:
+            response_data["window"] = {"since": since, "until": until}
+        
+        if bucket:
+            series = (
+                conversions
+                .order_by()
+                .annotate(bucket=STATS_BUCKETS[bucket]('timestamp'))
+                .values('bucket')
+                .annotate(
+                    count=Count('id'),
+                    total_meters=Sum('meters_value'),
+                    total_feet=Sum('feet_value'),
+                )
+            )
+            # Buckets are few, so order them here rather than adding a sort to the query plan
+            response_data["bucket"] = bucket
+            response_data["series"] = [
+                {
+                    "bucket": row['bucket'],
+                    "count": row['count'],
+                    "total_meters": float(row['total_meters']),
+                    "total_feet": float(row['total_feet']),
+                }
+                for row in sorted(series, key=lambda row: row['bucket'])
+            ]
+        
+        return Response(response_data, status=status.HTTP_200_OK)
         
     except Exception as e:
         return Response({
@@ -509,12 +1101,16 @@ def conversion_stats(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
+@authentication_classes([])
 @permission_classes([AllowAny])
 def health_check(request):
     """
     Simple health check endpoint
+
+    Connection pool, buffer, revocation filter and feed metrics are only
+    included for callers with metrics access (see HasMetricsAccess).
     """
-    return JsonResponse({
+    health = {
         "status": "ok",
         "host": request.get_host(),
         "secure": request.is_secure(),
@@ -522,4 +1118,23 @@ def health_check(request):
         "allowed_hosts": settings.ALLOWED_HOSTS,
         "path": request.path,
         "method": request.method,
-    })
+    }
+    if HasMetricsAccess().has_permission(request, None):
+        health.update({
+            "google_oauth_client": get_oauth_client().metrics(),
+            "conversion_buffer": get_conversion_buffer().metrics(),
+            "token_revocation": revocation_filter.metrics(),
+            "conversion_feed": feed.hub.metrics(),
+        })
+    return JsonResponse(health)
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([HasMetricsAccess])
+def metrics_view(request):
+    """
+    Request, database and Google call metrics in Prometheus text format.
+    Covers every worker process when METRICS_MULTIPROC_DIR is set.
+    Needs METRICS_TOKEN as a bearer token or an address in METRICS_ALLOWED_IPS.
+    """
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
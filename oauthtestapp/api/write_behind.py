@@ -0,0 +1,295 @@
+"""
+Write-behind persistence for new conversions.
+
+With CONVERSION_DURABILITY = 'buffered' a conversion is given its id and
+timestamp up front, returned to the client straight away and queued in an
+in-process buffer. A background thread bulk-inserts the buffer through
+Conversion.objects.record() whenever CONVERSION_BUFFER_FLUSH_SIZE rows are
+waiting or CONVERSION_BUFFER_FLUSH_INTERVAL seconds have passed, and the
+buffer is drained when the worker exits.
+
+The trade-off: rows still in the buffer are lost if the process dies
+without a clean shutdown, and history/stats only show a conversion once it
+has been flushed. The default 'sync' policy writes before responding.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, IntegrityError, connection, transaction
+
+from .models import Conversion
+from .oauth_client import LatencyRecorder
+
+SYNC = 'sync'
+BUFFERED = 'buffered'
+DURABILITY_POLICIES = (SYNC, BUFFERED)
+
+# Failed flushes the worker retries during shutdown before giving up and
+# leaving the rest to drain()
+MAX_DRAIN_ATTEMPTS = 3
+
+
+class ConversionIdAllocator:
+    """
+    Hands out Conversion primary keys before the rows are inserted.
+
+    Ids are reserved from the table's own sequence in blocks, so they never
+    collide with rows inserted directly and only one round trip is needed
+    per block.
+    """
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._ids = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supported():
+        return connection.vendor in ('postgresql', 'sqlite')
+
+    def allocate(self, count):
+        """Return a list of `count` unused ids."""
+        with self._lock:
+            if len(self._ids) < count:
+                self._ids.extend(self._reserve(max(self.block_size, count - len(self._ids))))
+            return [self._ids.popleft() for _ in range(count)]
+
+    def _reserve(self, count):
+        """Advance the table's id sequence by count and return the reserved ids."""
+        table = Conversion._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                    [table, count],
+                )
+                return [row[0] for row in cursor.fetchall()]
+
+            # SQLite: AUTOINCREMENT tables track the last used id in sqlite_sequence
+            cursor.execute(
+                f"UPDATE sqlite_sequence SET seq = MAX(seq, "
+                f"(SELECT COALESCE(MAX(id), 0) FROM {table})) + %s WHERE name = %s",
+                [count, table],
+            )
+            if not cursor.rowcount:
+                cursor.execute(
+                    f"INSERT INTO sqlite_sequence (name, seq) "
+                    f"SELECT %s, COALESCE(MAX(id), 0) + %s FROM {table}",
+                    [table, count],
+                )
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            last = cursor.fetchone()[0]
+            return range(last - count + 1, last + 1)
+
+
+class ConversionWriteBuffer:
+    """
+    In-process queue of conversions waiting to be inserted, with a
+    background flusher thread.
+    """
+
+    def __init__(self, flush_size, flush_interval, max_pending):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.ids = ConversionIdAllocator(block_size=flush_size)
+        self.pending = deque()
+        self.flush_latency = LatencyRecorder()
+        self.enqueued = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self.dropped = 0
+        self.sync_fallbacks = 0
+        self.max_depth = 0
+        self._flushing = 0  # rows taken off the queue but not yet committed
+        self._thread = None
+        self._stopping = False
+        self._flush_lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    def save(self, conversions):
+        """
+        Assign ids to conversions and queue them for insertion.
+        Falls back to a synchronous write when the buffer is full or the
+        database cannot reserve ids.
+        """
+        if (
+            self._stopping
+            or not self.ids.supported()
+            or len(self.pending) + len(conversions) > self.max_pending
+        ):
+            with self._cond:
+                self.sync_fallbacks += 1
+            return Conversion.objects.record(conversions)
+
+        for conversion, conversion_id in zip(conversions, self.ids.allocate(len(conversions))):
+            conversion.id = conversion_id
+
+        with self._cond:
+            self.pending.extend(conversions)
+            self.enqueued += len(conversions)
+            self.max_depth = max(self.max_depth, len(self.pending))
+            if len(self.pending) >= self.flush_size:
+                self._cond.notify()
+        self._ensure_flusher()
+        return conversions
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='conversion-write-behind', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        failures = 0
+        try:
+            while True:
+                with self._cond:
+                    if len(self.pending) < self.flush_size and not self._stopping:
+                        self._cond.wait(self.flush_interval)
+                    if self._stopping and (not self.pending or failures >= MAX_DRAIN_ATTEMPTS):
+                        return
+                if self.flush():
+                    failures = 0
+                else:
+                    # Database unavailable: back off before retrying, also
+                    # while stopping so an outage does not spin the CPU
+                    failures += 1
+                    time.sleep(self.flush_interval)
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        Insert everything currently queued, flush_size rows per INSERT.
+        Returns False if a batch could not be written and was requeued.
+        """
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    if not self.pending:
+                        return True
+                    batch = [self.pending.popleft() for _ in range(min(self.flush_size, len(self.pending)))]
+                    self._flushing = len(batch)
+                try:
+                    if not self._write(batch):
+                        return False
+                finally:
+                    self._flushing = 0
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            Conversion.objects.record(batch)
+        except (IntegrityError, ValueError):
+            # One bad row (e.g. its user was deleted meanwhile) must not block
+            # the rest of the batch
+            self.flush_errors += 1
+            for index, conversion in enumerate(batch):
+                try:
+                    Conversion.objects.record([conversion])
+                except (IntegrityError, ValueError):
+                    self.dropped += 1
+                except DatabaseError:
+                    return self._requeue(batch[index:], start)
+                else:
+                    self.flushed += 1
+        except DatabaseError:
+            return self._requeue(batch, start)
+        else:
+            self.flushed += len(batch)
+        self.flush_latency.record(time.perf_counter() - start)
+        return True
+
+    def _requeue(self, batch, start):
+        """Put an unwritten batch back at the front of the queue."""
+        self.flush_latency.record(time.perf_counter() - start, error=True)
+        self.flush_errors += 1
+        with self._cond:
+            self.pending.extendleft(reversed(batch))
+        # Drop a broken connection so the next attempt reconnects
+        connection.close_if_unusable_or_obsolete()
+        return False
+
+    def drain(self, timeout=None):
+        """
+        Stop the flusher and write out everything still queued.
+        Called at interpreter exit so a clean worker shutdown loses nothing.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def metrics(self):
+        """Return queue depth, throughput and flush latency metrics."""
+        return {
+            "durability": settings.CONVERSION_DURABILITY,
+            "queue_depth": len(self.pending) + self._flushing,
+            "max_queue_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "flush_errors": self.flush_errors,
+            "sync_fallbacks": self.sync_fallbacks,
+            "flush_latency": self.flush_latency.snapshot(),
+        }
+
+
+_buffer = None
+_buffer_pid = None
+_buffer_lock = threading.Lock()
+
+
+def get_conversion_buffer():
+    """
+    Return this process's ConversionWriteBuffer, creating it on first use.
+    A forked worker gets a fresh, empty buffer and its own flusher thread.
+    """
+    global _buffer, _buffer_pid
+    pid = os.getpid()
+    if _buffer is None or _buffer_pid != pid:
+        with _buffer_lock:
+            if _buffer is None or _buffer_pid != pid:
+                _buffer = ConversionWriteBuffer(
+                    flush_size=settings.CONVERSION_BUFFER_FLUSH_SIZE,
+                    flush_interval=settings.CONVERSION_BUFFER_FLUSH_INTERVAL,
+                    max_pending=settings.CONVERSION_BUFFER_MAX_PENDING,
+                )
+                _buffer_pid = pid
+                atexit.register(_buffer.drain, settings.CONVERSION_BUFFER_DRAIN_TIMEOUT)
+    return _buffer
+
+
+def save_conversions(conversions):
+    """
+    Persist new conversions according to CONVERSION_DURABILITY.
+    Returns the conversions with their ids set either way.
+    """
+    policy = settings.CONVERSION_DURABILITY
+    if policy not in DURABILITY_POLICIES:
+        raise ImproperlyConfigured(
+            f"CONVERSION_DURABILITY must be one of {', '.join(DURABILITY_POLICIES)}, got {policy!r}"
+        )
+    if policy == BUFFERED:
+        return get_conversion_buffer().save(conversions)
+    return Conversion.objects.record(conversions)
+
+
+async def asave_conversions(conversions):
+    """
+    Async version of save_conversions().
+    """
+    return await sync_to_async(save_conversions)(conversions)
@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for the ASGI production profile.
+
+Runs the ASGI application on uvicorn workers and switches the login and
+convert endpoints to their async implementations, so a worker keeps serving
+other requests while logins wait on Google.
+
+Usage (from the directory containing manage.py):
+    gunicorn -c python:oauthtestapp.gunicorn_asgi oauthtestapp.asgi:application
+"""
+import multiprocessing
+import os
+import tempfile
+
+# Settings are imported by the workers after this file runs in the master
+os.environ.setdefault('API_ASYNC_VIEWS', 'True')
+# Workers share their metrics through files, so /api/metrics/ covers all of them
+os.environ.setdefault('METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'oauthtestapp-metrics'))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+
+# Seconds a worker may be silent before it is restarted, and the grace period
+# for in-flight requests on shutdown
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = '-'
+
+
+def on_starting(server):
+    """Drop the per-worker metric files of a previous run."""
+    from api.metrics import clear_multiprocess_dir
+
+    if os.environ['METRICS_MULTIPROC_DIR']:
+        clear_multiprocess_dir(os.environ['METRICS_MULTIPROC_DIR'])
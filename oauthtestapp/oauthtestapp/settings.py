@@ -48,6 +48,87 @@ GOOGLE_OAUTH_CLIENT_SECRET = os.environ.get('GOOGLE_OAUTH_CLIENT_SECRET', '')
 # OAuth Redirect URI - Make this configurable
 GOOGLE_OAUTH_REDIRECT_URI = os.environ.get('GOOGLE_OAUTH_REDIRECT_URI', 'http://localhost:8000/api/auth/google/callback/')
 
+# Google endpoints: token exchange, userinfo (used to verify access tokens)
+# and the signing keys used to verify ID tokens offline
+GOOGLE_TOKEN_URL = os.environ.get('GOOGLE_TOKEN_URL', 'https://oauth2.googleapis.com/token')
+GOOGLE_USERINFO_URL = os.environ.get('GOOGLE_USERINFO_URL', 'https://www.googleapis.com/oauth2/v2/userinfo')
+GOOGLE_JWKS_URL = os.environ.get('GOOGLE_JWKS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+
+# Shared HTTP client for Google calls: timeouts in seconds, pool size per host,
+# retries for idempotent requests, and the circuit breaker (consecutive failures
+# before opening, seconds before a trial call is allowed again)
+GOOGLE_HTTP_CONNECT_TIMEOUT = float(os.environ.get('GOOGLE_HTTP_CONNECT_TIMEOUT', '3.05'))
+GOOGLE_HTTP_READ_TIMEOUT = float(os.environ.get('GOOGLE_HTTP_READ_TIMEOUT', '10'))
+GOOGLE_HTTP_POOL_SIZE = int(os.environ.get('GOOGLE_HTTP_POOL_SIZE', '10'))
+GOOGLE_HTTP_MAX_RETRIES = int(os.environ.get('GOOGLE_HTTP_MAX_RETRIES', '2'))
+GOOGLE_HTTP_BREAKER_THRESHOLD = int(os.environ.get('GOOGLE_HTTP_BREAKER_THRESHOLD', '5'))
+GOOGLE_HTTP_BREAKER_RESET_TIMEOUT = float(os.environ.get('GOOGLE_HTTP_BREAKER_RESET_TIMEOUT', '30'))
+
+# Cache verified userinfo per access token (keyed by a SHA-256 of the token).
+# Set the TTL to 0 to disable caching.
+GOOGLE_USERINFO_CACHE_TTL = int(os.environ.get('GOOGLE_USERINFO_CACHE_TTL', '300'))
+GOOGLE_USERINFO_CACHE_MAX_SIZE = int(os.environ.get('GOOGLE_USERINFO_CACHE_MAX_SIZE', '1024'))
+
+# Cache users resolved from JWT access tokens per process (api/authentication.py).
+# Saving or deleting a user invalidates its entry in the process that did it;
+# other workers pick the change up within the TTL. Set the TTL to 0 to disable.
+JWT_USER_CACHE_TTL = int(os.environ.get('JWT_USER_CACHE_TTL', '30'))
+JWT_USER_CACHE_MAX_SIZE = int(os.environ.get('JWT_USER_CACHE_MAX_SIZE', '4096'))
+
+# In-memory filter over the refresh token blacklist (api/tokens.py). Blacklist
+# rows are pulled every SYNC_INTERVAL seconds (0 checks the table on every
+# refresh) and the Bloom filter is rebuilt every REBUILD_INTERVAL seconds.
+JWT_REVOCATION_SYNC_INTERVAL = float(os.environ.get('JWT_REVOCATION_SYNC_INTERVAL', '5'))
+JWT_REVOCATION_REBUILD_INTERVAL = float(os.environ.get('JWT_REVOCATION_REBUILD_INTERVAL', '300'))
+JWT_REVOCATION_FILTER_CAPACITY = int(os.environ.get('JWT_REVOCATION_FILTER_CAPACITY', '100000'))
+JWT_REVOCATION_FILTER_ERROR_RATE = float(os.environ.get('JWT_REVOCATION_FILTER_ERROR_RATE', '0.001'))
+
+# Server-sent event feed of new conversions (api/feed.py): messages queued per
+# connection before it falls back to reading from the database, seconds
+# between keep-alive comments, and seconds between checks for conversions
+# saved by other worker processes (0 disables the check)
+CONVERSION_FEED_QUEUE_SIZE = int(os.environ.get('CONVERSION_FEED_QUEUE_SIZE', '256'))
+CONVERSION_FEED_HEARTBEAT_INTERVAL = float(os.environ.get('CONVERSION_FEED_HEARTBEAT_INTERVAL', '15'))
+CONVERSION_FEED_POLL_INTERVAL = float(os.environ.get('CONVERSION_FEED_POLL_INTERVAL', '2'))
+# Seconds a feed token (POST /api/conversions/feed/token/) can be used to
+# open the feed from a browser EventSource; an open stream is not cut off
+CONVERSION_FEED_TOKEN_LIFETIME = int(os.environ.get('CONVERSION_FEED_TOKEN_LIFETIME', '60'))
+
+# Directory where each worker process writes its metrics, so /api/metrics/
+# reports totals for all gunicorn workers. Leave empty for a single process.
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+# Who may read /api/metrics/ and the internal sections of /api/health/: a
+# bearer token, and/or client addresses (REMOTE_ADDR, comma-separated). With
+# neither set, /api/metrics/ returns 403 and /api/health/ leaves those out.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+# Serve the login and convert endpoints from their async implementations
+# (enabled by the ASGI production profile, oauthtestapp/gunicorn_asgi.py)
+API_ASYNC_VIEWS = os.environ.get('API_ASYNC_VIEWS', 'False').lower() == 'true'
+
+# Render and parse API JSON with orjson (api/renderers.py, api/parsers.py).
+# Output is byte-for-byte the same; without orjson installed this is a no-op.
+API_FAST_JSON = os.environ.get('API_FAST_JSON', 'False').lower() == 'true'
+
+# Conversion settings
+# Maximum number of values accepted by the batch conversion endpoint
+CONVERSION_BATCH_MAX_SIZE = int(os.environ.get('CONVERSION_BATCH_MAX_SIZE', '1000'))
+# Maximum number of float64 values accepted by the binary array endpoint
+CONVERSION_ARRAY_MAX_ELEMENTS = int(os.environ.get('CONVERSION_ARRAY_MAX_ELEMENTS', '10000000'))
+# 'sync' commits each conversion before responding; 'buffered' returns
+# immediately and bulk-inserts in the background (see api/write_behind.py)
+CONVERSION_DURABILITY = os.environ.get('CONVERSION_DURABILITY', 'sync')
+# Buffered mode: flush once this many rows are queued or this many seconds have passed
+CONVERSION_BUFFER_FLUSH_SIZE = int(os.environ.get('CONVERSION_BUFFER_FLUSH_SIZE', '500'))
+CONVERSION_BUFFER_FLUSH_INTERVAL = float(os.environ.get('CONVERSION_BUFFER_FLUSH_INTERVAL', '0.5'))
+# Buffered mode: beyond this many queued rows new conversions are written synchronously
+CONVERSION_BUFFER_MAX_PENDING = int(os.environ.get('CONVERSION_BUFFER_MAX_PENDING', '10000'))
+# Seconds to wait for the flusher on worker shutdown before draining inline
+CONVERSION_BUFFER_DRAIN_TIMEOUT = float(os.environ.get('CONVERSION_BUFFER_DRAIN_TIMEOUT', '10'))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -71,18 +152,29 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For serving static files
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # Session, CSRF, auth and messages are skipped on API_STATELESS_ROUTES (api/middleware.py)
+    'api.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'api.middleware.CsrfViewMiddleware',
+    'api.middleware.AuthenticationMiddleware',
+    'api.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
 ]
 
+# JWT-only path prefixes that need no session, CSRF cookie or session user.
+# The OAuth redirect flow (/api/auth/google/...) and the admin keep them.
+API_STATELESS_ROUTES = [
+    '/api/conversions/',
+    '/api/auth/profile/',
+    '/api/auth/token/refresh/',
+    '/api/metrics/',
+]
+
 ROOT_URLCONF = 'oauthtestapp.urls'
 
 TEMPLATES = [
@@ -155,13 +247,24 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
 
+if API_FAST_JSON:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ]
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -211,6 +314,10 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Covering-index columns (Index.include) only apply on PostgreSQL; the
+# development SQLite database simply ignores them.
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
 # Allauth Configuration
 SITE_ID = 1
 